@@ -0,0 +1,377 @@
+"""
+Streaming TTS-to-file audio pipeline
+====================================
+
+`LocalAudioPlayer._tts_response_to_buffer` joins the whole TTS response into
+one NumPy array before playback, and `Microphone.record` builds the whole
+recording in memory before turning it into a WAV. For hours of narration that
+is gigabytes of RAM and nothing usable until the very end.
+
+Here audio flows through in fixed-size frames:
+
+    audio.speech (pcm, 24 kHz int16 mono)  ->  PCMRingBuffer  ->  sink
+       HTTP chunks of any size                 20 ms frames       WAV file / raw PCM / pipe / speaker
+
+- `PCMRingBuffer` is a fixed bytearray. HTTP chunks rarely line up with
+  samples (a chunk can end halfway through an int16), so the ring carries the
+  remainder over and only whole frames come out
+- `WavSink` writes the header first and appends frames as they arrive; on
+  close it patches the sizes in (or, on a pipe, leaves the "unknown length"
+  sizes streaming players accept)
+- memory is ring + one HTTP chunk, whatever the length of the audio, and the
+  first frame is on disk right after the first chunk arrives
+
+Usage:
+    stream_speech(client, "narration.wav", text, voice="alloy")
+    narrate(client, "book.wav", very_long_text)        # splits at TTS input limit
+    python audio_pipeline.py                            # demo against a fake TTS endpoint
+"""
+
+import os
+import re
+import struct
+import sys
+import time
+
+SAMPLE_RATE = 24000   # what audio.speech returns for response_format="pcm"
+SAMPLE_WIDTH = 2      # int16
+CHANNELS = 1
+TTS_MAX_CHARS = 4096
+
+
+# =============================================================================
+# RING BUFFER
+# =============================================================================
+
+
+class PCMRingBuffer:
+    def __init__(self, frame_ms=20, capacity_frames=64, sample_rate=SAMPLE_RATE,
+                 sample_width=SAMPLE_WIDTH, channels=CHANNELS):
+        self.sample_bytes = sample_width * channels   # one sample of every channel
+        self.frame_bytes = sample_rate * frame_ms // 1000 * self.sample_bytes
+        self.capacity = self.frame_bytes * capacity_frames
+        self._buf = bytearray(self.capacity)
+        self._view = memoryview(self._buf)
+        self._read = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def write(self, data):
+        """Copy data in; returns how many bytes fitted (caller drains and retries)."""
+        n = min(len(data), self.capacity - self._size)
+        start = (self._read + self._size) % self.capacity
+        first = min(n, self.capacity - start)
+        self._view[start:start + first] = data[:first]
+        if n > first:
+            self._view[:n - first] = data[first:n]
+        self._size += n
+        return n
+
+    def frames(self, flush=False):
+        """Yield whole frames; with flush=True also the trailing partial frame."""
+        while self._size >= self.frame_bytes or (flush and self._size):
+            n = min(self.frame_bytes, self._size)
+            # Only whole samples leave the buffer
+            n -= n % self.sample_bytes if flush else 0
+            if n == 0:
+                self._size = 0
+                return
+            end = self._read + n
+            if end <= self.capacity:
+                frame = bytes(self._view[self._read:end])
+            else:
+                frame = bytes(self._view[self._read:]) + bytes(self._view[:end - self.capacity])
+            self._read = end % self.capacity
+            self._size -= n
+            yield frame
+
+    def feed(self, chunk):
+        """Write a chunk of any size, yielding frames as the ring fills."""
+        view = memoryview(chunk)
+        while view:
+            taken = self.write(view)
+            view = view[taken:]
+            yield from self.frames()
+
+
+# =============================================================================
+# SINKS
+# =============================================================================
+
+
+class WavSink:
+    """Incremental WAV writer for a path, an open binary file or a pipe (e.g. sys.stdout.buffer)."""
+
+    def __init__(self, target, sample_rate=SAMPLE_RATE, sample_width=SAMPLE_WIDTH, channels=CHANNELS):
+        self._own = isinstance(target, (str, os.PathLike))
+        self.file = open(target, "wb") if self._own else target
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.channels = channels
+        self.data_bytes = 0
+        try:
+            self.seekable = self.file.seekable()
+        except (AttributeError, OSError):
+            self.seekable = False
+        # 0xFFFFFFFF = "length unknown", understood by ffmpeg/sox/most players
+        self.file.write(self._header(0xFFFFFFFF - 36))
+
+    def _header(self, data_bytes):
+        byte_rate = self.sample_rate * self.channels * self.sample_width
+        return (
+            b"RIFF" + struct.pack("<I", min(0xFFFFFFFF, 36 + data_bytes)) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, self.channels, self.sample_rate,
+                                    byte_rate, self.channels * self.sample_width, self.sample_width * 8)
+            + b"data" + struct.pack("<I", min(0xFFFFFFFF, data_bytes))
+        )
+
+    def write(self, frame):
+        self.file.write(frame)
+        self.data_bytes += len(frame)
+
+    def close(self):
+        if self.seekable:
+            self.file.seek(0)
+            self.file.write(self._header(self.data_bytes))
+            self.file.seek(0, os.SEEK_END)
+        self.file.flush()
+        if self._own:
+            self.file.close()
+
+
+class RawPCMSink:
+    def __init__(self, target):
+        self._own = isinstance(target, (str, os.PathLike))
+        self.file = open(target, "wb") if self._own else target
+
+    def write(self, frame):
+        self.file.write(frame)
+
+    def close(self):
+        self.file.flush()
+        if self._own:
+            self.file.close()
+
+
+class SpeakerSink:
+    """Plays frames as they arrive (needs the optional `sounddevice` package)."""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+        import sounddevice as sd
+
+        self.stream = sd.RawOutputStream(samplerate=sample_rate, channels=channels, dtype="int16")
+        self.stream.start()
+
+    def write(self, frame):
+        self.stream.write(frame)
+
+    def close(self):
+        self.stream.stop()
+        self.stream.close()
+
+
+class TeeSink:
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, frame):
+        for sink in self.sinks:
+            sink.write(frame)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def _as_sink(dest):
+    if isinstance(dest, (WavSink, RawPCMSink, SpeakerSink, TeeSink)):
+        return dest
+    if isinstance(dest, (str, os.PathLike)) and not str(dest).endswith(".wav"):
+        return RawPCMSink(dest)
+    return WavSink(dest)
+
+
+# =============================================================================
+# PIPELINE
+# =============================================================================
+
+
+def pump(chunks, sink, ring=None, on_first_frame=None):
+    """Move byte chunks through the ring into the sink. Returns bytes written."""
+    ring = PCMRingBuffer() if ring is None else ring
+    written = 0
+    for chunk in chunks:
+        for frame in ring.feed(chunk):
+            if written == 0 and on_first_frame is not None:
+                on_first_frame()
+            sink.write(frame)
+            written += len(frame)
+    for frame in ring.frames(flush=True):
+        sink.write(frame)
+        written += len(frame)
+    return written
+
+
+async def apump(chunks, sink, ring=None, on_first_frame=None):
+    ring = PCMRingBuffer() if ring is None else ring
+    written = 0
+    async for chunk in chunks:
+        for frame in ring.feed(chunk):
+            if written == 0 and on_first_frame is not None:
+                on_first_frame()
+            sink.write(frame)
+            written += len(frame)
+    for frame in ring.frames(flush=True):
+        sink.write(frame)
+        written += len(frame)
+    return written
+
+
+def stream_speech(client, dest, text, voice="alloy", model="gpt-4o-mini-tts",
+                  chunk_size=8192, on_first_frame=None, sink=None, **kwargs):
+    """TTS straight into a WAV/PCM file, pipe or sink, in constant memory."""
+    own_sink = sink is None
+    sink = sink or _as_sink(dest)
+    try:
+        with client.audio.speech.with_streaming_response.create(
+            model=model, voice=voice, input=text, response_format="pcm", **kwargs
+        ) as response:
+            return pump(response.iter_bytes(chunk_size), sink, on_first_frame=on_first_frame)
+    finally:
+        if own_sink:
+            sink.close()
+
+
+async def astream_speech(client, dest, text, voice="alloy", model="gpt-4o-mini-tts",
+                         chunk_size=8192, on_first_frame=None, sink=None, **kwargs):
+    own_sink = sink is None
+    sink = sink or _as_sink(dest)
+    try:
+        async with client.audio.speech.with_streaming_response.create(
+            model=model, voice=voice, input=text, response_format="pcm", **kwargs
+        ) as response:
+            return await apump(response.iter_bytes(chunk_size), sink, on_first_frame=on_first_frame)
+    finally:
+        if own_sink:
+            sink.close()
+
+
+def split_for_tts(text, limit=TTS_MAX_CHARS):
+    """Split long text at paragraph, then sentence, boundaries into <= limit pieces."""
+    pieces = []
+    current = ""
+    for sentence in re.split(r"(?<=[.!?])\s+|\n{2,}", text):
+        if not sentence:
+            continue
+        if len(sentence) > limit:   # one enormous sentence: flush, then split between words
+            if current:
+                pieces.append(current)
+                current = ""
+            while len(sentence) > limit:
+                cut = max(sentence.rfind(" ", 0, limit + 1), sentence.rfind("\n", 0, limit + 1))
+                if cut <= 0:
+                    cut = limit   # a single word longer than the limit
+                pieces.append(sentence[:cut].rstrip())
+                sentence = sentence[cut:].lstrip()
+        if current and len(current) + len(sentence) + 1 > limit:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def narrate(client, dest, text, **kwargs):
+    """Long-form narration: one request per piece, all written into one file."""
+    sink = _as_sink(dest)
+    total = 0
+    try:
+        for piece in split_for_tts(text):
+            total += stream_speech(client, None, piece, sink=sink, **kwargs)
+    finally:
+        sink.close()
+    return total
+
+
+def record_microphone(dest, should_stop, sample_rate=SAMPLE_RATE, frame_ms=20):
+    """Microphone to WAV, written frame by frame (needs `sounddevice`)."""
+    import queue
+
+    import sounddevice as sd
+
+    frames = queue.Queue()
+    sink = _as_sink(dest)
+    blocksize = sample_rate * frame_ms // 1000
+
+    def callback(indata, frame_count, time_info, status):
+        frames.put(bytes(indata))
+
+    with sd.RawInputStream(samplerate=sample_rate, channels=CHANNELS, dtype="int16",
+                           blocksize=blocksize, callback=callback):
+        while not should_stop():
+            try:
+                sink.write(frames.get(timeout=0.1))
+            except queue.Empty:
+                pass
+    while not frames.empty():
+        sink.write(frames.get())
+    sink.close()
+
+
+# =============================================================================
+# DEMO: fake TTS endpoint, no sound device
+# =============================================================================
+
+
+def _fake_pcm(seconds, chunk_sizes=(7001, 8192, 333, 16385)):
+    """Sine-ish int16 PCM generated lazily in awkward chunk sizes."""
+    from array import array
+
+    period = array("h", (int(8000 * ((i % 100) / 50 - 1)) for i in range(100))).tobytes()
+    total = int(seconds * SAMPLE_RATE * SAMPLE_WIDTH)
+    block = period * 200
+    sent = 0
+    i = 0
+    while sent < total:
+        n = min(chunk_sizes[i % len(chunk_sizes)], total - sent)
+        offset = sent % len(period)
+        yield (block[offset:offset + n] if offset + n <= len(block) else (block * 2)[offset:offset + n])
+        sent += n
+        i += 1
+
+
+def _demo(seconds):
+    import resource
+    import tempfile
+    import wave
+
+    from openai import OpenAI
+
+    from stub_server import StubServer
+
+    def speech(req):
+        return 200, _fake_pcm(seconds), {"content-type": "application/octet-stream"}
+
+    with StubServer() as server, tempfile.TemporaryDirectory() as tmp:
+        server.route("POST", "/v1/audio/speech", speech)
+        client = OpenAI(base_url=server.base_url, api_key="stub")
+        path = os.path.join(tmp, "narration.wav")
+
+        start = time.perf_counter()
+        first = {}
+        written = stream_speech(client, path, "hello", on_first_frame=lambda: first.setdefault("t", time.perf_counter()))
+        elapsed = time.perf_counter() - start
+
+        with wave.open(path) as w:
+            duration = w.getnframes() / w.getframerate()
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{duration / 3600:.2f} h of audio ({written / 2**20:.0f} MB) in {elapsed:.1f}s")
+        print(f"first frame on disk after {(first['t'] - start) * 1000:.1f} ms, peak RSS {peak:.0f} MB")
+
+
+if __name__ == "__main__":
+    _demo(float(sys.argv[1]) if len(sys.argv) > 1 else 3600)
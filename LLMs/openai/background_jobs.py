@@ -0,0 +1,559 @@
+"""
+Background response manager
+===========================
+
+`responses.create(background=True)` returns at once with a `queued`
+response; what happens after that is up to us. One `retrieve()` loop per job
+with a fixed sleep spends most of its requests on "still in_progress", and a
+dropped `stream=True` connection used to mean starting the stream over.
+
+`BackgroundManager` tracks every submitted response in a local SQLite index
+(so a restarted process picks its jobs up again) and one scheduler for all
+of them decides how each job is watched:
+
+- watching: up to `max_watch` jobs at a time are followed over
+  `retrieve(stream=True)`; the terminal event arrives the moment the job
+  ends, for one request per job. When the connection drops, it reconnects
+  with `starting_after=<last sequence_number>` - no event is replayed.
+  Jobs are created with `stream=True` (the API only streams those again);
+  the creation stream is closed after its first event. A watch that keeps
+  failing backs off, and after `max_watch_failures` failures - or at once
+  on an error retrying won't fix - the job is polled instead
+- polling, for the jobs beyond that: a job is next polled after
+  `poll_fraction` of its current age (clamped to [min_interval,
+  max_interval]), so the completion is noticed within ~poll_fraction of the
+  runtime and a 30 min job costs a few dozen polls, not 1,800. The first
+  poll comes just before the fastest recent jobs finished. Polling is a
+  straight trade of requests against lag - a fixed 5 s loop polls about as
+  often on short jobs - so keep `max_watch` as high as connections allow
+- polls that are due together go out together, `concurrency` at a time
+- `events(job)` gives the caller the stream of a job, resumed the same way,
+  with a cursor of its own
+- completions come through `on_complete` callbacks, `await job`, or
+  `async for job in manager.completions()`
+
+Usage:
+    manager = BackgroundManager(AsyncOpenAI(), index="responses.db")
+    await manager.start()                        # reloads unfinished jobs
+    job = await manager.submit(model="o3", input=prompt, tag="report-42")
+    manager.on_complete(lambda job: print(job.id, job.status))
+    async for job in manager.completions():
+        print(job.tag, job.response.output_text)
+
+Run `python background_jobs.py` for the stub benchmark.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import sqlite3
+import time
+from collections import deque
+
+TERMINAL = ("completed", "failed", "cancelled", "incomplete")
+TERMINAL_EVENTS = ("response.completed", "response.failed", "response.incomplete", "response.cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    id            TEXT PRIMARY KEY,
+    tag           TEXT,
+    status        TEXT NOT NULL,              -- queued | in_progress | completed | failed | cancelled | incomplete | lost
+    submitted_at  REAL NOT NULL,
+    last_seq      INTEGER,                    -- last stream event seen, for resuming
+    finished_at   REAL,
+    result        TEXT
+);
+CREATE INDEX IF NOT EXISTS responses_open ON responses (status);
+"""
+
+
+def _transient(exc):
+    import httpx
+    import openai
+
+    # a stream that breaks mid-body raises httpx's error, not the SDK's
+    return isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError,
+                            httpx.TransportError))
+
+
+def _not_found(exc):
+    import openai
+
+    return isinstance(exc, openai.NotFoundError)
+
+
+def _dump(response):
+    return response.to_json(indent=None) if hasattr(response, "to_json") else json.dumps(response, default=str)
+
+
+class Job:
+    __slots__ = ("id", "tag", "status", "submitted_at", "last_seq", "response", "error",
+                 "finished_at", "notified_at", "polls", "failures", "watch_failures", "streaming", "future")
+
+    def __init__(self, id, tag, status, submitted_at, last_seq=None):
+        self.id = id
+        self.tag = tag
+        self.status = status
+        self.submitted_at = submitted_at   # wall clock, survives restarts
+        self.last_seq = last_seq
+        self.response = None
+        self.error = None
+        self.finished_at = None
+        self.notified_at = None
+        self.polls = 0
+        self.failures = 0
+        self.watch_failures = 0
+        self.streaming = False
+        self.future = asyncio.get_running_loop().create_future()
+
+    @property
+    def streamable(self):
+        # created with stream=True, so it has a sequence number to resume from
+        return self.last_seq is not None
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    def __await__(self):
+        return self.future.__await__()
+
+    def __repr__(self):
+        return f"Job({self.id!r}, {self.status}, tag={self.tag!r}, polls={self.polls})"
+
+
+# =============================================================================
+# MANAGER
+# =============================================================================
+
+
+class BackgroundManager:
+    def __init__(self, client, index=":memory:", max_watch=100, concurrency=32, min_interval=0.5,
+                 max_interval=30.0, poll_fraction=0.2, coalesce=0.05, max_watch_failures=3):
+        self.client = client
+        self.max_watch = max_watch
+        self.max_watch_failures = max_watch_failures   # then the job is polled for good
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.poll_fraction = poll_fraction
+        self.coalesce = coalesce              # polls due within this window go in the same batch
+        self.jobs = {}                        # id -> Job, unfinished and finished this run
+        self._heap = []                       # (due monotonic, n, id)
+        self._n = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._callbacks = []
+        self._completed = asyncio.Queue()
+        self._durations = deque(maxlen=200)   # runtimes of recent jobs, for the first poll
+        self._poller = None
+        self._tasks = set()
+        self._pending = 0
+        self._watching = 0
+        self._db = sqlite3.connect(index, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self.counters = {"create": 0, "retrieve": 0, "stream": 0, "resumed_streams": 0, "watched": 0,
+                         "transient_errors": 0, "watch_failures": 0, "completed": 0, "events": 0}
+
+    async def start(self):
+        """Start polling, picking up jobs left unfinished in the index."""
+        rows = self._db.execute(
+            "SELECT id, tag, status, submitted_at, last_seq FROM responses "
+            "WHERE status NOT IN ('completed', 'failed', 'cancelled', 'incomplete', 'lost')").fetchall()
+        for row in rows:
+            job = Job(*row)
+            self.jobs[job.id] = job
+            self._pending += 1
+            self._schedule(job, 0.0)
+        if self._poller is None:
+            self._poller = asyncio.ensure_future(self._poll_loop())
+        return len(rows)
+
+    # -------------------------------------------------------------------------
+    # submitting
+    # -------------------------------------------------------------------------
+
+    async def submit(self, tag=None, **params):
+        self.counters["create"] += 1
+        params.pop("stream", None)
+        stream = await self.client.responses.create(background=True, stream=True, **params)
+        try:
+            async for event in stream:   # response.created: all we need until the job is watched
+                break
+            else:
+                raise RuntimeError("responses.create(stream=True) ended before response.created")
+        finally:
+            await stream.close()
+        response = event.response
+        job = Job(response.id, tag, response.status, time.time(), event.sequence_number)
+        self.jobs[job.id] = job
+        self._pending += 1
+        self._db.execute("INSERT OR REPLACE INTO responses (id, tag, status, submitted_at, last_seq) "
+                         "VALUES (?, ?, ?, ?, ?)", (job.id, tag, job.status, job.submitted_at, job.last_seq))
+        if response.status in TERMINAL:
+            self._finish(job, response)
+        else:
+            self._schedule(job, self._first_delay())
+        return job
+
+    async def submit_many(self, requests, tag=None):
+        """Submit a list of responses.create kwargs, `concurrency` at a time."""
+        async def one(params):
+            async with self._semaphore:
+                return await self.submit(tag=tag, **params)
+
+        return await asyncio.gather(*(one(params) for params in requests))
+
+    async def cancel(self, job):
+        response = await self.client.responses.cancel(job.id)
+        self._finish(job, response)
+        return job
+
+    def on_complete(self, callback):
+        self._callbacks.append(callback)
+        return callback
+
+    # -------------------------------------------------------------------------
+    # polling
+    # -------------------------------------------------------------------------
+
+    def _first_delay(self):
+        if len(self._durations) < 10:
+            return self.min_interval
+        fastest = sorted(self._durations)[len(self._durations) // 20]   # ~5th percentile
+        return min(self.max_interval, max(self.min_interval, fastest))
+
+    def _next_delay(self, job):
+        age = time.time() - job.submitted_at
+        delay = min(self.max_interval, max(self.min_interval, age * self.poll_fraction))
+        return min(self.max_interval, delay * 2 ** job.failures)
+
+    def _schedule(self, job, delay):
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._n), job.id))
+        if self._heap[0][2] == job.id:
+            self._wakeup.set()
+
+    async def _poll_loop(self):
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            delay = self._heap[0][0] - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            horizon = time.monotonic() + self.coalesce
+            while self._heap and self._heap[0][0] <= horizon:
+                _, _, job_id = heapq.heappop(self._heap)
+                job = self.jobs.get(job_id)
+                if job is None or job.done or job.streaming:
+                    continue   # finished meanwhile, or a stream is watching it
+                if (self._watching < self.max_watch and job.streamable
+                        and job.watch_failures < self.max_watch_failures):
+                    self._watching += 1   # taken here, so one batch can't overshoot max_watch
+                    task = asyncio.ensure_future(self._watch(job))
+                else:
+                    task = asyncio.ensure_future(self._poll(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _poll(self, job):
+        async with self._semaphore:
+            if job.done or job.streaming:
+                return
+            self.counters["retrieve"] += 1
+            job.polls += 1
+            try:
+                response = await self.client.responses.retrieve(job.id)
+            except Exception as exc:
+                if not _transient(exc):
+                    self._finish(job, None, status="lost" if _not_found(exc) else "failed", error=exc)
+                    return
+                self.counters["transient_errors"] += 1
+                job.failures += 1
+                self._schedule(job, self._next_delay(job))
+                return
+        job.failures = 0
+        if response.status in TERMINAL:
+            self._finish(job, response)
+            return
+        if response.status != job.status:
+            job.status = response.status
+            self._db.execute("UPDATE responses SET status = ? WHERE id = ?", (job.status, job.id))
+        self._schedule(job, self._next_delay(job))
+
+    async def _watch(self, job):
+        self.counters["watched"] += 1
+        job.streaming = True
+        try:
+            async for event in self.events(job, starting_after=job.last_seq):
+                seq = getattr(event, "sequence_number", None)
+                if seq is not None:
+                    job.last_seq = seq
+                job.watch_failures = 0
+        except Exception as exc:
+            if _not_found(exc):
+                self._finish(job, None, status="lost", error=exc)
+            elif not _transient(exc):
+                job.watch_failures = self.max_watch_failures   # a 400/401 won't go away: poll instead
+        finally:
+            job.streaming = False
+            self._watching -= 1
+            if not job.done:
+                # the stream failed or kept ending early: back off, then poll
+                self.counters["watch_failures"] += 1
+                job.watch_failures += 1
+                delay = min(self.max_interval, self.min_interval * 2 ** job.watch_failures)
+                self._db.execute("UPDATE responses SET last_seq = ? WHERE id = ?", (job.last_seq, job.id))
+                self._schedule(job, delay)
+
+    # -------------------------------------------------------------------------
+    # streaming
+    # -------------------------------------------------------------------------
+
+    async def events(self, job, starting_after=None, max_resumes=20):
+        """
+        Stream events of a background job, from the start or after
+        `starting_after`. Each call keeps its own cursor, so it sees every
+        event whether or not the manager is watching the job too. Drops are
+        resumed with `starting_after`, at most `max_resumes` times, after
+        which a transport error is raised and a stream that keeps ending
+        early just ends. The job completes through the usual channels when
+        its terminal event arrives.
+        """
+        last_seq = starting_after
+        resumes = 0
+        while True:   # until a terminal event: a job the watcher finished still replays its stream
+            kwargs = {} if last_seq is None else {"starting_after": last_seq}
+            self.counters["stream"] += 1
+            try:
+                stream = await self.client.responses.retrieve(job.id, stream=True, **kwargs)
+                async for event in stream:
+                    seq = getattr(event, "sequence_number", None)
+                    if seq is not None:
+                        if last_seq is not None and seq <= last_seq:
+                            continue   # already delivered before the drop
+                        last_seq = seq
+                    self.counters["events"] += 1
+                    yield event
+                    if event.type in TERMINAL_EVENTS:
+                        self._finish(job, event.response)
+                        return
+            except Exception as exc:
+                if not _transient(exc) or resumes >= max_resumes:
+                    raise
+            # dropped, or ended without a terminal event: pick up where we were
+            if resumes >= max_resumes:
+                return
+            resumes += 1
+            self.counters["resumed_streams"] += 1
+            await asyncio.sleep(min(self.max_interval, 0.05 * 2 ** min(resumes, 8)))
+
+    # -------------------------------------------------------------------------
+    # completion
+    # -------------------------------------------------------------------------
+
+    def _finish(self, job, response, status=None, error=None):
+        if job.done:
+            return
+        job.response = response
+        job.status = status or response.status
+        job.error = error
+        job.finished_at = time.time()
+        self._pending -= 1
+        self._durations.append(job.finished_at - job.submitted_at)
+        self.counters["completed"] += 1
+        self._db.execute("UPDATE responses SET status = ?, finished_at = ?, last_seq = ?, result = ? WHERE id = ?",
+                         (job.status, job.finished_at, job.last_seq,
+                          _dump(response) if response is not None else None, job.id))
+        job.notified_at = time.time()
+        job.future.set_result(job)
+        self._completed.put_nowait(job)
+        loop = asyncio.get_running_loop()
+        for callback in self._callbacks:
+            loop.call_soon(callback, job)   # errors go to the loop's exception handler
+
+    def pending(self):
+        return self._pending
+
+    async def completions(self, until_idle=True):
+        """Finished jobs as they come in; with until_idle, stops once nothing is pending."""
+        while True:
+            if until_idle and self._completed.empty() and not self.pending():
+                return
+            yield await self._completed.get()
+
+    def stats(self):
+        c = self.counters
+        requests = c["create"] + c["retrieve"] + c["stream"]
+        return dict(c, pending=self.pending(), watching=self._watching, requests=requests,
+                    requests_per_job=requests / c["completed"] if c["completed"] else 0.0)
+
+    async def aclose(self):
+        tasks = list(self._tasks)
+        if self._poller is not None:
+            tasks.append(self._poller)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._db.close()
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+# Stub: each background job runs 2-30 s (log-uniform) and emits about one
+# event per second. 30% of streams are dropped after a random number of events.
+
+
+class _StubJobs:
+    def __init__(self, drop_rate=0.3, seed=5):
+        import random
+        import threading
+
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.jobs = {}            # id -> (started monotonic, duration)
+        self.events_sent = 0
+        self.drop_rate = drop_rate
+
+    def create(self, req):
+        import math
+
+        from stub_server import fake_response, sse_event
+
+        body = req.json()
+        with self.lock:
+            duration = math.exp(self.rng.uniform(math.log(2), math.log(30)))
+            response = fake_response("", model=body.get("model", "gpt-4o-mini"), status="queued",
+                                     output=[], background=True)
+            self.jobs[response["id"]] = (time.monotonic(), duration)
+        if not body.get("stream"):
+            return 200, response
+        created = sse_event({"type": "response.created", "sequence_number": 0, "response": response},
+                            event="response.created")
+        return 200, iter([created]), {"content-type": "text/event-stream"}
+
+    def finished_at(self, response_id):
+        started, duration = self.jobs[response_id]
+        return started + duration
+
+    def _events(self, response_id):
+        from stub_server import fake_response
+
+        started, duration = self.jobs[response_id]
+        n = max(2, int(duration))
+        created = fake_response("", response_id=response_id, status="queued", output=[], background=True)
+        events = [(started, {"type": "response.created", "response": created}),
+                  (started, {"type": "response.in_progress"})]
+        for i in range(n):
+            events.append((started + duration * (i + 1) / (n + 1), {"type": "response.output_text.delta",
+                                                                   "item_id": "msg_1", "output_index": 0,
+                                                                   "content_index": 0, "delta": f"w{i} "}))
+        done = fake_response(f"report {response_id}", response_id=response_id, background=True)
+        events.append((started + duration, {"type": "response.completed", "response": done}))
+        return events
+
+    def retrieve(self, req):
+        from stub_server import fake_response, sse_event
+
+        response_id = req.path.rsplit("/", 1)[-1]
+        if response_id not in self.jobs:
+            return 404, {"error": {"message": "not found", "type": "invalid_request_error"}}
+        if req.query.get("stream", ["false"])[0] != "true":
+            if time.monotonic() >= self.finished_at(response_id):
+                return 200, fake_response(f"report {response_id}", response_id=response_id, background=True)
+            return 200, fake_response("", response_id=response_id, status="in_progress", output=[], background=True)
+
+        after = int(req.query.get("starting_after", ["-1"])[0])
+        with self.lock:
+            drop_after = self.rng.randrange(2, 10) if self.rng.random() < self.drop_rate else None
+
+        def frames():
+            for seq, (at, event) in enumerate(self._events(response_id)):
+                if seq <= after:
+                    continue
+                if drop_after is not None and seq > after + drop_after:
+                    raise ConnectionError("stub drops the stream")
+                delay = at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                with self.lock:
+                    self.events_sent += 1
+                yield sse_event(dict(event, sequence_number=seq), event=event["type"])
+
+        return 200, frames(), {"content-type": "text/event-stream"}
+
+
+async def _bench(n_jobs=200, n_streamed=40):
+    from openai import AsyncOpenAI
+
+    from prompt_eval import percentile
+    from stub_server import StubServer
+
+    def report(label, requests, lag):
+        print(f"{label:<30} {requests / n_jobs:5.1f} requests/job   notification lag p50 "
+              f"{percentile(lag, 50) * 1000:5.0f} ms  p99 {percentile(lag, 99) * 1000:5.0f} ms")
+
+    print(f"{n_jobs} background jobs of 2-30 s")
+    with StubServer() as server:
+        stub = _StubJobs()
+        server.route("POST", "/v1/responses", stub.create)
+        server.route("GET", "/v1/responses/*", stub.retrieve)
+        client = AsyncOpenAI(base_url=server.base_url, api_key="stub", max_retries=2)
+
+        # before: one retrieve loop per job with a fixed sleep
+        for interval in (1.0, 5.0):
+            lag = []
+            requests = [0]
+
+            async def naive(i):
+                response = await client.responses.create(model="o3", input=f"job {i}", background=True)
+                requests[0] += 1
+                while response.status not in TERMINAL:
+                    await asyncio.sleep(interval)
+                    response = await client.responses.retrieve(response.id)
+                    requests[0] += 1
+                lag.append(time.monotonic() - stub.finished_at(response.id))
+
+            await asyncio.gather(*(naive(i) for i in range(n_jobs)))
+            report(f"retrieve loop, every {interval:.0f} s", requests[0], lag)
+
+        for max_watch in (0, n_jobs // 4, n_jobs):
+            manager = BackgroundManager(client, max_watch=max_watch)
+            await manager.start()
+            await manager.submit_many([{"model": "o3", "input": f"job {i}"} for i in range(n_jobs)])
+            lag = []
+            async for job in manager.completions():
+                lag.append(time.monotonic() - stub.finished_at(job.id))
+            report(f"manager, max_watch={max_watch}", manager.stats()["requests"], lag)
+            await manager.aclose()
+
+        # caller-facing streams with drops: resumed from the last sequence number
+        manager = BackgroundManager(client, max_watch=0)
+        await manager.start()
+        jobs = await manager.submit_many([{"model": "o3", "input": f"streamed {i}"} for i in range(n_streamed)])
+        sent_before = stub.events_sent
+
+        async def consume(job):
+            return [event.sequence_number async for event in manager.events(job)]
+
+        received = await asyncio.gather(*(consume(job) for job in jobs))
+        delivered = sum(map(len, received))
+        in_order = all(seqs == sorted(set(seqs)) for seqs in received)
+        print(f"{n_streamed} streamed jobs: {manager.stats()['resumed_streams']} drops resumed, {delivered} events "
+              f"delivered, {stub.events_sent - sent_before - delivered} sent twice, in order: {in_order}")
+        await manager.aclose()
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_bench())
@@ -0,0 +1,35 @@
+"""
+Statistical benchmark suite
+===========================
+
+The comprehensions demo (python/06_comprehensions/code/basic.py) times each
+variant once with `timeit.timeit(..., number=1000)`, and runs of it differ
+from each other by more than the effects it measures. This suite measures
+the same comparison, plus the hot paths of a request, in a way that can gate
+a change:
+
+- warmup samples, then a loop count calibrated per benchmark
+- several fresh processes x several samples each
+- median / IQR (robust to the slow tail) and tracemalloc peak memory
+- JSON result files, and `compare`, which flags a change only when it is both
+  larger than a threshold and statistically significant (Mann-Whitney U)
+
+Usage (from LLMs/openai):
+    python -m benchsuite list
+    python -m benchsuite run -o base.json
+    python -m benchsuite run -o new.json -k sse -k response
+    python -m benchsuite compare base.json new.json      # exit code 1 on regression
+
+Adding a benchmark:
+    from benchsuite import benchmark
+
+    @benchmark("group.name")
+    def _():
+        data = build_input()          # not timed
+        return lambda: work(data)     # timed
+"""
+
+from .runner import benchmark, compare, load, registered, run_suite, save
+from .stats import mann_whitney_u, summarize
+
+__all__ = ["benchmark", "compare", "load", "registered", "run_suite", "save", "mann_whitney_u", "summarize"]
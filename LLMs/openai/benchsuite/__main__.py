@@ -0,0 +1,86 @@
+import argparse
+import sys
+
+from .runner import compare, format_time, load, registered, run_suite, save
+
+
+def _select(patterns):
+    names = sorted(registered())
+    if patterns:
+        names = [n for n in names if any(p in n for p in patterns)]
+    return names
+
+
+def _cmd_list(args):
+    for name in _select(args.k):
+        print(name)
+
+
+def _cmd_run(args):
+    names = _select(args.k)
+    if not names:
+        sys.exit("no benchmarks selected")
+    results = run_suite(
+        names, processes=args.processes, samples=args.samples, warmup=args.warmup,
+        min_time=args.min_time, memory=not args.no_memory,
+        progress=lambda done, total: print(f"process {done}/{total} done", file=sys.stderr),
+    )
+    print(f"{'benchmark':<30} {'median':>10} {'IQR':>10} {'loops':>8} {'peak mem':>10}")
+    for name, data in results["benchmarks"].items():
+        if "skipped" in data:
+            print(f"{name:<30} skipped: {data['skipped']}")
+            continue
+        print(f"{name:<30} {format_time(data['median']):>10} {format_time(data['iqr']):>10} "
+              f"{data['loops']:8d} {data['peak_bytes'] / 1024:8.1f} KB")
+    if args.output:
+        save(results, args.output)
+        print(f"\nsaved to {args.output}")
+
+
+def _cmd_compare(args):
+    rows = compare(load(args.base), load(args.new), threshold=args.threshold, alpha=args.alpha)
+    print(f"{'benchmark':<30} {'base':>10} {'new':>10} {'change':>8} {'p':>8}  verdict")
+    regressions = 0
+    for row in rows:
+        if row["verdict"] == "missing":
+            print(f"{row['name']:<30} {'-':>10} {'-':>10} {'-':>8} {'-':>8}  missing in one run")
+            continue
+        print(f"{row['name']:<30} {format_time(row['base']):>10} {format_time(row['new']):>10} "
+              f"{(row['ratio'] - 1) * 100:+7.1f}% {row['p_value']:8.4f}  {row['verdict']}")
+        regressions += row["verdict"] == "REGRESSION"
+    if regressions:
+        print(f"\n{regressions} significant regression(s)")
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchsuite", description="Statistical benchmark suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("list", help="list benchmarks")
+    p.add_argument("-k", action="append", help="only names containing this (repeatable)")
+    p.set_defaults(fn=_cmd_list)
+
+    p = sub.add_parser("run", help="run benchmarks")
+    p.add_argument("-k", action="append", help="only names containing this (repeatable)")
+    p.add_argument("-o", "--output", help="write results JSON here")
+    p.add_argument("--processes", type=int, default=3)
+    p.add_argument("--samples", type=int, default=10, help="timed samples per process")
+    p.add_argument("--warmup", type=int, default=2)
+    p.add_argument("--min-time", type=float, default=0.05, help="seconds per sample, for calibration")
+    p.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    p.set_defaults(fn=_cmd_run)
+
+    p = sub.add_parser("compare", help="compare two result files")
+    p.add_argument("base")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=0.05, help="minimum relative change of the median")
+    p.add_argument("--alpha", type=float, default=0.01, help="significance level")
+    p.set_defaults(fn=_cmd_compare)
+
+    args = parser.parse_args(argv)
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
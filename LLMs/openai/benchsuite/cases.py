@@ -0,0 +1,197 @@
+"""
+Built-in benchmarks: the comprehensions comparison from
+python/06_comprehensions/code/basic.py, plus the hot paths of a request -
+prompt rendering, request transforms, SSE decoding, response parsing and
+embeddings decoding.
+"""
+
+import base64
+import json
+import os
+from array import array
+
+from .runner import benchmark
+
+# =============================================================================
+# COMPREHENSIONS (python/06_comprehensions/code/basic.py, section 6)
+# =============================================================================
+
+
+@benchmark("comprehensions.loop")
+def _():
+    def traditional_loop():
+        result = []
+        for i in range(1000):
+            result.append(i**2)
+        return result
+
+    return traditional_loop
+
+
+@benchmark("comprehensions.list")
+def _():
+    return lambda: [i**2 for i in range(1000)]
+
+
+@benchmark("comprehensions.generator")
+def _():
+    # basic.py only timed creating the generator; consume it for a fair comparison
+    return lambda: sum(i**2 for i in range(1000))
+
+
+# =============================================================================
+# PROMPT RENDERING
+# =============================================================================
+
+
+def _conversation(turns=20):
+    persona = "You are a helpful assistant. Follow the style guide carefully. " * 20
+    items = []
+    for i in range(turns):
+        items.append({"role": "user", "content": f"question {i}: how do generators save memory?"})
+        items.append({"role": "assistant", "content": [{"type": "output_text", "text": "They yield lazily. " * 10}]})
+    return {"model": "gpt-4o-mini", "instructions": persona, "input": items}
+
+
+@benchmark("prompt.render")
+def _():
+    from prefix_scheduler import render_prompt
+
+    params = _conversation()
+    return lambda: render_prompt(params)
+
+
+@benchmark("prompt.block_hashes")
+def _():
+    from prefix_scheduler import block_hashes, render_prompt
+
+    text = render_prompt(_conversation())
+    return lambda: block_hashes(text, 512)
+
+
+@benchmark("prompt.few_shot")
+def _():
+    from prompt_eval import few_shot
+
+    case = {"input": "A train leaves at 3pm and travels 120 km at 60 km/h. When does it arrive?"}
+    return lambda: few_shot(case)
+
+
+@benchmark("prompt.count_tokens")
+def _():
+    from tokenizer import BPETokenizer, train_ranks
+    from prefix_scheduler import render_prompt
+
+    notes = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "..", "notes.md")
+    with open(notes, encoding="utf-8") as f:
+        tok = BPETokenizer(train_ranks(f.read()[:20_000], vocab_size=500))
+    text = render_prompt(_conversation())
+    tok.count_tokens(text)   # warm the piece cache, like a long-running process
+    return lambda: tok.count_tokens(text)
+
+
+# =============================================================================
+# REQUEST TRANSFORMS (openai SDK)
+# =============================================================================
+
+
+@benchmark("transform.responses_create")
+def _():
+    from openai._utils._transform import maybe_transform
+    from openai.types.responses import response_create_params
+
+    params = dict(_conversation(), tools=[{
+        "type": "function",
+        "name": "get_weather",
+        "parameters": {"type": "object", "properties": {"city": {"type": "string"}}},
+        "strict": True,
+    }], metadata={"tenant": "acme"}, temperature=0.2)
+    return lambda: maybe_transform(params, response_create_params.ResponseCreateParamsNonStreaming)
+
+
+# =============================================================================
+# SSE DECODING (openai SDK)
+# =============================================================================
+
+
+def _sse_payload(n_events=500):
+    from stub_server import sse_event
+
+    frames = [sse_event({"type": "response.output_text.delta", "item_id": "msg_1", "output_index": 0,
+                         "content_index": 0, "delta": f"token{i} ", "sequence_number": i},
+                        event="response.output_text.delta") for i in range(n_events)]
+    body = b"".join(frames)
+    # Network-sized chunks that cut frames at arbitrary points
+    return [body[i:i + 1400] for i in range(0, len(body), 1400)]
+
+
+@benchmark("sse.decode")
+def _():
+    from openai._streaming import SSEDecoder
+
+    chunks = _sse_payload()
+    return lambda: sum(1 for _ in SSEDecoder().iter_bytes(iter(chunks)))
+
+
+@benchmark("sse.decode_json")
+def _():
+    from openai._streaming import SSEDecoder
+
+    chunks = _sse_payload()
+    return lambda: [event.json() for event in SSEDecoder().iter_bytes(iter(chunks))]
+
+
+# =============================================================================
+# RESPONSE PARSING (openai SDK)
+# =============================================================================
+
+
+def _response_payload():
+    from stub_server import fake_response
+
+    return fake_response("Generators produce values lazily. " * 40, input_tokens=900, cached_tokens=512)
+
+
+@benchmark("response.construct")
+def _():
+    from openai._models import construct_type
+    from openai.types.responses import Response
+
+    payload = _response_payload()
+    return lambda: construct_type(type_=Response, value=payload)   # what the client does per response
+
+
+@benchmark("response.validate")
+def _():
+    from openai.types.responses import Response
+
+    payload = _response_payload()
+    return lambda: Response.model_validate(payload)
+
+
+@benchmark("response.json_loads")
+def _():
+    body = json.dumps(_response_payload()).encode("utf-8")
+    return lambda: json.loads(body)
+
+
+# =============================================================================
+# EMBEDDINGS DECODING
+# =============================================================================
+
+
+def _embedding_vectors(n=64, dims=1536):
+    return [[(i * dims + j) % 997 / 997 for j in range(dims)] for i in range(n)]
+
+
+@benchmark("embeddings.base64")
+def _():
+    # encoding_format="base64" decoded without numpy, as the SDK falls back to
+    encoded = [base64.b64encode(array("f", v).tobytes()).decode("ascii") for v in _embedding_vectors()]
+    return lambda: [array("f", base64.b64decode(e)).tolist() for e in encoded]
+
+
+@benchmark("embeddings.float_json")
+def _():
+    body = json.dumps({"data": [{"embedding": v} for v in _embedding_vectors()]}).encode("utf-8")
+    return lambda: [item["embedding"] for item in json.loads(body)["data"]]
@@ -0,0 +1,196 @@
+"""
+Registry, timing loop and result files.
+
+A benchmark is a setup function that returns the callable to time; setup
+work is never timed. Setups that need an optional package raise ImportError
+and are reported as skipped.
+
+Each run:
+1. calibrates a loop count so one sample takes at least `min_time`
+   (done once, in the first process, and reused so samples are comparable)
+2. runs `warmup` untimed samples, then `samples` timed ones
+3. measures peak memory of one call under tracemalloc, separately, since
+   tracing slows the timed loop down
+4. repeats 1-3 in `processes` fresh interpreters, so hash seeds, allocator
+   state and memory layout vary between runs instead of biasing all samples
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from .stats import mann_whitney_u, summarize
+
+_REGISTRY = {}
+
+
+def benchmark(name):
+    def register(setup):
+        _REGISTRY[name] = setup
+        return setup
+
+    return register
+
+
+def registered():
+    from . import cases  # noqa: F401  (registers the built-in benchmarks)
+
+    return dict(_REGISTRY)
+
+
+# =============================================================================
+# TIMING (runs inside a worker process)
+# =============================================================================
+
+
+def _time(fn, loops):
+    timer = time.perf_counter
+    start = timer()
+    for _ in range(loops):
+        fn()
+    return timer() - start
+
+
+def calibrate(fn, min_time=0.05):
+    """Smallest loop count in 1, 2, 5, 10, 20, 50, ... whose sample takes >= min_time."""
+    loops = 1
+    while True:
+        for factor in (1, 2, 5):
+            number = loops * factor
+            if _time(fn, number) >= min_time:
+                return number
+        loops *= 10
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        return max(0, tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+
+def _run_process(names, loops, samples, warmup, min_time, memory):
+    setups = registered()
+    out = {}
+    for name in names:
+        try:
+            fn = setups[name]()
+        except ImportError as exc:
+            out[name] = {"skipped": str(exc)}
+            continue
+        n = loops.get(name) or calibrate(fn, min_time)
+        for _ in range(warmup):
+            _time(fn, n)
+        times = [_time(fn, n) / n for _ in range(samples)]
+        out[name] = {"loops": n, "samples": times}
+        if memory:
+            out[name]["peak_bytes"] = peak_memory(fn)
+    return out
+
+
+# =============================================================================
+# SUITE
+# =============================================================================
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_suite(names=None, processes=3, samples=10, warmup=2, min_time=0.05, memory=True, progress=None):
+    names = names or sorted(registered())
+    context = multiprocessing.get_context("spawn")
+    loops = {}
+    merged = {name: {"samples": [], "peak_bytes": 0} for name in names}
+    for run in range(processes):
+        with context.Pool(1) as pool:
+            result = pool.apply(_run_process, (names, loops, samples, warmup, min_time, memory))
+        for name, data in result.items():
+            if "skipped" in data:
+                merged[name] = data
+                continue
+            loops[name] = data["loops"]
+            merged[name]["loops"] = data["loops"]
+            merged[name]["samples"].extend(data["samples"])
+            merged[name]["peak_bytes"] = max(merged[name]["peak_bytes"], data.get("peak_bytes", 0))
+        if progress:
+            progress(run + 1, processes)
+
+    for data in merged.values():
+        if "skipped" not in data:
+            data.update(summarize(data["samples"]))
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "commit": _git_commit(),
+            "processes": processes,
+            "samples": samples,
+            "warmup": warmup,
+        },
+        "benchmarks": merged,
+    }
+
+
+def save(results, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# =============================================================================
+# COMPARE
+# =============================================================================
+
+
+def compare(base, new, threshold=0.05, alpha=0.01):
+    """
+    Rows of {name, base, new, ratio, p_value, verdict}. A change is only called
+    a regression/improvement when it is both larger than `threshold` (relative
+    median change) and significant at `alpha` (Mann-Whitney U on the samples).
+    """
+    rows = []
+    base_b, new_b = base["benchmarks"], new["benchmarks"]
+    for name in sorted(set(base_b) | set(new_b)):
+        a, b = base_b.get(name), new_b.get(name)
+        if not a or not b or "skipped" in a or "skipped" in b:
+            rows.append({"name": name, "verdict": "missing"})
+            continue
+        ratio = b["median"] / a["median"] if a["median"] else float("inf")
+        p_value = mann_whitney_u(a["samples"], b["samples"])
+        verdict = "same"
+        if p_value < alpha and ratio > 1 + threshold:
+            verdict = "REGRESSION"
+        elif p_value < alpha and ratio < 1 - threshold:
+            verdict = "improved"
+        rows.append({"name": name, "base": a["median"], "new": b["median"], "ratio": ratio,
+                     "p_value": p_value, "verdict": verdict,
+                     "base_peak": a.get("peak_bytes", 0), "new_peak": b.get("peak_bytes", 0)})
+    return rows
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
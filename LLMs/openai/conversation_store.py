@@ -0,0 +1,321 @@
+"""
+Local conversation store
+========================
+
+`client.conversations.items.list()` is the only way to read a conversation
+back, and the chat UI re-lists the full history on every page load.
+
+This keeps a local copy per conversation and only asks the API for what is new:
+
+    <root>/<conversation_id>/log     records: 4-byte length + compact JSON item
+    <root>/<conversation_id>/index   8-byte offset of every record in `log`
+
+- `sync()` lists items `after` the id of the last stored item (ascending) and
+  appends them - a page load costs one small request instead of the history
+- `recent(n)` / `window(start, stop)` read the index and the log through
+  mmap, so loading the last n items costs O(n) no matter how long the
+  conversation is
+- both files are append-only; the log is written before the index, so a
+  crash mid-append leaves at most unreferenced bytes at the end of the log
+  and a torn offset at the end of the index, which the next append cuts off
+
+Usage:
+    store = ConversationStore("conversations/")
+    store.sync(client, "conv_123")
+    messages = store.recent("conv_123", 50)
+
+Run `python conversation_store.py --conversations 10000 --items 1000` for the
+history-load benchmark.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import shutil
+import struct
+import time
+from collections import OrderedDict
+
+_LEN = struct.Struct("<I")
+_OFFSET = struct.Struct("<Q")
+
+
+class _Mapped:
+    """mmaps of one conversation's files, remapped when the files grow."""
+
+    def __init__(self, directory):
+        self.log_path = os.path.join(directory, "log")
+        self.index_path = os.path.join(directory, "index")
+        self.log = None
+        self.index = None
+        self.log_size = 0
+        self.index_size = 0
+
+    def refresh(self):
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        index_size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        index_size -= index_size % _OFFSET.size   # ignore a torn last offset
+        if log_size != self.log_size or index_size != self.index_size:
+            self.close()
+            if index_size:
+                with open(self.log_path, "rb") as f:
+                    self.log = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                with open(self.index_path, "rb") as f:
+                    self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.log_size = log_size
+            self.index_size = index_size
+        return self
+
+    def count(self):
+        return self.index_size // _OFFSET.size
+
+    def read(self, start, stop):
+        out = []
+        if start >= stop:
+            return out
+        index = self.index
+        log = self.log
+        for position in range(start * _OFFSET.size, stop * _OFFSET.size, _OFFSET.size):
+            (offset,) = _OFFSET.unpack_from(index, position)
+            (length,) = _LEN.unpack_from(log, offset)
+            body = offset + _LEN.size
+            out.append(json.loads(log[body:body + length]))
+        return out
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.index.close()
+        self.log = self.index = None
+        self.log_size = self.index_size = 0
+
+
+def _repair_index(index, log_path):
+    """Cut a torn offset, and offsets of records the log doesn't fully hold, off the index.
+
+    Appending after a torn offset would shift every later one by a few bytes.
+    """
+    size = index.seek(0, os.SEEK_END)
+    good = size - size % _OFFSET.size
+    if good:
+        log_size = os.path.getsize(log_path)
+        with open(index.name, "rb") as f, open(log_path, "rb") as log:
+            while good:
+                f.seek(good - _OFFSET.size)
+                (offset,) = _OFFSET.unpack(f.read(_OFFSET.size))
+                log.seek(offset)
+                prefix = log.read(_LEN.size)
+                if len(prefix) == _LEN.size and offset + _LEN.size + _LEN.unpack(prefix)[0] <= log_size:
+                    break
+                good -= _OFFSET.size
+    if good != size:
+        index.truncate(good)
+
+
+class ConversationStore:
+    def __init__(self, root, max_open=256):
+        self.root = root
+        self.max_open = max_open
+        self._open = OrderedDict()   # conversation_id -> _Mapped (LRU, bounds open fds)
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, conversation_id):
+        return os.path.join(self.root, conversation_id)
+
+    def _mapped(self, conversation_id):
+        mapped = self._open.get(conversation_id)
+        if mapped is None:
+            mapped = _Mapped(self._dir(conversation_id))
+            self._open[conversation_id] = mapped
+            if len(self._open) > self.max_open:
+                self._open.popitem(last=False)[1].close()
+        else:
+            self._open.move_to_end(conversation_id)
+        return mapped.refresh()
+
+    # -------------------------------------------------------------------------
+    # writes
+    # -------------------------------------------------------------------------
+
+    def append(self, conversation_id, items):
+        """Append item dicts (as returned by the API) to the conversation."""
+        if not items:
+            return 0
+        directory = self._dir(conversation_id)
+        os.makedirs(directory, exist_ok=True)
+        log_path = os.path.join(directory, "log")
+
+        records = []
+        offsets = []
+        position = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        for item in items:
+            data = json.dumps(item, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            offsets.append(_OFFSET.pack(position))
+            records.append(_LEN.pack(len(data)))
+            records.append(data)
+            position += _LEN.size + len(data)
+
+        with open(log_path, "ab") as log:
+            log.write(b"".join(records))
+        with open(os.path.join(directory, "index"), "ab") as index:
+            _repair_index(index, log_path)
+            index.write(b"".join(offsets))
+        return len(items)
+
+    def sync(self, client, conversation_id, page_size=100):
+        """Fetch only the items after the last one we have. Returns how many were new."""
+        last = self.recent(conversation_id, 1)
+        after = last[0]["id"] if last else None
+
+        added = 0
+        while True:
+            params = {"order": "asc", "limit": page_size}
+            if after:
+                params["after"] = after
+            page = client.conversations.items.list(conversation_id, **params)
+            items = [item.to_dict() for item in page.data]
+            added += self.append(conversation_id, items)
+            if not items or not page.has_more:
+                return added
+            after = items[-1]["id"]
+
+    def delete(self, conversation_id):
+        mapped = self._open.pop(conversation_id, None)
+        if mapped is not None:
+            mapped.close()
+        shutil.rmtree(self._dir(conversation_id), ignore_errors=True)
+
+    # -------------------------------------------------------------------------
+    # reads
+    # -------------------------------------------------------------------------
+
+    def count(self, conversation_id):
+        return self._mapped(conversation_id).count()
+
+    def recent(self, conversation_id, n):
+        """The last n items, oldest first."""
+        mapped = self._mapped(conversation_id)
+        total = mapped.count()
+        return mapped.read(max(0, total - n), total)
+
+    def window(self, conversation_id, start, stop):
+        """Items [start, stop) by position, like a list slice with non-negative bounds."""
+        mapped = self._mapped(conversation_id)
+        total = mapped.count()
+        return mapped.read(max(0, start), min(stop, total))
+
+    def close(self):
+        for mapped in self._open.values():
+            mapped.close()
+        self._open.clear()
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+
+def _fake_item(i):
+    role = "user" if i % 2 == 0 else "assistant"
+    kind = "input_text" if role == "user" else "output_text"
+    return {
+        "id": f"msg_{i:08d}",
+        "type": "message",
+        "role": role,
+        "status": "completed",
+        "content": [{"type": kind, "text": f"message number {i} " + "lorem ipsum " * 8}],
+    }
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.99)] * 1000
+
+
+def _bench(args):
+    import random
+    import tempfile
+
+    root = args.root or tempfile.mkdtemp(prefix="convstore_")
+    store = ConversationStore(root)
+    ids = [f"conv_{c:06d}" for c in range(args.conversations)]
+
+    start = time.perf_counter()
+    for conversation_id in ids:
+        for first in range(0, args.items, 250):
+            store.append(conversation_id, [_fake_item(i) for i in range(first, min(first + 250, args.items))])
+    elapsed = time.perf_counter() - start
+    total = args.conversations * args.items
+    print(f"wrote {total:,} items in {elapsed:.1f}s ({total / elapsed:,.0f} items/s)")
+
+    sample = [random.choice(ids) for _ in range(args.loads)]
+
+    timings = []
+    for conversation_id in sample:
+        t = time.perf_counter()
+        store.recent(conversation_id, args.window)
+        timings.append(time.perf_counter() - t)
+    p50, p99 = _percentiles(timings)
+    print(f"recent({args.window})        p50 {p50:7.3f} ms   p99 {p99:7.3f} ms")
+
+    # What a page load costs today: the whole history, every time
+    timings = []
+    for conversation_id in sample[:200]:
+        t = time.perf_counter()
+        store.window(conversation_id, 0, args.items)
+        timings.append(time.perf_counter() - t)
+    p50, p99 = _percentiles(timings)
+    print(f"full history ({args.items})  p50 {p50:7.3f} ms   p99 {p99:7.3f} ms   (local; the API adds a round trip per 100 items)")
+
+    store.close()
+    if not args.root:
+        shutil.rmtree(root)
+
+
+def _demo_sync():
+    """Incremental sync against the stub: second sync only fetches the new items."""
+    import tempfile
+
+    from openai import OpenAI
+
+    from stub_server import StubServer
+
+    items = [_fake_item(i) for i in range(250)]
+
+    def list_items(req):
+        after = req.query.get("after", [None])[0]
+        limit = int(req.query.get("limit", ["20"])[0])
+        start = next((i + 1 for i, item in enumerate(items) if item["id"] == after), 0)
+        page = items[start:start + limit]
+        return 200, {
+            "object": "list", "data": page, "has_more": start + limit < len(items),
+            "first_id": page[0]["id"] if page else None, "last_id": page[-1]["id"] if page else None,
+        }
+
+    with StubServer() as server, tempfile.TemporaryDirectory() as root:
+        server.route("GET", "/v1/conversations/*", list_items)
+        client = OpenAI(base_url=server.base_url, api_key="stub")
+        store = ConversationStore(root)
+
+        print(f"first sync : {store.sync(client, 'conv_demo')} items, {server.request_count} requests")
+        items.extend(_fake_item(i) for i in range(250, 260))
+        before = server.request_count
+        print(f"second sync: {store.sync(client, 'conv_demo')} items, {server.request_count - before} request")
+        print(f"last item  : {store.recent('conv_demo', 1)[0]['id']}")
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local conversation store benchmark")
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--window", type=int, default=50)
+    parser.add_argument("--loads", type=int, default=5000)
+    parser.add_argument("--root", default=None, help="keep the store here instead of a temp dir")
+    parser.add_argument("--sync-demo", action="store_true", help="incremental sync against the stub server")
+    args = parser.parse_args()
+    if args.sync_demo:
+        _demo_sync()
+    else:
+        _bench(args)
@@ -0,0 +1,361 @@
+"""
+Streaming file upload / resumable download
+==========================================
+
+`openai api files.create` does `BufferReader(file_reader.read(), ...)` and
+`client.files.content()` returns the whole body at once - both hold the
+entire file in memory. With 5-10 GB batch outputs and training files that
+kills the container.
+
+Here memory stays flat no matter how big the file is:
+
+- upload: the SDK passes a `(filename, file_object)` tuple straight to httpx,
+  which reads it in small chunks. `ProgressReader` is that file object: it
+  reports progress and can expose just a byte window of the file, so parts
+  of a multi-part Upload (files over 512 MB) are streamed from disk too.
+- download: `files.with_streaming_response.content()` writes 1 MB chunks to
+  `<dest>.part`. If the connection drops, the download resumes from the bytes
+  already on disk with an HTTP Range request. The result is checked against
+  the file size (and optionally a sha256) before being renamed into place.
+  Running out of resumes raises `DownloadIncomplete` (chained to the last
+  transport error); `ChecksumMismatch` only ever means corrupt content.
+
+CLI (drop-in for `openai api files.create` / `files.content`):
+    python files_stream.py upload batch.jsonl --purpose batch
+    python files_stream.py download file-abc123 out.jsonl --sha256 <hex>
+    python files_stream.py bench --mb 2048      # peak RSS vs file size, local stub
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import sys
+import time
+
+import httpx
+
+FILES_API_LIMIT = 512 * 1024 * 1024   # bigger files must go through the Uploads API
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+# =============================================================================
+# PROGRESS
+# =============================================================================
+
+
+def make_progress(total, desc):
+    """tqdm bar when available (the openai CLI already depends on it), else silent."""
+    try:
+        import tqdm
+    except ImportError:
+        return lambda done: None
+
+    bar = tqdm.tqdm(total=total, unit="B", unit_scale=True, desc=desc)
+
+    def update(done):
+        bar.n = done
+        bar.refresh()
+        if done >= total:
+            bar.close()
+
+    return update
+
+
+class ProgressReader(io.RawIOBase):
+    """
+    Read-only view of `[offset, offset + length)` of a file on disk.
+
+    No `fileno()` on purpose: httpx would otherwise fstat() the whole file
+    and send the wrong Content-Length for a window.
+    """
+
+    def __init__(self, path, offset=0, length=None, progress=None):
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self.offset = offset
+        self.length = size - offset if length is None else min(length, size - offset)
+        self.progress = progress
+        self._pos = 0
+        self._file.seek(offset)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        raise io.UnsupportedOperation("fileno")
+
+    def __len__(self):
+        return self.length
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self.length
+        self._pos = max(0, min(pos, self.length))
+        self._file.seek(self.offset + self._pos)
+        return self._pos
+
+    def read(self, n=-1):
+        remaining = self.length - self._pos
+        if n is None or n < 0 or n > remaining:
+            n = remaining
+        data = self._file.read(n)
+        self._pos += len(data)
+        if self.progress is not None:
+            self.progress(self._pos)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+# =============================================================================
+# UPLOAD
+# =============================================================================
+
+
+def upload_file(client, path, purpose, mime_type="application/jsonl",
+                part_size=DEFAULT_PART_SIZE, show_progress=True):
+    """Upload without reading the file into memory. Returns a FileObject."""
+    size = os.path.getsize(path)
+    name = os.path.basename(path)
+    progress = make_progress(size, "Upload progress") if show_progress else None
+
+    if size <= FILES_API_LIMIT:
+        with ProgressReader(path, progress=progress) as reader:
+            return client.files.create(file=(name, reader), purpose=purpose)
+
+    # Multi-part Upload: every part is a window over the same file on disk
+    upload = client.uploads.create(bytes=size, filename=name, mime_type=mime_type, purpose=purpose)
+    part_ids = []
+    for offset in range(0, size, part_size):
+        part_progress = None
+        if progress is not None:
+            part_progress = lambda done, base=offset: progress(base + done)
+        with ProgressReader(path, offset=offset, length=part_size, progress=part_progress) as reader:
+            part = client.uploads.parts.create(upload_id=upload.id, data=(name, reader))
+        part_ids.append(part.id)
+    completed = client.uploads.complete(upload_id=upload.id, part_ids=part_ids)
+    return completed.file
+
+
+# =============================================================================
+# DOWNLOAD
+# =============================================================================
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+class DownloadIncomplete(Exception):
+    """The connection kept dropping: gave up after max_resumes. The file on disk is fine so far."""
+
+
+def sha256_of(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download_file(client, file_id, dest, expected_sha256=None, chunk_size=CHUNK_SIZE,
+                  max_resumes=10, show_progress=True):
+    """Stream a file's content to `dest`, resuming after dropped connections."""
+    import openai
+
+    total = client.files.retrieve(file_id).bytes
+    partial = dest + ".part"
+    progress = make_progress(total, "Download progress") if show_progress else None
+    resumes = 0
+    last_error = None
+
+    while True:
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        if offset >= total:
+            break
+
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with client.files.with_streaming_response.content(file_id, extra_headers=headers) as response:
+                # A server that ignores Range answers 200 with the whole file
+                mode = "ab" if offset and response.status_code == 206 else "wb"
+                written = offset if mode == "ab" else 0
+                with open(partial, mode) as out:
+                    for chunk in response.iter_bytes(chunk_size):
+                        out.write(chunk)
+                        written += len(chunk)
+                        if progress is not None:
+                            progress(written)
+            if written >= total:
+                break
+        except (httpx.TransportError, openai.APIConnectionError) as exc:
+            last_error = exc
+
+        # Dropped connection or short body: back off and resume from disk
+        resumes += 1
+        if resumes > max_resumes:
+            raise DownloadIncomplete(f"gave up on {file_id} after {max_resumes} resumes, "
+                                     f"{os.path.getsize(partial) if os.path.exists(partial) else 0} "
+                                     f"of {total} bytes in {partial}") from last_error
+        time.sleep(min(2 ** resumes * 0.1, 5))
+
+    size = os.path.getsize(partial)
+    if size != total:
+        raise ChecksumMismatch(f"expected {total} bytes, got {size}")
+    if expected_sha256 and sha256_of(partial) != expected_sha256.lower():
+        os.remove(partial)
+        raise ChecksumMismatch(f"sha256 of {file_id} does not match {expected_sha256}")
+    os.replace(partial, dest)
+    return {"path": dest, "bytes": size, "resumes": resumes}
+
+
+# =============================================================================
+# BENCHMARK (local stub)
+# =============================================================================
+
+
+def _files_routes(server, source, drop_every=None):
+    """Files API serving `source` as the content of every file; drops downloads mid-body."""
+    import itertools
+
+    counter = itertools.count(1)
+    size = os.path.getsize(source)
+
+    def file_object(file_id, nbytes):
+        return {
+            "id": file_id, "object": "file", "bytes": nbytes, "created_at": int(time.time()),
+            "filename": os.path.basename(source), "purpose": "batch", "status": "processed",
+        }
+
+    def create(req):
+        received = sum(len(chunk) for chunk in req.iter_body())
+        return 200, file_object(f"file-{next(counter)}", received)
+
+    def by_id(req):
+        parts = req.path.split("/")
+        if len(parts) == 4:
+            return 200, file_object(parts[3], size)
+
+        start = 0
+        status = 200
+        range_header = req.headers.get("range")
+        if range_header:
+            start = int(range_header.split("=")[1].split("-")[0])
+            status = 206
+
+        def body():
+            sent = 0
+            with open(source, "rb") as f:
+                f.seek(start)
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    yield chunk
+                    sent += len(chunk)
+                    if drop_every and sent >= drop_every and start + sent < size:
+                        raise ConnectionResetError("simulated drop")
+
+        return status, body(), {"content-type": "application/octet-stream",
+                                "content-range": f"bytes {start}-{size - 1}/{size}"}
+
+    server.route("POST", "/v1/files", create)
+    server.route("GET", "/v1/files/*", by_id)
+
+
+def _bench_client(base_url, path, mode):
+    """Runs in a child process so its peak RSS is not mixed up with the server's."""
+    import resource
+
+    from openai import OpenAI
+
+    client = OpenAI(base_url=base_url, api_key="stub", max_retries=0, timeout=600)
+    start = time.perf_counter()
+    if mode == "upload-buffered":
+        with open(path, "rb") as f:
+            client.files.create(file=(os.path.basename(path), f.read()), purpose="batch")
+    elif mode == "upload-stream":
+        upload_file(client, path, purpose="batch", show_progress=False)
+    elif mode == "download-stream":
+        download_file(client, "file-source", path + ".down", show_progress=False)
+        os.remove(path + ".down")
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:<16} {os.path.getsize(path) / 2**20 / elapsed:8.0f} MB/s   peak RSS {peak_mb:7.0f} MB")
+
+
+def _bench(size_mb):
+    import subprocess
+    import tempfile
+
+    from stub_server import StubServer
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "big.jsonl")
+        block = os.urandom(CHUNK_SIZE)
+        with open(path, "wb") as f:
+            for _ in range(size_mb):
+                f.write(block)
+
+        with StubServer() as server:
+            _files_routes(server, path, drop_every=max(CHUNK_SIZE, size_mb * CHUNK_SIZE // 3))
+            print(f"file size {size_mb} MB (downloads are dropped and resumed 2-3 times)")
+            for mode in ("upload-stream", "download-stream", "upload-buffered"):
+                subprocess.run([sys.executable, __file__, "_bench_client", server.base_url, path, mode], check=False)
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming uploads and resumable downloads")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    up = sub.add_parser("upload")
+    up.add_argument("file")
+    up.add_argument("--purpose", required=True)
+    up.add_argument("--part-size", type=int, default=DEFAULT_PART_SIZE)
+
+    down = sub.add_parser("download")
+    down.add_argument("file_id")
+    down.add_argument("dest")
+    down.add_argument("--sha256", default=None)
+
+    bench = sub.add_parser("bench")
+    bench.add_argument("--mb", type=int, default=1024)
+
+    child = sub.add_parser("_bench_client")
+    child.add_argument("base_url")
+    child.add_argument("path")
+    child.add_argument("mode")
+
+    args = parser.parse_args()
+    if args.command == "bench":
+        _bench(args.mb)
+    elif args.command == "_bench_client":
+        _bench_client(args.base_url, args.path, args.mode)
+    else:
+        from dotenv import load_dotenv
+        from openai import OpenAI
+
+        load_dotenv()
+        client = OpenAI()
+        if args.command == "upload":
+            print(upload_file(client, args.file, args.purpose, part_size=args.part_size))
+        else:
+            print(download_file(client, args.file_id, args.dest, expected_sha256=args.sha256))
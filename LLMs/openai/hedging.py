@@ -0,0 +1,369 @@
+"""
+Hedged requests
+===============
+
+The SDK client retries when a request fails, but never when it is just slow.
+Short `responses.create` calls occasionally land on a slow backend and our
+p99 ends up 5-10x the median.
+
+A hedge is a duplicate request sent when the first one hasn't answered by the
+time a normal request would have. Whichever answers first wins; the other is
+cancelled. Because the hedge delay is a high percentile of recent latency,
+only the slowest few percent of requests get a duplicate.
+
+This is an httpx transport, so it plugs into the client without touching the SDK:
+
+    client = AsyncOpenAI(http_client=httpx.AsyncClient(transport=AsyncHedgedTransport()))
+    client = OpenAI(http_client=httpx.Client(transport=HedgedTransport()))
+
+- "answered" means response headers arrived, or for streams (`stream=True`)
+  the first SSE chunk when `wait_first_chunk` is on
+- the hedge delay is the `percentile` of the last `window` latencies; a
+  primary cancelled after running past the delay counts with its elapsed time
+  (a lower bound), so slow requests that lost to a hedge still pull it up
+- `should_hedge` runs before the body is read, so uploads aren't buffered
+- `budget` caps hedges to that fraction of requests (token bucket)
+
+Run `python hedging.py` for a p99 benchmark against a long-tail stub server.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+
+import httpx
+
+HEDGE_PATHS = ("/responses", "/chat/completions", "/embeddings", "/moderations")
+
+
+def default_should_hedge(request):
+    """GETs and short generation endpoints; never background jobs or uploads."""
+    if request.method == "GET":
+        return True
+    if request.method != "POST" or not request.url.path.endswith(HEDGE_PATHS):
+        return False
+    try:
+        content = request.content   # JSON bodies are in memory already; streamed uploads aren't
+    except httpx.RequestNotRead:
+        return False
+    return b'"background": true' not in content and b'"background":true' not in content
+
+
+# =============================================================================
+# ADAPTIVE DELAY + BUDGET
+# =============================================================================
+
+
+class LatencyTracker:
+    def __init__(self, percentile=95, window=1000, min_delay=0.01, initial_delay=1.0, min_samples=20):
+        self.percentile = percentile
+        self.samples = deque(maxlen=window)
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self._delay = initial_delay
+        self._since_update = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+            self._since_update += 1
+            # Sorting 1000 floats on every request would be wasteful
+            if self._since_update >= 25 and len(self.samples) >= self.min_samples:
+                ordered = sorted(self.samples)
+                index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+                self._delay = max(self.min_delay, ordered[index])
+                self._since_update = 0
+
+    def delay(self):
+        return self._delay
+
+
+class HedgeBudget:
+    """Every request earns `ratio` of a hedge; a hedge spends 1."""
+
+    def __init__(self, ratio=0.05, burst=10):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = float(burst)
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+def _copy_request(request):
+    return httpx.Request(
+        request.method, request.url, headers=request.headers,
+        content=request.content, extensions=request.extensions,
+    )
+
+
+def _is_stream(response):
+    return response.headers.get("content-type", "").startswith("text/event-stream")
+
+
+class _Stats:
+    def __init__(self):
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def as_dict(self, tracker, budget):
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": self.hedges / self.requests if self.requests else 0.0,
+            "hedge_delay": tracker.delay(),
+            "budget_tokens": budget.tokens,
+        }
+
+
+# =============================================================================
+# ASYNC TRANSPORT
+# =============================================================================
+
+
+class _PrependedAsyncStream(httpx.AsyncByteStream):
+    def __init__(self, first, iterator, original):
+        self._first = first
+        self._iterator = iterator
+        self._original = original
+
+    async def __aiter__(self):
+        yield self._first
+        async for chunk in self._iterator:
+            yield chunk
+
+    async def aclose(self):
+        await self._original.aclose()
+
+
+class AsyncHedgedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport=None, tracker=None, budget=None,
+                 should_hedge=default_should_hedge, wait_first_chunk=True):
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.tracker = tracker or LatencyTracker()
+        self.budget = budget or HedgeBudget()
+        self.should_hedge = should_hedge
+        self.wait_first_chunk = wait_first_chunk
+        self._stats = _Stats()
+
+    def stats(self):
+        return self._stats.as_dict(self.tracker, self.budget)
+
+    async def _send(self, request):
+        start = time.monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+            if self.wait_first_chunk and _is_stream(response):
+                iterator = response.stream.__aiter__()
+                try:
+                    first = await iterator.__anext__()
+                except StopAsyncIteration:
+                    first = b""
+                response.stream = _PrependedAsyncStream(first, iterator, response.stream)
+        except asyncio.CancelledError:
+            # Lost to a hedge or the caller gave up: if it was already past the
+            # hedge delay, its elapsed time is a lower bound worth keeping
+            elapsed = time.monotonic() - start
+            if elapsed >= self.tracker.delay():
+                self.tracker.record(elapsed)
+            raise
+        self.tracker.record(time.monotonic() - start)
+        return response
+
+    async def handle_async_request(self, request):
+        self._stats.requests += 1
+        self.budget.earn()
+        if not self.should_hedge(request):
+            return await self._send(request)
+        await request.aread()
+
+        primary = asyncio.create_task(self._send(request))
+        tasks = [primary]
+        winner = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.tracker.delay())
+            if done or not self.budget.try_spend():
+                response = await primary
+                winner = primary
+                return response
+
+            self._stats.hedges += 1
+            hedge = asyncio.create_task(self._send(_copy_request(request)))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._stats.hedge_wins += 1
+                        winner = task
+                        return task.result()
+            # Both failed: surface the primary's error
+            return primary.result()
+        finally:
+            # Also reached when the caller is cancelled mid-wait: nothing may keep running
+            for task in tasks:
+                if task is not winner:
+                    task.cancel()
+                    task.add_done_callback(_close_async_loser)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def _close_async_loser(task):
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result().aclose())
+
+
+# =============================================================================
+# SYNC TRANSPORT
+# =============================================================================
+
+
+class _PrependedStream(httpx.SyncByteStream):
+    def __init__(self, first, iterator, original):
+        self._first = first
+        self._iterator = iterator
+        self._original = original
+
+    def __iter__(self):
+        yield self._first
+        yield from self._iterator
+
+    def close(self):
+        self._original.close()
+
+
+class HedgedTransport(httpx.BaseTransport):
+    """
+    Thread based version for `OpenAI`. A blocking request can't be cancelled
+    mid-flight, so the loser is closed as soon as it returns.
+    """
+
+    def __init__(self, transport=None, tracker=None, budget=None,
+                 should_hedge=default_should_hedge, wait_first_chunk=True, max_workers=64):
+        self.transport = transport or httpx.HTTPTransport()
+        self.tracker = tracker or LatencyTracker()
+        self.budget = budget or HedgeBudget()
+        self.should_hedge = should_hedge
+        self.wait_first_chunk = wait_first_chunk
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._stats = _Stats()
+
+    def stats(self):
+        return self._stats.as_dict(self.tracker, self.budget)
+
+    def _send(self, request):
+        start = time.monotonic()
+        response = self.transport.handle_request(request)
+        if self.wait_first_chunk and _is_stream(response):
+            iterator = iter(response.stream)
+            first = next(iterator, b"")
+            response.stream = _PrependedStream(first, iterator, response.stream)
+        self.tracker.record(time.monotonic() - start)
+        return response
+
+    def handle_request(self, request):
+        self._stats.requests += 1
+        self.budget.earn()
+        if not self.should_hedge(request):
+            return self._send(request)
+        request.read()
+
+        primary = self._pool.submit(self._send, request)
+        done, _ = wait_futures({primary}, timeout=self.tracker.delay())
+        if done or not self.budget.try_spend():
+            return primary.result()
+
+        self._stats.hedges += 1
+        hedge = self._pool.submit(self._send, _copy_request(request))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._stats.hedge_wins += 1
+                    for loser in pending:
+                        loser.add_done_callback(_close_sync_loser)
+                    return future.result()
+        return primary.result()
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        self.transport.close()
+
+
+def _close_sync_loser(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+
+def _long_tail_latency():
+    # 97% fast, 3% hit a slow backend
+    if random.random() < 0.03:
+        return random.uniform(0.4, 0.8)
+    return random.uniform(0.015, 0.030)
+
+
+async def _bench(n_requests=3000, concurrency=32):
+    from openai import AsyncOpenAI
+
+    from prompt_eval import percentile
+    from stub_server import StubServer
+
+    random.seed(1)
+    for label, hedged in (("no hedging", False), ("hedged", True)):
+        with StubServer(latency=_long_tail_latency) as server:
+            transport = AsyncHedgedTransport(budget=HedgeBudget(ratio=0.10)) if hedged else None
+            http_client = httpx.AsyncClient(transport=transport) if hedged else None
+            client = AsyncOpenAI(base_url=server.base_url, api_key="stub", http_client=http_client, max_retries=0)
+
+            latencies = []
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one(i):
+                async with semaphore:
+                    start = time.perf_counter()
+                    await client.responses.create(model="gpt-4o-mini", input=f"ping {i}")
+                    latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(one(i) for i in range(n_requests)))
+            await client.close()
+            sent = server.request_count
+
+        ms = [x * 1000 for x in latencies]
+        print(
+            f"{label:<11} p50 {percentile(ms, 50):6.1f} ms   p99 {percentile(ms, 99):6.1f} ms   "
+            f"extra requests {sent - n_requests:4d} ({(sent - n_requests) / n_requests:.1%})"
+        )
+        if hedged:
+            print(f"            {transport.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_bench())
@@ -0,0 +1,434 @@
+"""
+Durable job queue for LLM requests
+==================================
+
+Running main.py at scale used to mean shell loops, and a process dying
+mid-batch lost its work. Jobs now go into a durable store, and any number
+of worker processes (on one or more machines) lease them, call the API and
+commit the result.
+
+Guarantees:
+- a leased job is invisible to other workers until its visibility timeout
+  runs out; a worker that dies simply lets the lease expire and the job is
+  picked up again
+- results are committed exactly once: `complete()` only succeeds for the
+  current lease token, so a late worker whose lease expired can't overwrite
+  (the API call itself is at-least-once, like any queue)
+- failed jobs are retried with exponential backoff, then moved to the dead
+  letter state after `max_attempts`
+- priority lanes: higher `priority` is always leased first
+- per-tenant fairness: inside a lane, tenants are interleaved round-robin,
+  so one tenant's 100k-job batch doesn't starve everyone else
+
+`SQLiteBackend` (WAL mode) is the local store. Anything implementing
+`QueueBackend` (e.g. Postgres with SELECT ... FOR UPDATE SKIP LOCKED, for
+workers on several machines) can be dropped in.
+
+Usage:
+    python job_queue.py enqueue jobs.db prompts.jsonl --tenant acme
+    python job_queue.py work jobs.db --processes 8
+    python job_queue.py stats jobs.db
+    python job_queue.py bench                  # jobs/sec vs worker count, local stub
+"""
+
+import abc
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+# =============================================================================
+# BACKEND INTERFACE
+# =============================================================================
+
+
+class Job:
+    __slots__ = ("id", "tenant", "priority", "payload", "attempts", "lease_token")
+
+    def __init__(self, id, tenant, priority, payload, attempts, lease_token):
+        self.id = id
+        self.tenant = tenant
+        self.priority = priority
+        self.payload = payload
+        self.attempts = attempts
+        self.lease_token = lease_token
+
+
+class QueueBackend(abc.ABC):
+    @abc.abstractmethod
+    def enqueue(self, payloads, tenant="default", priority=0, max_attempts=5):
+        """Add jobs; returns their ids."""
+
+    @abc.abstractmethod
+    def lease(self, worker_id, n=1, visibility_timeout=60.0):
+        """Lease up to n runnable jobs for this worker."""
+
+    @abc.abstractmethod
+    def extend(self, job, visibility_timeout):
+        """Heartbeat: push the lease deadline out. False if the lease was lost."""
+
+    @abc.abstractmethod
+    def complete(self, job, result):
+        """Commit the result. False if the lease was lost (result is discarded)."""
+
+    @abc.abstractmethod
+    def fail(self, job, error, retry_delay=None):
+        """Schedule a retry, or dead-letter the job when out of attempts."""
+
+    @abc.abstractmethod
+    def stats(self):
+        """Counts per status."""
+
+
+# =============================================================================
+# SQLITE BACKEND
+# =============================================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY,
+    tenant        TEXT    NOT NULL,
+    priority      INTEGER NOT NULL DEFAULT 0,
+    payload       TEXT    NOT NULL,
+    status        TEXT    NOT NULL DEFAULT 'queued',   -- queued | leased | done | dead
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL DEFAULT 5,
+    available_at  REAL    NOT NULL,
+    lease_token   TEXT,
+    leased_by     TEXT,
+    lease_expires REAL,
+    result        TEXT,
+    error         TEXT,
+    created_at    REAL    NOT NULL,
+    finished_at   REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (status, priority, tenant, id);
+CREATE INDEX IF NOT EXISTS jobs_leases ON jobs (status, lease_expires);
+CREATE TABLE IF NOT EXISTS tenants (
+    tenant    TEXT PRIMARY KEY,
+    served_at REAL NOT NULL
+);
+"""
+
+
+class SQLiteBackend(QueueBackend):
+    def __init__(self, path, base_backoff=1.0, max_backoff=300.0):
+        self.path = path
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._local = threading.local()
+        # executescript() manages its own transaction
+        self._conn().conn.executescript(SCHEMA)
+
+    def _conn(self):
+        # One connection per thread; sqlite3 connections can't be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    def enqueue(self, payloads, tenant="default", priority=0, max_attempts=5):
+        now = time.time()
+        rows = [(tenant, priority, json.dumps(p), max_attempts, now, now) for p in payloads]
+        with self._conn() as conn:
+            first = conn.execute("SELECT COALESCE(MAX(id), 0) FROM jobs").fetchone()[0]
+            conn.executemany(
+                "INSERT INTO jobs (tenant, priority, payload, max_attempts, available_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return list(range(first + 1, first + 1 + len(rows)))
+
+    def lease(self, worker_id, n=1, visibility_timeout=60.0):
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self._conn() as conn:
+            # Expired leases: a worker died or stalled. Out of attempts -> dead.
+            conn.execute(
+                "UPDATE jobs SET status = 'dead', error = 'lease expired', finished_at = ?"
+                " WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, now),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', lease_token = NULL"
+                " WHERE status = 'leased' AND lease_expires < ?",
+                (now,),
+            )
+
+            lane = conn.execute(
+                "SELECT MAX(priority) FROM jobs WHERE status = 'queued' AND available_at <= ?", (now,)
+            ).fetchone()[0]
+            if lane is None:
+                return []
+
+            # Fairness: serve the tenants that waited longest since their last
+            # lease first, and take their jobs round-robin (k-th job of every
+            # tenant before the (k+1)-th of any)
+            tenants = [row[0] for row in conn.execute(
+                "SELECT q.tenant FROM ("
+                "  SELECT DISTINCT tenant FROM jobs"
+                "  WHERE status = 'queued' AND priority = ? AND available_at <= ?"
+                ") q LEFT JOIN tenants t ON t.tenant = q.tenant"
+                " ORDER BY COALESCE(t.served_at, 0) LIMIT ?",
+                (lane, now, n),
+            )]
+            per_tenant = -(-n // len(tenants))
+            candidates = []
+            for position, tenant in enumerate(tenants):
+                for turn, row in enumerate(conn.execute(
+                    "SELECT id, tenant, priority, payload, attempts FROM jobs"
+                    " WHERE status = 'queued' AND priority = ? AND tenant = ? AND available_at <= ?"
+                    " ORDER BY id LIMIT ?",
+                    (lane, tenant, now, per_tenant),
+                )):
+                    candidates.append((turn, position, row))
+            candidates.sort(key=lambda c: (c[0], c[1]))
+            rows = [c[2] for c in candidates[:n]]
+
+            conn.executemany(
+                "INSERT INTO tenants (tenant, served_at) VALUES (?, ?)"
+                " ON CONFLICT (tenant) DO UPDATE SET served_at = excluded.served_at",
+                [(tenant, now) for tenant in {row[1] for row in rows}],
+            )
+            conn.executemany(
+                "UPDATE jobs SET status = 'leased', lease_token = ?, leased_by = ?, lease_expires = ?,"
+                " attempts = attempts + 1 WHERE id = ?",
+                [(token, worker_id, now + visibility_timeout, row[0]) for row in rows],
+            )
+        return [Job(row[0], row[1], row[2], json.loads(row[3]), row[4] + 1, token) for row in rows]
+
+    def extend(self, job, visibility_timeout):
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_token = ? AND status = 'leased'",
+                (time.time() + visibility_timeout, job.id, job.lease_token),
+            )
+            return cur.rowcount == 1
+
+    def complete(self, job, result):
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, finished_at = ?, lease_token = NULL"
+                " WHERE id = ? AND lease_token = ? AND status = 'leased'",
+                (json.dumps(result), time.time(), job.id, job.lease_token),
+            )
+            return cur.rowcount == 1
+
+    def fail(self, job, error, retry_delay=None):
+        if retry_delay is None:
+            retry_delay = min(self.max_backoff, self.base_backoff * 2 ** (job.attempts - 1))
+        now = time.time()
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET"
+                "  status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END,"
+                "  finished_at = CASE WHEN attempts >= max_attempts THEN ? ELSE NULL END,"
+                "  available_at = ?, error = ?, lease_token = NULL"
+                " WHERE id = ? AND lease_token = ? AND status = 'leased'",
+                (now, now + retry_delay, str(error), job.id, job.lease_token),
+            )
+            return cur.rowcount == 1
+
+    def dead_letters(self, limit=100):
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT id, tenant, payload, error, attempts FROM jobs WHERE status = 'dead' ORDER BY id LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [{"id": r[0], "tenant": r[1], "payload": json.loads(r[2]), "error": r[3], "attempts": r[4]} for r in rows]
+
+    def requeue_dead(self):
+        with self._conn() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, finished_at = NULL"
+                " WHERE status = 'dead'",
+                (time.time(),),
+            ).rowcount
+
+    def results(self, tenant=None):
+        query = "SELECT id, tenant, result FROM jobs WHERE status = 'done'"
+        params = ()
+        if tenant is not None:
+            query += " AND tenant = ?"
+            params = (tenant,)
+        with self._conn() as conn:
+            return [(r[0], r[1], json.loads(r[2])) for r in conn.execute(query + " ORDER BY id", params)]
+
+    def stats(self):
+        with self._conn() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class _Transaction:
+    """`with` block = one IMMEDIATE transaction (takes the write lock up front)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, *exc):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+
+def call_responses(client, payload):
+    """Default handler: payload is the kwargs of responses.create."""
+    response = client.responses.create(**payload)
+    usage = response.usage
+    return {
+        "response_id": response.id,
+        "output_text": response.output_text,
+        "input_tokens": usage.input_tokens if usage else None,
+        "output_tokens": usage.output_tokens if usage else None,
+    }
+
+
+def run_worker(backend, handler, worker_id=None, batch=4, visibility_timeout=120.0,
+               idle_sleep=0.2, stop_when_empty=False, threads=1):
+    """
+    Lease -> handle -> commit until stopped. `threads` > 1 runs that many
+    leases in flight inside this process (API calls are I/O bound).
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    done = 0
+    lock = threading.Lock()
+
+    def loop():
+        nonlocal done
+        while True:
+            jobs = backend.lease(worker_id, batch, visibility_timeout)
+            if not jobs:
+                if stop_when_empty and not backend.stats().get("leased") and not _has_runnable(backend):
+                    return
+                time.sleep(idle_sleep)
+                continue
+            for i, job in enumerate(jobs):
+                # The batch shares one deadline: restart the clock for each job
+                # after the first, or slow ones expire and run twice elsewhere
+                if i and not backend.extend(job, visibility_timeout):
+                    continue   # already expired and leased by another worker
+                try:
+                    result = handler(job.payload)
+                except Exception as e:
+                    backend.fail(job, repr(e))
+                    continue
+                if backend.complete(job, result):
+                    with lock:
+                        done += 1
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return done
+
+
+def _has_runnable(backend):
+    stats = backend.stats()
+    return stats.get("queued", 0) > 0
+
+
+def _worker_process(db_path, base_url, threads, stop_when_empty):
+    from openai import OpenAI
+
+    if base_url:
+        client = OpenAI(base_url=base_url, api_key="stub", max_retries=0)
+    else:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        client = OpenAI(max_retries=0)
+    backend = SQLiteBackend(db_path)
+    run_worker(backend, lambda payload: call_responses(client, payload),
+               threads=threads, stop_when_empty=stop_when_empty)
+
+
+def start_workers(db_path, processes, threads=4, base_url=None, stop_when_empty=False):
+    procs = [
+        multiprocessing.Process(target=_worker_process, args=(db_path, base_url, threads, stop_when_empty))
+        for _ in range(processes)
+    ]
+    for p in procs:
+        p.start()
+    return procs
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+
+def _bench(n_jobs=3000, worker_counts=(1, 2, 4, 8), threads=4):
+    import tempfile
+
+    from stub_server import StubServer
+
+    with StubServer(latency=lambda: 0.02) as server, tempfile.TemporaryDirectory() as tmp:
+        print(f"{n_jobs} jobs, stub latency 20 ms, {threads} threads per worker process")
+        for count in worker_counts:
+            db = os.path.join(tmp, f"bench_{count}.db")
+            backend = SQLiteBackend(db)
+            for t in range(10):
+                backend.enqueue(
+                    [{"model": "gpt-4o-mini", "input": f"tenant {t} job {i}"} for i in range(n_jobs // 10)],
+                    tenant=f"tenant-{t}",
+                )
+            start = time.perf_counter()
+            for p in start_workers(db, count, threads=threads, base_url=server.base_url, stop_when_empty=True):
+                p.join()
+            elapsed = time.perf_counter() - start
+            print(f"{count:2d} workers: {n_jobs / elapsed:7.0f} jobs/s   {backend.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Durable LLM job queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enq = sub.add_parser("enqueue", help="add jobs from a JSONL file of responses.create kwargs")
+    enq.add_argument("db")
+    enq.add_argument("jsonl")
+    enq.add_argument("--tenant", default="default")
+    enq.add_argument("--priority", type=int, default=0)
+    enq.add_argument("--max-attempts", type=int, default=5)
+
+    work = sub.add_parser("work")
+    work.add_argument("db")
+    work.add_argument("--processes", type=int, default=os.cpu_count())
+    work.add_argument("--threads", type=int, default=4)
+    work.add_argument("--exit-when-empty", action="store_true")
+
+    st = sub.add_parser("stats")
+    st.add_argument("db")
+
+    sub.add_parser("bench")
+
+    args = parser.parse_args()
+    if args.command == "enqueue":
+        with open(args.jsonl, encoding="utf-8") as f:
+            payloads = [json.loads(line) for line in f if line.strip()]
+        ids = SQLiteBackend(args.db).enqueue(payloads, args.tenant, args.priority, args.max_attempts)
+        print(f"enqueued {len(ids)} jobs")
+    elif args.command == "work":
+        for p in start_workers(args.db, args.processes, args.threads, stop_when_empty=args.exit_when_empty):
+            p.join()
+    elif args.command == "stats":
+        print(SQLiteBackend(args.db).stats())
+    else:
+        _bench()
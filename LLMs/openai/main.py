@@ -1,12 +1,13 @@
-from openai import OpenAI
 from dotenv import load_dotenv
 
+from router import build_default_router
+
 
 load_dotenv()
-client = OpenAI()
+# Picks the fastest healthy backend per request (see router.py)
+client = build_default_router()
 
 response = client.responses.create(
-    model="gpt-4o-mini",
     input="give me a word start with letter P"
 )
 
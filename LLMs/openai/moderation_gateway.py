@@ -0,0 +1,389 @@
+"""
+Moderation gateway
+==================
+
+Calling `client.moderations.create()` once per message before
+`responses.create()` doubles the request count and puts a full round trip in
+front of every turn. This gateway sits in front of both:
+
+- micro-batching: concurrent `check()` calls are collected for up to
+  `max_wait` seconds (or `max_batch` inputs) and sent as one
+  `moderations.create(input=[...])` call; results come back in input order
+- verdict cache: keyed by a hash of the normalised text (NFKC, case-folded,
+  whitespace collapsed) with a TTL, so "hi", "thanks!" and retried messages
+  skip moderation entirely. Identical texts already in flight share one slot
+- parallel mode: `create(..., policy="parallel")` starts moderation and the
+  model call together and only hands the response back once the verdict is
+  clean. Added latency drops to max(0, moderation - model), but a flagged input
+  still pays for the generation, so keep `policy="block"` (moderate first) for
+  tools with side effects
+
+Usage:
+    gateway = ModerationGateway(AsyncOpenAI())
+    verdict = await gateway.check(user_text)
+    response = await gateway.create(model="gpt-4o-mini", input=user_text, policy="parallel")
+    print(gateway.stats())
+
+Run `python moderation_gateway.py` for the stub benchmark.
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+_SPACE = re.compile(r"\s+")
+
+
+class ContentFlagged(Exception):
+    def __init__(self, verdicts):
+        self.verdicts = verdicts
+        flagged = sorted({c for v in verdicts for c in v.flagged_categories()})
+        super().__init__(f"input flagged by moderation: {', '.join(flagged) or 'unspecified'}")
+
+
+class Verdict:
+    __slots__ = ("flagged", "result", "cached")
+
+    def __init__(self, result, cached=False):
+        self.flagged = bool(result.flagged)
+        self.result = result   # the SDK's Moderation object
+        self.cached = cached
+
+    def flagged_categories(self):
+        categories = self.result.categories
+        values = categories.to_dict() if hasattr(categories, "to_dict") else dict(categories or {})
+        return [name for name, hit in values.items() if hit]
+
+
+def normalize(text):
+    return _SPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+
+def content_key(text):
+    return hashlib.blake2b(normalize(text).encode("utf-8"), digest_size=16).digest()
+
+
+def input_texts(params):
+    """User-supplied text of a responses.create call (instructions are ours, not moderated)."""
+    value = params.get("input", "")
+    if isinstance(value, str):
+        return [value] if value else []
+    texts = []
+    for item in value:
+        if not isinstance(item, dict) or item.get("role", "user") != "user":
+            continue
+        content = item.get("content", "")
+        if isinstance(content, str):
+            texts.append(content)
+        else:
+            texts.extend(c.get("text", "") for c in content if isinstance(c, dict) and c.get("type") == "input_text")
+    return [t for t in texts if t]
+
+
+# =============================================================================
+# VERDICT CACHE
+# =============================================================================
+
+
+class VerdictCache:
+    """LRU with a per-entry TTL; flagged verdicts can be kept for a different TTL."""
+
+    def __init__(self, ttl=3600.0, flagged_ttl=None, max_entries=100_000):
+        self.ttl = ttl
+        self.flagged_ttl = ttl if flagged_ttl is None else flagged_ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()   # key -> (expires_at, result)
+
+    def get(self, key, now=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= (now or time.monotonic()):
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, result, now=None):
+        ttl = self.flagged_ttl if result.flagged else self.ttl
+        if ttl <= 0:
+            return
+        self._data[key] = ((now or time.monotonic()) + ttl, result)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# =============================================================================
+# GATEWAY
+# =============================================================================
+
+
+class ModerationGateway:
+    def __init__(self, client, model="omni-moderation-latest", max_batch=32, max_wait=0.005,
+                 cache=None, concurrency=8):
+        self.client = client
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cache = cache if cache is not None else VerdictCache()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._batch = []          # (key, text) waiting for the next call
+        self._inflight = {}       # key -> future shared by identical texts
+        self._timer = None
+        self._tasks = set()
+        self.counters = {"checks": 0, "cache_hits": 0, "coalesced": 0, "moderation_calls": 0,
+                         "moderated_inputs": 0, "flagged": 0, "blocked_responses": 0}
+        self.added_latency = []   # seconds the caller waited on moderation, per create()
+
+    # -------------------------------------------------------------------------
+    # checks
+    # -------------------------------------------------------------------------
+
+    async def check(self, text):
+        self.counters["checks"] += 1
+        key = content_key(text)
+        result = self.cache.get(key)
+        if result is not None:
+            self.counters["cache_hits"] += 1
+            return Verdict(result, cached=True)
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            self._batch.append((key, text))
+            if len(self._batch) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return Verdict(await asyncio.shield(future))
+
+    async def check_many(self, texts):
+        return await asyncio.gather(*(self.check(text) for text in texts))
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        try:
+            async with self._semaphore:
+                self.counters["moderation_calls"] += 1
+                self.counters["moderated_inputs"] += len(batch)
+                response = await self.client.moderations.create(model=self.model, input=[text for _, text in batch])
+            if len(response.results) != len(batch):
+                raise RuntimeError(f"moderation returned {len(response.results)} results for {len(batch)} inputs")
+        except BaseException as exc:
+            for key, _ in batch:
+                future = self._inflight.pop(key)
+                if future.done():
+                    continue
+                if isinstance(exc, Exception):
+                    future.set_exception(exc)
+                else:
+                    future.cancel()
+            if not isinstance(exc, Exception):
+                raise
+            return
+        for (key, _), result in zip(batch, response.results):
+            self.cache.put(key, result)
+            if result.flagged:
+                self.counters["flagged"] += 1
+            future = self._inflight.pop(key)
+            if not future.done():
+                future.set_result(result)
+
+    # -------------------------------------------------------------------------
+    # guarded model calls
+    # -------------------------------------------------------------------------
+
+    async def _verdicts(self, texts):
+        verdicts = await self.check_many(texts)
+        flagged = [v for v in verdicts if v.flagged]
+        if flagged:
+            self.counters["blocked_responses"] += 1
+            raise ContentFlagged(flagged)
+        return verdicts
+
+    async def create(self, policy="block", create=None, **params):
+        """
+        responses.create (or `create`) behind moderation of the user input.
+        policy="block": moderate, then call. policy="parallel": both at once,
+        the response is released only after a clean verdict.
+        """
+        create = create or self.client.responses.create
+        texts = input_texts(params)
+        if not texts:
+            return await create(**params)
+
+        if policy == "block":
+            start = time.perf_counter()
+            await self._verdicts(texts)
+            self.added_latency.append(time.perf_counter() - start)
+            return await create(**params)
+        if policy != "parallel":
+            raise ValueError(f"unknown moderation policy {policy!r}")
+
+        moderation = asyncio.ensure_future(self._verdicts(texts))
+        call = asyncio.ensure_future(create(**params))
+        try:
+            await asyncio.wait({moderation, call}, return_when=asyncio.FIRST_EXCEPTION)
+            if moderation.done() and moderation.exception() is not None:
+                call.cancel()   # flagged (or moderation failed): drop the generation
+                raise moderation.exception()
+            response = await call
+            start = time.perf_counter()
+            await moderation
+            self.added_latency.append(time.perf_counter() - start)
+            return response
+        except BaseException:
+            moderation.cancel()
+            call.cancel()
+            raise
+
+    async def aclose(self):
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self):
+        from prompt_eval import percentile
+
+        c = self.counters
+        return dict(
+            c,
+            inputs_per_call=c["moderated_inputs"] / c["moderation_calls"] if c["moderation_calls"] else 0.0,
+            cache_entries=len(self.cache),
+            added_latency_p50_ms=percentile(self.added_latency, 50) * 1000,
+            added_latency_p99_ms=percentile(self.added_latency, 99) * 1000,
+        )
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+# Stub: moderation takes ~40 ms per call whatever the batch size, a response
+# ~250 ms. Chat traffic repeats a lot of short messages.
+
+
+def _moderations_route(req):
+    inputs = req.json()["input"]
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    time.sleep(0.04)
+    results = []
+    for text in inputs:
+        flagged = "attack" in text.lower()
+        results.append({
+            "flagged": flagged,
+            "categories": {"violence": flagged, "harassment": False},
+            "category_scores": {"violence": 0.9 if flagged else 0.01, "harassment": 0.0},
+            "category_applied_input_types": {"violence": ["text"], "harassment": ["text"]},
+        })
+    return 200, {"id": "modr-stub", "model": "omni-moderation-latest", "results": results}
+
+
+def _responses_route(req):
+    from stub_server import default_responses_route
+
+    time.sleep(0.25)
+    return default_responses_route(req)
+
+
+def _messages(n, seed=7):
+    import random
+
+    rng = random.Random(seed)
+    common = ["hi", "Hi!", "thanks", "Thank you!", "ok", "yes", "no", "continue", "what else?"]
+    out = []
+    for i in range(n):
+        roll = rng.random()
+        if roll < 0.4:
+            out.append(rng.choice(common))
+        elif roll < 0.41:
+            out.append(f"how do I attack problem {i}")
+        else:
+            out.append(f"question {i}: explain topic {rng.randrange(10_000)}")
+    return out
+
+
+async def _bench(n_turns=400, concurrency=50):
+    from openai import AsyncOpenAI
+
+    from prompt_eval import percentile
+    from stub_server import StubServer
+
+    messages = _messages(n_turns)
+
+    async def run(label, turn):
+        moderation_requests = [0]
+
+        def moderations(req):
+            moderation_requests[0] += 1
+            return _moderations_route(req)
+
+        with StubServer() as server:
+            server.route("POST", "/v1/moderations", moderations)
+            server.route("POST", "/v1/responses", _responses_route)
+            client = AsyncOpenAI(base_url=server.base_url, api_key="stub", max_retries=0)
+            gateway = ModerationGateway(client)
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies = []
+            blocked = 0
+
+            async def one(text):
+                nonlocal blocked
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        await turn(client, gateway, text)
+                    except ContentFlagged:
+                        blocked += 1
+                        return
+                    latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(one(text) for text in messages))
+            await gateway.aclose()
+            await client.close()
+        print(f"{label:<22} p50 {percentile(latencies, 50) * 1000:5.0f} ms  p99 {percentile(latencies, 99) * 1000:5.0f} ms"
+              f"  moderation requests {moderation_requests[0]:4d}  blocked {blocked:2d}")
+
+    async def no_moderation(client, gateway, text):
+        await client.responses.create(model="gpt-4o-mini", input=text)
+
+    async def per_message(client, gateway, text):
+        result = (await client.moderations.create(model="omni-moderation-latest", input=text)).results[0]
+        if result.flagged:
+            raise ContentFlagged([Verdict(result)])
+        await client.responses.create(model="gpt-4o-mini", input=text)
+
+    async def gateway_block(client, gateway, text):
+        await gateway.create(model="gpt-4o-mini", input=text, policy="block")
+
+    async def gateway_parallel(client, gateway, text):
+        await gateway.create(model="gpt-4o-mini", input=text, policy="parallel")
+
+    print(f"{n_turns} turns, {concurrency} concurrent, moderation 40 ms, response 250 ms")
+    await run("no moderation", no_moderation)
+    await run("moderate per message", per_message)
+    await run("gateway, block", gateway_block)
+    await run("gateway, parallel", gateway_parallel)
+
+
+if __name__ == "__main__":
+    asyncio.run(_bench())
@@ -0,0 +1,358 @@
+"""
+Prefix-aware request scheduler
+==============================
+
+Prompt caching on the provider side only helps when requests that share a
+long prefix (same system prompt, persona, few-shot examples) arrive close
+together. A batch run that sends them in arbitrary order mostly misses the cache.
+
+This scheduler sits in front of `responses.create`:
+1. Requests are collected for a short window
+2. Their rendered prompts are split into fixed-size blocks and inserted into a
+   trie keyed by block hash - prompts sharing a prefix share a path
+3. The trie is walked depth first, so prompts with the longest common
+   prefix are dispatched one after another
+4. Each time a slot frees up, new arrivals are merged into the order and
+   anything that has waited longer than `max_delay` jumps the queue, so
+   reordering never starves a request
+
+Requests in the same top-level group also get the same `prompt_cache_key`,
+which helps the provider route them to the same cache.
+
+The achieved cached-token ratio comes straight from `response.usage`.
+
+Usage:
+    scheduler = PrefixScheduler(AsyncOpenAI(), concurrency=16)
+    response = await scheduler.submit(model="gpt-4o-mini", instructions=..., input=...)
+    print(scheduler.stats())
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import deque
+
+# =============================================================================
+# PROMPT RENDERING
+# =============================================================================
+
+
+def render_prompt(params):
+    """The text the provider sees first-to-last: instructions, then input."""
+    parts = [params.get("instructions") or ""]
+    value = params.get("input", "")
+    if isinstance(value, str):
+        parts.append(value)
+    else:
+        for item in value:
+            content = item.get("content", "") if isinstance(item, dict) else ""
+            if isinstance(content, str):
+                parts.append(content)
+            else:
+                parts.extend(c.get("text", "") for c in content if isinstance(c, dict))
+    return "\n".join(parts)
+
+
+def block_hashes(text, block_chars):
+    """Hash of every full block; the hash of block i covers blocks 0..i."""
+    hashes = []
+    running = hashlib.blake2b(digest_size=8)
+    for start in range(0, len(text) - block_chars + 1, block_chars):
+        running.update(text[start:start + block_chars].encode("utf-8"))
+        hashes.append(running.copy().hexdigest())
+    return hashes
+
+
+# =============================================================================
+# PREFIX TRIE
+# =============================================================================
+
+
+class _Node:
+    __slots__ = ("children", "jobs")
+
+    def __init__(self):
+        self.children = {}
+        self.jobs = []
+
+
+class PrefixTrie:
+    def __init__(self, block_chars=512):
+        self.block_chars = block_chars
+        self.root = _Node()
+
+    def insert(self, job):
+        if job.hashes is None:   # kept on the job: a queued job is re-inserted as others arrive
+            job.hashes = block_hashes(job.prompt, self.block_chars)
+        node = self.root
+        for h in job.hashes:
+            node = node.children.setdefault(h, _Node())
+        node.jobs.append(job)
+
+    def ordered(self):
+        """Depth-first walk: longest shared prefixes end up next to each other."""
+        out = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            out.extend(node.jobs)
+            stack.extend(reversed(list(node.children.values())))
+        return out
+
+    def group_of(self, job, depth):
+        """Hash of the first `depth` blocks - used as the prompt_cache_key."""
+        hashes = block_hashes(job.prompt[: self.block_chars * depth], self.block_chars)
+        return hashes[-1] if hashes else None
+
+
+def order_by_prefix(param_list, block_chars=512):
+    """Reorder a list of responses.create kwargs so shared prefixes are adjacent."""
+    trie = PrefixTrie(block_chars)
+    for i, params in enumerate(param_list):
+        trie.insert(_Job(params, None, index=i))
+    return [job.params for job in trie.ordered()]
+
+
+# =============================================================================
+# SCHEDULER
+# =============================================================================
+
+
+class _Job:
+    __slots__ = ("params", "future", "prompt", "enqueued", "index", "hashes", "dispatched")
+
+    def __init__(self, params, future, index=0):
+        self.params = params
+        self.future = future
+        self.prompt = render_prompt(params)
+        self.enqueued = time.monotonic()
+        self.index = index
+        self.hashes = None
+        self.dispatched = False
+
+
+class PrefixScheduler:
+    def __init__(self, client, concurrency=16, window=0.05, max_delay=2.0,
+                 block_chars=512, cache_key_blocks=2, set_cache_key=True):
+        self.client = client
+        self.window = window
+        self.max_delay = max_delay
+        self.block_chars = block_chars
+        self.cache_key_blocks = cache_key_blocks
+        self.set_cache_key = set_cache_key
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+        self._inflight = set()
+
+        self._requests = 0
+        self._input_tokens = 0
+        self._cached_tokens = 0
+        self._max_wait = 0.0
+
+    async def submit(self, **params):
+        """Queue one responses.create call and wait for its response."""
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_Job(params, future))
+        self._wakeup.set()
+        return await future
+
+    async def run_batch(self, param_list):
+        """Submit a whole list and return responses in the original order."""
+        return await asyncio.gather(*(self.submit(**params) for params in param_list))
+
+    async def aclose(self):
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+
+    # -------------------------------------------------------------------------
+    # dispatching
+    # -------------------------------------------------------------------------
+
+    def _order(self, jobs):
+        trie = PrefixTrie(self.block_chars)
+        for job in jobs:
+            trie.insert(job)
+        ordered = trie.ordered()
+
+        if self.set_cache_key:
+            for job in ordered:
+                if "prompt_cache_key" not in job.params:
+                    key = trie.group_of(job, self.cache_key_blocks)
+                    if key is not None:
+                        job.params["prompt_cache_key"] = key
+        return ordered
+
+    async def _dispatch_loop(self):
+        queue = deque()      # undispatched jobs in prefix order
+        arrivals = deque()   # the same jobs in arrival order, for the max_delay check
+        while True:
+            if not queue and not self._pending:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                # Let more requests arrive so there is something to group
+                await asyncio.sleep(self.window)
+
+            await self._semaphore.acquire()
+            # Decided only now that a slot is free: jobs that arrived or went overdue
+            # while we waited for it are taken into account
+            try:
+                if self._pending:
+                    batch, self._pending = self._pending, []
+                    arrivals.extend(batch)
+                    queue = deque(self._order([job for job in queue if not job.dispatched] + batch))
+                job = self._next(queue, arrivals)
+            except Exception as exc:
+                self._semaphore.release()
+                for job in [*arrivals, *self._pending]:
+                    if not job.dispatched and not job.future.done():
+                        job.future.set_exception(exc)
+                queue.clear()
+                arrivals.clear()
+                self._pending = []
+                continue
+            if job is None:
+                self._semaphore.release()
+                continue
+            self._max_wait = max(self._max_wait, time.monotonic() - job.enqueued)
+            task = asyncio.create_task(self._run(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    def _next(self, queue, arrivals):
+        """The oldest job if it is overdue, else the next one in prefix order."""
+        while arrivals and arrivals[0].dispatched:
+            arrivals.popleft()
+        if arrivals and time.monotonic() - arrivals[0].enqueued >= self.max_delay:
+            job = arrivals.popleft()
+        else:
+            while queue and queue[0].dispatched:
+                queue.popleft()
+            if not queue:
+                return None
+            job = queue.popleft()
+        job.dispatched = True
+        return job
+
+    async def _run(self, job):
+        try:
+            response = await self.client.responses.create(**job.params)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self._record(response)
+            if not job.future.done():
+                job.future.set_result(response)
+        finally:
+            self._semaphore.release()
+
+    def _record(self, response):
+        usage = getattr(response, "usage", None)
+        self._requests += 1
+        if usage is None:
+            return
+        self._input_tokens += usage.input_tokens
+        details = usage.input_tokens_details
+        if details is not None:
+            self._cached_tokens += details.cached_tokens
+
+    def stats(self):
+        ratio = self._cached_tokens / self._input_tokens if self._input_tokens else 0.0
+        return {
+            "requests": self._requests,
+            "input_tokens": self._input_tokens,
+            "cached_tokens": self._cached_tokens,
+            "cached_ratio": ratio,
+            "max_queue_wait": self._max_wait,
+        }
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+# The stub keeps a small LRU of recently seen prefix blocks, like a provider
+# cache that can only hold a few prefixes at a time, and reports cached_tokens.
+
+
+def _make_caching_route(block_chars=512, capacity=4, ms_per_uncached_token=0.002):
+    from collections import OrderedDict
+
+    from stub_server import fake_response
+
+    cache = OrderedDict()
+
+    def route(req):
+        params = req.json()
+        prompt = render_prompt(params)
+        hashes = block_hashes(prompt, block_chars)
+        hit_blocks = 0
+        for h in hashes:
+            if h not in cache:
+                break
+            hit_blocks += 1
+        for h in hashes:
+            cache[h] = True
+            cache.move_to_end(h)
+        while len(cache) > capacity * max(1, len(hashes)):
+            cache.popitem(last=False)
+
+        input_tokens = len(prompt) // 4
+        cached = min(input_tokens, hit_blocks * block_chars // 4)
+        time.sleep((input_tokens - cached) * ms_per_uncached_token / 1000)
+        return 200, fake_response("ok", input_tokens=input_tokens, cached_tokens=cached)
+
+    return route
+
+
+async def _bench(n_requests=2000, n_prefixes=40):
+    import random
+
+    from openai import AsyncOpenAI
+
+    from stub_server import StubServer
+
+    random.seed(7)
+    personas = [f"You are assistant #{i}. " + ("Follow the style guide carefully. " * 60) for i in range(n_prefixes)]
+    jobs = [
+        {"model": "gpt-4o-mini", "instructions": random.choice(personas), "input": f"question {i}"}
+        for i in range(n_requests)
+    ]
+
+    for label, scheduled in (("arbitrary order", False), ("prefix scheduled", True)):
+        with StubServer() as server:
+            server.route("POST", "/v1/responses", _make_caching_route())
+            client = AsyncOpenAI(base_url=server.base_url, api_key="stub")
+
+            start = time.perf_counter()
+            if scheduled:
+                scheduler = PrefixScheduler(client, concurrency=16, window=0.2)
+                await scheduler.run_batch([dict(job) for job in jobs])
+                stats = scheduler.stats()
+                await scheduler.aclose()
+            else:
+                semaphore = asyncio.Semaphore(16)
+                totals = {"input_tokens": 0, "cached_tokens": 0}
+
+                async def plain(params):
+                    async with semaphore:
+                        response = await client.responses.create(**params)
+                    totals["input_tokens"] += response.usage.input_tokens
+                    totals["cached_tokens"] += response.usage.input_tokens_details.cached_tokens
+
+                await asyncio.gather(*(plain(job) for job in jobs))
+                stats = dict(totals, cached_ratio=totals["cached_tokens"] / totals["input_tokens"])
+            elapsed = time.perf_counter() - start
+            await client.close()
+
+        print(f"{label:<18} cached ratio {stats['cached_ratio']:6.1%}   wall {elapsed:6.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(_bench())
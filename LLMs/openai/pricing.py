@@ -0,0 +1,32 @@
+"""
+Model prices used for local cost estimates.
+
+USD per 1M tokens: (input, cached input, output).
+Keep in sync with https://openai.com/api/pricing when models are added.
+"""
+
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "o4-mini": (1.10, 0.275, 4.40),
+}
+
+
+def price_for(model):
+    """Look up a model, falling back to its base name for dated snapshots."""
+    if model in PRICES:
+        return PRICES[model]
+    for name in sorted(PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            return PRICES[name]
+    return (0.0, 0.0, 0.0)
+
+
+def cost_of(model, input_tokens, output_tokens, cached_tokens=0):
+    """Dollar cost of one call. Cached tokens are part of input_tokens."""
+    input_price, cached_price, output_price = price_for(model)
+    uncached = input_tokens - cached_tokens
+    return (uncached * input_price + cached_tokens * cached_price + output_tokens * output_price) / 1_000_000
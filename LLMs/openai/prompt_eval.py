@@ -0,0 +1,364 @@
+"""
+Prompt evaluation harness
+=========================
+
+Compares the prompting techniques in LLMs/prompts/ (zero-shot, few-shot,
+chain of thought, persona) on our own tasks - accuracy, token cost and
+latency - instead of hand-running main.py.
+
+Every (variant, case) pair is sent concurrently through AsyncOpenAI.
+Each finished call is appended to a JSONL checkpoint keyed by a hash of the
+rendered prompt, so:
+- a crashed or interrupted run picks up where it stopped
+- the same prompt is never paid for twice, even across runs
+
+Dataset format (JSONL), one case per line:
+    {"id": "q1", "input": "What is 60 * 3?", "expected": "180"}
+
+Usage:
+    python prompt_eval.py cases.jsonl --variants zero,few,cot,persona --scorer number
+    python prompt_eval.py --stub          # demo against the local stub server
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+
+from pricing import cost_of
+
+# =============================================================================
+# PROMPT VARIANTS
+# =============================================================================
+# A variant turns one case into (instructions, input) for responses.create.
+
+FEW_SHOT_EXAMPLES = [
+    ("If a train travels at 60 miles per hour for 3 hours, how far does it go?", "180"),
+    ("Sarah has 5 apples. She gives 2 to Tom and buys 4 more. How many apples does she have now?", "7"),
+]
+
+
+def zero_shot(case):
+    return None, case["input"]
+
+
+def few_shot(case):
+    shots = "\n\n".join(f"Q: {q}\nA: {a}" for q, a in FEW_SHOT_EXAMPLES)
+    return None, f"{shots}\n\nQ: {case['input']}\nA:"
+
+
+def chain_of_thought(case):
+    return (
+        "Reason step by step, then give the final answer on the last line as 'Answer: <answer>'.",
+        f"Q: {case['input']}\nLet's think step by step.",
+    )
+
+
+def persona(case):
+    return (
+        "You are a careful math teacher. Answer with only the final answer.",
+        case["input"],
+    )
+
+
+VARIANTS = {
+    "zero": zero_shot,
+    "few": few_shot,
+    "cot": chain_of_thought,
+    "persona": persona,
+}
+
+# =============================================================================
+# SCORERS
+# =============================================================================
+# A scorer gets (output_text, expected) and returns a float between 0 and 1.
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def _final_line(text):
+    lines = [line for line in text.strip().splitlines() if line.strip()]
+    last = lines[-1] if lines else ""
+    return last.split("Answer:", 1)[-1].strip()
+
+
+def score_exact(output, expected):
+    return float(_final_line(output).lower().rstrip(".") == str(expected).lower())
+
+
+def score_contains(output, expected):
+    return float(str(expected).lower() in output.lower())
+
+
+def score_number(output, expected):
+    numbers = _NUMBER.findall(_final_line(output)) or _NUMBER.findall(output)
+    if not numbers:
+        return 0.0
+    return float(abs(float(numbers[-1]) - float(expected)) < 1e-6)
+
+
+SCORERS = {
+    "exact": score_exact,
+    "contains": score_contains,
+    "number": score_number,
+}
+
+# =============================================================================
+# CHECKPOINT / CACHE
+# =============================================================================
+
+
+def cache_key(model, instructions, prompt):
+    raw = json.dumps([model, instructions, prompt], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Checkpoint:
+    """Append-only JSONL of finished calls, loaded back into a dict on start."""
+
+    def __init__(self, path):
+        self.path = path
+        self.results = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # half-written last line of a killed run
+                    self.results[record["key"]] = record
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def add(self, record):
+        self.results[record["key"]] = record
+        if self._file:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+
+
+def _retryable(exc):
+    import openai
+
+    # connection drops, 429 and 5xx; a 400/401/404 fails the same way every time
+    return isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+
+async def _call(client, model, instructions, prompt, max_retries):
+    for attempt in range(max_retries + 1):
+        start = time.perf_counter()
+        try:
+            response = await client.responses.create(
+                model=model, instructions=instructions, input=prompt
+            )
+        except Exception as exc:
+            if attempt == max_retries or not _retryable(exc):
+                raise
+            await asyncio.sleep(0.5 * 2 ** attempt)
+            continue
+        latency = time.perf_counter() - start
+        usage = response.usage
+        cached = usage.input_tokens_details.cached_tokens if usage.input_tokens_details else 0
+        return {
+            "output": response.output_text,
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "cached_tokens": cached,
+            "latency": latency,
+        }
+
+
+async def run_eval(client, cases, variants, model="gpt-4o-mini", scorer=score_exact,
+                   concurrency=64, checkpoint_path=None, max_retries=2, progress=True):
+    """
+    Run every variant on every case and return the list of result records.
+
+    `variants` is {name: fn(case) -> (instructions, input)}
+    `scorer` is fn(output_text, expected) -> float
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    semaphore = asyncio.Semaphore(concurrency)
+    records = []
+    done = 0
+    total = len(cases) * len(variants)
+
+    async def run_one(variant_name, render, case):
+        nonlocal done
+        instructions, prompt = render(case)
+        key = cache_key(model, instructions, prompt)
+        result = checkpoint.get(key)
+
+        if result is None:
+            async with semaphore:
+                try:
+                    result = await _call(client, model, instructions, prompt, max_retries)
+                except Exception as e:
+                    result = {"error": repr(e)}
+            if "error" not in result:
+                result["key"] = key
+                checkpoint.add(result)
+            else:
+                result["key"] = key
+
+        record = dict(result)
+        record.update({"variant": variant_name, "case_id": case.get("id"), "model": model})
+        record["score"] = scorer(record["output"], case["expected"]) if "output" in record else 0.0
+        records.append(record)
+
+        done += 1
+        if progress and (done % 100 == 0 or done == total):
+            print(f"\r{done}/{total} done", end="", flush=True)
+
+    try:
+        await asyncio.gather(*(
+            run_one(name, render, case)
+            for name, render in variants.items()
+            for case in cases
+        ))
+    finally:
+        checkpoint.close()
+    if progress:
+        print()
+    return records
+
+
+# =============================================================================
+# REPORT
+# =============================================================================
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = (len(ordered) - 1) * pct / 100
+    low = int(index)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (index - low)
+
+
+def summarize(records):
+    """Group records by variant: {variant: {accuracy, tokens, latency, cost, ...}}."""
+    by_variant = {}
+    for record in records:
+        by_variant.setdefault(record["variant"], []).append(record)
+
+    report = {}
+    for variant, rows in by_variant.items():
+        ok = [r for r in rows if "error" not in r]
+        latencies = [r["latency"] for r in ok]
+        report[variant] = {
+            "cases": len(rows),
+            "errors": len(rows) - len(ok),
+            "accuracy": sum(r["score"] for r in rows) / len(rows),
+            "input_tokens": sum(r["input_tokens"] for r in ok),
+            "output_tokens": sum(r["output_tokens"] for r in ok),
+            "p50_latency": percentile(latencies, 50),
+            "p95_latency": percentile(latencies, 95),
+            "cost": sum(
+                cost_of(r["model"], r["input_tokens"], r["output_tokens"], r["cached_tokens"])
+                for r in ok
+            ),
+        }
+    return report
+
+
+def print_report(report):
+    header = f"{'variant':<10}{'acc':>7}{'in tok':>10}{'out tok':>10}{'p50 s':>8}{'p95 s':>8}{'cost $':>10}{'err':>5}"
+    print(header)
+    print("-" * len(header))
+    for variant, row in sorted(report.items(), key=lambda item: -item[1]["accuracy"]):
+        print(
+            f"{variant:<10}{row['accuracy']:>7.1%}{row['input_tokens']:>10}{row['output_tokens']:>10}"
+            f"{row['p50_latency']:>8.3f}{row['p95_latency']:>8.3f}{row['cost']:>10.4f}{row['errors']:>5}"
+        )
+
+
+def load_cases(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+
+def _stub_cases(n):
+    return [{"id": f"q{i}", "input": f"What is {i} + {i}?", "expected": str(2 * i)} for i in range(n)]
+
+
+def _stub_route(req):
+    # Answers correctly when asked to think step by step, sometimes otherwise
+    from stub_server import fake_response, _input_text
+
+    body = req.json()
+    text = _input_text(body)
+    numbers = [int(n) for n in re.findall(r"What is (\d+) \+ (\d+)", text)[-1]]
+    answer = sum(numbers)
+    if "step by step" not in text and answer % 3 == 0:
+        answer += 1
+    return 200, fake_response(f"Answer: {answer}", input_tokens=len(text) // 4)
+
+
+async def _main(args):
+    from openai import AsyncOpenAI
+
+    variants = {name: VARIANTS[name] for name in args.variants.split(",")}
+    scorer = SCORERS[args.scorer]
+
+    if args.stub:
+        from stub_server import StubServer
+
+        server = StubServer(latency=lambda: 0.01).start()
+        server.route("POST", "/v1/responses", _stub_route)
+        client = AsyncOpenAI(base_url=server.base_url, api_key="stub")
+        cases = _stub_cases(args.stub_cases)
+    else:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        client = AsyncOpenAI()
+        cases = load_cases(args.dataset)
+
+    start = time.perf_counter()
+    records = await run_eval(
+        client, cases, variants, model=args.model, scorer=scorer,
+        concurrency=args.concurrency, checkpoint_path=args.checkpoint,
+    )
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(records)} calls in {elapsed:.1f}s\n")
+    print_report(summarize(records))
+
+    if args.stub:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare prompting techniques on a dataset")
+    parser.add_argument("dataset", nargs="?", help="JSONL file of {id, input, expected}")
+    parser.add_argument("--variants", default="zero,few,cot,persona")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--scorer", default="number", choices=sorted(SCORERS))
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--checkpoint", default=None, help="JSONL file for cache/resume")
+    parser.add_argument("--stub", action="store_true", help="run against the local stub server")
+    parser.add_argument("--stub-cases", type=int, default=1000)
+    args = parser.parse_args()
+    if not args.stub and not args.dataset:
+        parser.error("dataset is required unless --stub is given")
+    asyncio.run(_main(args))
@@ -0,0 +1,454 @@
+"""
+Parallel document chunking for RAG ingestion
+============================================
+
+Turns raw documents into prompt-sized, de-duplicated chunks and feeds them to
+`client.embeddings.create()` - the embedding step of the retrieval flow in
+LLMs/notes.md (section 10 "What is Vector Embeddings?").
+
+    files --mmap--> spans --process pool--> chunks --dedupe--> embedding batches
+                   (byte ranges)       (token-aware, overlap)   (bounded inputs/tokens)
+
+- Files are never read into one Python string. The parent mmaps each file
+  and cuts it into spans of about `span_bytes` at paragraph breaks. Only the
+  (path, start, end) triple goes to a worker, which maps the same file and
+  decodes just its own span
+- Workers split spans into paragraphs, then sentences, then words, then
+  characters (only when a piece is still too long) and pack them into chunks
+  of at most `max_tokens` tokens. The last `overlap_tokens` of every chunk are repeated at
+  the start of the next one
+- Every chunk is hashed (blake2b of whitespace-normalised text), and the
+  parent keeps the 8-byte digests of the last `max_seen` chunks, so mirrored
+  or repeated content is embedded once (within that window)
+- At most `workers * 2` spans are in flight and embedding batches are capped by
+  count and by tokens, so memory stays flat whatever the corpus size
+
+Token counts come from `tokenizer.BPETokenizer` when a rank file is given,
+otherwise from a bytes/4 estimate.
+
+Usage:
+    for batch, response in ingest(["docs/"], client=client, ranks_path="cl100k_base.tiktoken"):
+        store(batch, response.data)
+
+Run `python rag_ingest.py --gb 2` for the documents/sec and peak RSS benchmark.
+"""
+
+import argparse
+import hashlib
+import mmap
+import os
+import re
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+MAX_INPUTS_PER_REQUEST = 2048        # embeddings API limits
+MAX_TOKENS_PER_REQUEST = 300_000
+
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+_SPACE = re.compile(r"\s+")
+
+
+class Chunk:
+    __slots__ = ("digest", "text", "tokens", "source", "offset")
+
+    def __init__(self, digest, text, tokens, source, offset):
+        self.digest = digest
+        self.text = text
+        self.tokens = tokens
+        self.source = source
+        self.offset = offset   # byte offset of the span the chunk came from
+
+    def __repr__(self):
+        return f"Chunk({self.source}@{self.offset}, {self.tokens} tokens)"
+
+
+# =============================================================================
+# SPANS (parent side)
+# =============================================================================
+
+
+def iter_files(paths, suffixes=(".txt", ".md")):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.endswith(suffixes):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def iter_spans(path, span_bytes=4 * 2**20):
+    """(path, start, end) byte ranges that end on a paragraph break where possible."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    if size <= span_bytes:
+        yield path, 0, size
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = start + span_bytes
+            if end >= size:
+                end = size
+            else:
+                limit = min(size, end + span_bytes // 4)
+                cut = mm.find(b"\n\n", end, limit)
+                if cut == -1:
+                    cut = mm.find(b"\n", end, limit)
+                if cut != -1:
+                    end = cut + 1
+                # Never cut inside a UTF-8 sequence
+                while end < size and (mm[end] & 0xC0) == 0x80:
+                    end += 1
+            yield path, start, end
+            start = end
+
+
+# =============================================================================
+# CHUNKING (worker side)
+# =============================================================================
+
+
+def approx_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class Chunker:
+    def __init__(self, max_tokens=512, overlap_tokens=64, count_tokens=None):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = count_tokens or approx_tokens
+
+    def _units(self, text):
+        """Paragraphs, broken down to sentences and words only when too long."""
+        for paragraph in _PARAGRAPH.split(text):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            n = self.count_tokens(paragraph)
+            if n <= self.max_tokens:
+                yield paragraph, n
+                continue
+            for sentence in _SENTENCE.split(paragraph):
+                n = self.count_tokens(sentence)
+                if n <= self.max_tokens:
+                    yield sentence, n
+                    continue
+                words = sentence.split()
+                step = max(1, len(words) * self.max_tokens // n // 2)
+                for i in range(0, len(words), step):
+                    piece = " ".join(words[i:i + step])
+                    n = self.count_tokens(piece)
+                    if n <= self.max_tokens:
+                        yield piece, n
+                    else:
+                        yield from self._hard_split(piece, n)
+
+    def _hard_split(self, text, n):
+        """Character slices of a piece with no usable break (a URL, base64, a minified line)."""
+        step = max(1, len(text) * self.max_tokens // n // 2)
+        for i in range(0, len(text), step):
+            piece = text[i:i + step]
+            n = self.count_tokens(piece)
+            if n > self.max_tokens and len(piece) > 1:
+                yield from self._hard_split(piece, n)
+            else:
+                yield piece, n
+
+    def _tail(self, unit, budget):
+        """The most trailing words of `unit` that fit in `budget` tokens."""
+        words = unit.split()
+        best, best_n = "", 0
+        lo, hi = 1, len(words)
+        while lo <= hi:   # more words never means fewer tokens: binary search the count
+            mid = (lo + hi) // 2
+            tail = " ".join(words[-mid:])
+            n = self.count_tokens(tail)
+            if n <= budget:
+                best, best_n = tail, n
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return best, best_n
+
+    def split(self, text):
+        """Yield (chunk_text, tokens)."""
+        window = deque()   # (unit, tokens) of the chunk being built
+        size = 0
+        for unit, n in self._units(text):
+            if window and size + n > self.max_tokens:
+                yield "\n\n".join(u for u, _ in window), size
+                # Carry the tail of this chunk over as overlap: whole units,
+                # then the last words of the unit that doesn't fit whole
+                budget = min(self.overlap_tokens, self.max_tokens - n)
+                carried = 0
+                keep = deque()
+                while window and carried + window[-1][1] <= budget:
+                    u, un = window.pop()
+                    keep.appendleft((u, un))
+                    carried += un
+                if window and carried < budget:
+                    tail, tn = self._tail(window[-1][0], budget - carried)
+                    if tail:
+                        keep.appendleft((tail, tn))
+                        carried += tn
+                window = keep
+                size = carried
+            window.append((unit, n))
+            size += n
+        if window:
+            yield "\n\n".join(u for u, _ in window), size
+
+
+def chunk_digest(text):
+    return hashlib.blake2b(_SPACE.sub(" ", text).strip().lower().encode("utf-8"), digest_size=8).digest()
+
+
+# One Chunker per worker process, built once by the pool initializer
+_worker_chunker = None
+
+
+def _init_worker(max_tokens, overlap_tokens, ranks_path):
+    global _worker_chunker
+    count_tokens = None
+    if ranks_path:
+        from tokenizer import BPETokenizer
+
+        count_tokens = BPETokenizer.from_file(ranks_path).count_tokens
+    _worker_chunker = Chunker(max_tokens, overlap_tokens, count_tokens)
+
+
+def _chunk_span(span):
+    path, start, end = span
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode("utf-8", errors="replace")
+    return [
+        (chunk_digest(chunk), chunk, tokens, path, start)
+        for chunk, tokens in _worker_chunker.split(text)
+    ]
+
+
+# =============================================================================
+# PIPELINE
+# =============================================================================
+
+
+class RecentDigests:
+    """The last `capacity` digests: a set for lookups, a FIFO for eviction."""
+
+    def __init__(self, capacity=1_000_000):
+        self.capacity = capacity
+        self._set = set()
+        self._order = deque()
+
+    def __contains__(self, digest):
+        return digest in self._set
+
+    def add(self, digest):
+        self._set.add(digest)
+        self._order.append(digest)
+        if len(self._order) > self.capacity:
+            self._set.discard(self._order.popleft())
+
+    def __len__(self):
+        return len(self._set)
+
+
+class IngestStats:
+    def __init__(self):
+        self.documents = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.duplicates = 0
+        self.tokens = 0
+        self.batches = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def iter_chunks(paths, max_tokens=512, overlap_tokens=64, ranks_path=None, workers=None,
+                span_bytes=4 * 2**20, stats=None, seen=None, max_seen=1_000_000):
+    """Unique chunks of every file under paths, chunked in a process pool."""
+    workers = workers or os.cpu_count() or 1
+    stats = stats if stats is not None else IngestStats()
+    seen = seen if seen is not None else RecentDigests(max_seen)   # 8-byte digests, ~100 bytes each
+    if workers <= 1:
+        _init_worker(max_tokens, overlap_tokens, ranks_path)
+
+    def spans():
+        for path in iter_files(paths):
+            stats.documents += 1
+            for span in iter_spans(path, span_bytes):
+                stats.bytes += span[2] - span[1]
+                yield span
+
+    def emit(results):
+        for digest, text, tokens, source, offset in results:
+            if digest in seen:
+                stats.duplicates += 1
+                continue
+            seen.add(digest)
+            stats.chunks += 1
+            stats.tokens += tokens
+            yield Chunk(digest, text, tokens, source, offset)
+
+    if workers <= 1:
+        for span in spans():
+            yield from emit(_chunk_span(span))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(max_tokens, overlap_tokens, ranks_path)) as pool:
+        # Bounded window of in-flight spans, consumed in submission order
+        pending = deque()
+        for span in spans():
+            pending.append(pool.submit(_chunk_span, span))
+            if len(pending) >= workers * 2:
+                yield from emit(pending.popleft().result())
+        while pending:
+            yield from emit(pending.popleft().result())
+
+
+def iter_batches(chunks, max_inputs=256, max_tokens=MAX_TOKENS_PER_REQUEST // 3):
+    """Group chunks into embedding requests bounded by input count and tokens."""
+    max_inputs = min(max_inputs, MAX_INPUTS_PER_REQUEST)
+    batch = []
+    tokens = 0
+    for chunk in chunks:
+        if batch and (len(batch) >= max_inputs or tokens + chunk.tokens > max_tokens):
+            yield batch
+            batch = []
+            tokens = 0
+        batch.append(chunk)
+        tokens += chunk.tokens
+    if batch:
+        yield batch
+
+
+def ingest(paths, client=None, model=EMBEDDING_MODEL, batch_inputs=256, batch_tokens=MAX_TOKENS_PER_REQUEST // 3,
+           stats=None, **chunk_kwargs):
+    """
+    Yield (batch, embeddings response) per embedding request; with client=None
+    just yield (batch, None) so the caller can embed elsewhere.
+    """
+    stats = stats if stats is not None else IngestStats()
+    for batch in iter_batches(iter_chunks(paths, stats=stats, **chunk_kwargs), batch_inputs, batch_tokens):
+        stats.batches += 1
+        response = None
+        if client is not None:
+            response = client.embeddings.create(model=model, input=[chunk.text for chunk in batch])
+        yield batch, response
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+
+def _make_corpus(root, gb, doc_kb=256, duplicate_every=10):
+    """Synthetic corpus; every `duplicate_every`-th document is a mirror of an earlier one."""
+    import random
+
+    rng = random.Random(7)
+    words = ("token model embedding vector chunk retrieval prompt context latency batch "
+             "answer question document search index memory cache stream process worker").split()
+    target = int(gb * 2**30)
+    os.makedirs(root, exist_ok=True)
+    written = 0
+    n = 0
+    while written < target:
+        path = os.path.join(root, f"doc_{n:06d}.txt")
+        if n and n % duplicate_every == 0:
+            shutil.copyfile(os.path.join(root, f"doc_{rng.randrange(n):06d}.txt"), path)
+            written += os.path.getsize(path)
+            n += 1
+            continue
+        paragraphs = []
+        size = 0
+        while size < doc_kb * 1024:
+            sentences = []
+            for _ in range(rng.randint(2, 6)):
+                sentence = " ".join(rng.choice(words) for _ in range(rng.randint(6, 20)))
+                sentences.append(f"{sentence.capitalize()} {n}-{size}.")
+            paragraph = " ".join(sentences) + "\n\n"
+            paragraphs.append(paragraph)
+            size += len(paragraph)
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(paragraphs)
+        written += size
+        n += 1
+    return n
+
+
+def _embeddings_route(req):
+    inputs = req.json()["input"]
+    return 200, {
+        "object": "list",
+        "model": EMBEDDING_MODEL,
+        "data": [{"object": "embedding", "index": i, "embedding": [0.0] * 8} for i in range(len(inputs))],
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    }
+
+
+def _bench(args):
+    import resource
+
+    import tempfile
+
+    root = args.corpus or tempfile.mkdtemp(prefix="rag_corpus_")
+    if not args.corpus:
+        start = time.perf_counter()
+        n = _make_corpus(root, args.gb)
+        print(f"generated {n} documents ({args.gb} GB) in {time.perf_counter() - start:.1f}s")
+
+    server = client = None
+    if args.stub:
+        from openai import OpenAI
+
+        from stub_server import StubServer
+
+        server = StubServer().start()
+        server.route("POST", "/v1/embeddings", _embeddings_route)
+        client = OpenAI(base_url=server.base_url, api_key="stub")
+
+    stats = IngestStats()
+    start = time.perf_counter()
+    try:
+        for _ in ingest([root], client=client, stats=stats, max_tokens=args.max_tokens,
+                        overlap_tokens=args.overlap, ranks_path=args.ranks, workers=args.workers):
+            pass
+    finally:
+        if server is not None:
+            server.stop()
+        if not args.corpus:
+            shutil.rmtree(root)
+    elapsed = time.perf_counter() - start
+
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"{stats.documents} documents, {stats.bytes / 2**30:.2f} GB in {elapsed:.1f}s")
+    print(f"  {stats.documents / elapsed:,.0f} documents/s   {stats.bytes / 2**20 / elapsed:,.0f} MB/s")
+    print(f"  {stats.chunks:,} chunks ({stats.duplicates:,} duplicates dropped), "
+          f"{stats.tokens:,} tokens, {stats.batches:,} embedding batches")
+    print(f"  peak RSS: parent {own:.0f} MB" + (f", largest worker {children:.0f} MB" if children else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel RAG chunking benchmark")
+    parser.add_argument("--gb", type=float, default=1.0, help="size of the synthetic corpus")
+    parser.add_argument("--corpus", default=None, help="chunk this directory instead of a synthetic corpus")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--overlap", type=int, default=64)
+    parser.add_argument("--ranks", default=None, help="tiktoken rank file for exact token counts")
+    parser.add_argument("--stub", action="store_true", help="also send embedding batches to the stub server")
+    _bench(parser.parse_args())
@@ -0,0 +1,297 @@
+"""
+Latency-aware multi-model router
+================================
+
+Spreads `responses.create` traffic over several backends (models, regions,
+OpenAI and Azure OpenAI) and picks one per request from live numbers instead
+of a hard-coded `model=`:
+
+- EWMA of latency and of error rate per backend
+- a per-backend concurrency cap, so one fast backend isn't swamped; when
+  every backend is at its cap, a request waits up to `queue_timeout` for a slot
+- on timeouts, connection errors, 429 and 5xx the request fails over to the
+  next best backend - the caller just gets a response
+- each backend's `model` is used unless the caller passes `model=` itself, in
+  which case that model is sent to whichever backend is picked
+
+The router looks like a client, so main.py only changes where `client` comes from:
+
+    client = build_default_router()
+    response = client.responses.create(input="give me a word start with letter P")
+
+With several backends, build them with `max_retries=0` - retrying is the
+router's job, and it retries somewhere else. A single backend keeps the SDK's
+own retries, since there is nowhere else to go.
+
+`router.metrics()` / `router.prometheus_text()` export the decisions.
+Run `python router.py` to see it route around stub backends that slow down and fail.
+"""
+
+import os
+import random
+import threading
+import time
+
+import openai
+
+FAILOVER_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+# =============================================================================
+# BACKEND
+# =============================================================================
+
+
+class Backend:
+    def __init__(self, name, client, model, max_concurrency=32, weight=1.0):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.weight = weight
+
+        self.ewma_latency = None   # seconds, None until the first response
+        self.ewma_error = 0.0      # 0..1
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+        self.chosen = 0
+        self.last_error_at = 0.0
+
+    def score(self, error_penalty):
+        # Lower is better. Unmeasured backends look fast so they get tried;
+        # one that has only failed is scored by how long its failures took
+        latency = self.ewma_latency if self.ewma_latency is not None else 0.0
+        load = 1 + self.inflight / self.max_concurrency
+        return latency * load * (1 + error_penalty * self.ewma_error) / self.weight
+
+
+# =============================================================================
+# ROUTER
+# =============================================================================
+
+
+class _Responses:
+    def __init__(self, router):
+        self._router = router
+
+    def create(self, **params):
+        return self._router.call(lambda client, **p: client.responses.create(**p), **params)
+
+
+class Router:
+    def __init__(self, backends, alpha=0.2, error_penalty=20.0, explore=0.02,
+                 cooldown=5.0, max_attempts=None, queue_timeout=30.0):
+        self.backends = list(backends)
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.explore = explore
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts or len(self.backends)
+        self.queue_timeout = queue_timeout
+        self.failovers = 0
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+        self.responses = _Responses(self)
+
+    def _pick(self, exclude, deadline):
+        """Best backend not in exclude; waits for a free slot until deadline. None if there's none."""
+        with self._slot_free:
+            while True:
+                remaining = [b for b in self.backends if b.name not in exclude]
+                candidates = [b for b in remaining if b.inflight < b.max_concurrency]
+                if candidates or not remaining:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._slot_free.wait(timeout)
+            if not candidates:
+                return None
+            now = time.monotonic()
+
+            # Occasionally probe a random backend so a recovered one gets re-measured
+            if random.random() < self.explore:
+                backend = random.choice(candidates)
+            else:
+                # Skip backends that just failed, unless nothing else is left
+                healthy = [b for b in candidates if now - b.last_error_at > self.cooldown] or candidates
+                backend = min(healthy, key=lambda b: b.score(self.error_penalty))
+
+            backend.inflight += 1
+            backend.chosen += 1
+            if exclude:
+                self.failovers += 1
+            return backend
+
+    def _done(self, backend, latency=None, failed=False):
+        with self._lock:
+            backend.inflight -= 1
+            self._slot_free.notify_all()   # waiters may exclude different backends
+            backend.requests += 1
+            backend.ewma_error = (1 - self.alpha) * backend.ewma_error + self.alpha * float(failed)
+            if failed:
+                backend.errors += 1
+                backend.last_error_at = time.monotonic()
+                if backend.ewma_latency is None:
+                    # Never answered: a 30 s timeout must not look like 0 s
+                    backend.ewma_latency = latency
+            else:
+                if backend.ewma_latency is None:
+                    backend.ewma_latency = latency
+                else:
+                    backend.ewma_latency = (1 - self.alpha) * backend.ewma_latency + self.alpha * latency
+
+    def call(self, fn, **params):
+        """Run fn(client, **params) on the best backend, failing over on transient errors."""
+        tried = set()
+        last_error = None
+        deadline = time.monotonic() + self.queue_timeout
+        for attempt in range(self.max_attempts):
+            backend = self._pick(tried, deadline)
+            if backend is None:
+                break
+            tried.add(backend.name)
+
+            start = time.monotonic()
+            try:
+                result = fn(backend.client, **{"model": backend.model, **params})
+            except FAILOVER_ERRORS as e:
+                self._done(backend, latency=time.monotonic() - start, failed=True)
+                last_error = e
+                continue
+            except Exception:
+                # 4xx and friends are the caller's problem, not the backend's
+                self._done(backend, latency=time.monotonic() - start)
+                raise
+            self._done(backend, latency=time.monotonic() - start)
+            return result
+
+        if last_error is not None:
+            raise last_error
+        raise NoBackendAvailable(f"no backend had a free slot within {self.queue_timeout}s")
+
+    # -------------------------------------------------------------------------
+    # metrics
+    # -------------------------------------------------------------------------
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "failovers": self.failovers,
+                "backends": {
+                    b.name: {
+                        "model": b.model,
+                        "chosen": b.chosen,
+                        "requests": b.requests,
+                        "errors": b.errors,
+                        "inflight": b.inflight,
+                        "ewma_latency": b.ewma_latency,
+                        "ewma_error": b.ewma_error,
+                    }
+                    for b in self.backends
+                },
+            }
+
+    def prometheus_text(self):
+        m = self.metrics()
+        lines = [f"router_failovers_total {m['failovers']}"]
+        for name, b in m["backends"].items():
+            label = f'{{backend="{name}",model="{b["model"]}"}}'
+            lines.append(f"router_chosen_total{label} {b['chosen']}")
+            lines.append(f"router_errors_total{label} {b['errors']}")
+            lines.append(f"router_inflight{label} {b['inflight']}")
+            lines.append(f"router_ewma_latency_seconds{label} {b['ewma_latency'] or 0}")
+            lines.append(f"router_ewma_error_ratio{label} {b['ewma_error']}")
+        return "\n".join(lines) + "\n"
+
+
+def build_default_router():
+    """OpenAI gpt-4o-mini, plus Azure OpenAI when AZURE_OPENAI_ENDPOINT is set."""
+    with_azure = bool(os.environ.get("AZURE_OPENAI_ENDPOINT"))
+    # Alone, the OpenAI backend keeps the SDK's default retries (2)
+    retries = 0 if with_azure else openai.DEFAULT_MAX_RETRIES
+    backends = [
+        Backend("openai-4o-mini", openai.OpenAI(max_retries=retries, timeout=30), "gpt-4o-mini"),
+    ]
+    if with_azure:
+        azure = openai.AzureOpenAI(
+            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+            api_version=os.environ.get("OPENAI_API_VERSION", "2025-03-01-preview"),
+            max_retries=0,
+            timeout=30,
+        )
+        deployment = os.environ.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o-mini")
+        backends.append(Backend("azure-" + deployment, azure, deployment))
+    return Router(backends)
+
+
+# =============================================================================
+# DEMO: three stub backends, one slows down, one starts failing
+# =============================================================================
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    from stub_server import StubServer
+
+    slow = {"on": False}
+    broken = {"on": False}
+
+    fast_server = StubServer(latency=lambda: 0.02).start()
+    flaky_server = StubServer(latency=lambda: 0.01).start()
+    slowing_server = StubServer(latency=lambda: 0.3 if slow["on"] else 0.005).start()
+
+    default_route = flaky_server.routes[("POST", "/v1/responses")]
+
+    def flaky_route(req):
+        if broken["on"]:
+            return 503, {"error": {"message": "backend overloaded"}}
+        return default_route(req)
+
+    flaky_server.route("POST", "/v1/responses", flaky_route)
+
+    def stub_client(server):
+        return openai.OpenAI(base_url=server.base_url, api_key="stub", max_retries=0, timeout=2)
+
+    router = Router([
+        Backend("fast", stub_client(fast_server), "gpt-4o-mini", max_concurrency=8),
+        Backend("flaky", stub_client(flaky_server), "gpt-4.1-mini", max_concurrency=8),
+        Backend("slowing", stub_client(slowing_server), "gpt-4.1-nano", max_concurrency=8),
+    ])
+
+    def one(i):
+        router.responses.create(input=f"question {i}")
+
+    def phase(label, n=400):
+        before = {name: b["chosen"] for name, b in router.metrics()["backends"].items()}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(16) as pool:
+            list(pool.map(one, range(n)))
+        elapsed = time.perf_counter() - start
+        after = router.metrics()
+        share = {name: after["backends"][name]["chosen"] - before[name] for name in before}
+        print(f"{label:<28} {n / elapsed:6.0f} req/s   picks {share}   failovers {after['failovers']}")
+
+    phase("all healthy")
+    slow["on"] = True
+    phase("'slowing' adds 300 ms")
+    broken["on"] = True
+    phase("'flaky' returns 503")
+    slow["on"] = broken["on"] = False
+    phase("all recovered")
+
+    print()
+    print(router.prometheus_text())
+
+    for server in (fast_server, flaky_server, slowing_server):
+        server.stop()
@@ -0,0 +1,305 @@
+"""
+Bounded, instrumented schema caches for the SDK
+===============================================
+
+Inside the SDK:
+- `openai._models` wraps pydantic's `TypeAdapter` in `lru_cache(maxsize=None)`
+- `openai._utils._transform.get_type_hints` / `_get_annotated_type` use
+  `lru_cache(maxsize=8096)`
+
+In a long-running multi-tenant service every dynamic `response_format` or tool
+schema becomes a new key in the unbounded adapter cache, and memory grows for
+days. `install()` swaps those module-level caches for `BoundedCache`:
+
+- LRU eviction by entry count and (estimated) bytes
+- `stats()` for hits / misses / evictions / size, e.g. for a /metrics page
+- `warm_up()` pre-builds adapters and type hints for the SDK's hot types, or
+  for a JSON manifest of dotted type paths, at startup
+
+Sharing across worker processes: Python objects can't be shared between
+processes, but pages can. Call `install()` + `warm_up()` in the parent before
+forking workers (gunicorn `--preload`, multiprocessing "fork"), then
+`gc.freeze()`, and every worker starts with the same pre-built adapters in
+copy-on-write memory instead of building its own.
+
+Usage:
+    import schema_cache
+    schema_cache.install(adapter_maxsize=2048, max_bytes=64 * 2**20)
+    schema_cache.warm_up()
+    print(schema_cache.stats())
+
+Run `python schema_cache.py` for the 100k-distinct-schema soak benchmark.
+"""
+
+import importlib
+import json
+import sys
+import threading
+import typing
+from collections import OrderedDict
+
+# Unions the SDK validates through TypeAdapter, plus the params TypedDicts
+# whose type hints are walked on every request
+HOT_TYPES = [
+    "openai.types.responses.response_stream_event.ResponseStreamEvent",
+    "openai.types.responses.response_output_item.ResponseOutputItem",
+    "openai.types.responses.response_input_item_param.ResponseInputItemParam",
+    "openai.types.conversations.conversation_item.ConversationItem",
+    "openai.types.webhooks.unwrap_webhook_event.UnwrapWebhookEvent",
+]
+HOT_PARAM_TYPES = [
+    "openai.types.responses.response_create_params.ResponseCreateParamsNonStreaming",
+    "openai.types.responses.response_create_params.ResponseCreateParamsStreaming",
+    "openai.types.chat.completion_create_params.CompletionCreateParamsNonStreaming",
+    "openai.types.chat.completion_create_params.CompletionCreateParamsStreaming",
+    "openai.types.embedding_create_params.EmbeddingCreateParams",
+]
+
+_MISSING = object()
+
+
+# =============================================================================
+# CACHE
+# =============================================================================
+
+
+class BoundedCache:
+    """Thread-safe LRU bounded by entry count and, optionally, estimated bytes."""
+
+    def __init__(self, name, maxsize=1024, max_bytes=None, sizeof=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: sys.getsizeof(value))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._data = OrderedDict()   # key -> (value, size)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._data[key] = (value, size)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (
+                self.max_bytes is not None and self.bytes > self.max_bytes and len(self._data) > 1
+            ):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def wrap(self, fn):
+        """Memoize fn(*args, **kwargs) through this cache, lru_cache style."""
+        cache = self
+
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+            try:
+                value = cache.get(key, _MISSING)
+            except TypeError:   # unhashable argument: don't cache, like lru_cache would fail
+                return fn(*args, **kwargs)
+            if value is _MISSING:
+                value = fn(*args, **kwargs)
+                cache.put(key, value)
+            return value
+
+        wrapper.__wrapped__ = fn
+        wrapper.__name__ = getattr(fn, "__name__", "cached")
+        wrapper.__doc__ = getattr(fn, "__doc__", None)
+        wrapper.cache = cache
+        wrapper.cache_info = cache.stats
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+
+def _adapter_size(adapter):
+    # The core schema dominates an adapter's footprint; its repr length is a
+    # cheap, monotonic proxy measured once per new schema
+    try:
+        return len(repr(adapter.core_schema)) * 2
+    except Exception:
+        return 4096
+
+
+# =============================================================================
+# INSTALL INTO THE SDK
+# =============================================================================
+
+_caches = {}
+
+
+def install(adapter_maxsize=1024, hints_maxsize=4096, max_bytes=None):
+    """Replace the SDK's module-level lru_caches with bounded, instrumented ones."""
+    import pydantic
+
+    from openai import _models
+    from openai._utils import _transform
+
+    if "type_adapter" in _caches:
+        return _caches
+
+    adapters = BoundedCache("type_adapter", adapter_maxsize, max_bytes, sizeof=_adapter_size)
+    hints = BoundedCache("get_type_hints", hints_maxsize)
+    annotated = BoundedCache("annotated_type", hints_maxsize)
+
+    # Free whatever the unbounded cache has collected so far
+    old_adapter = getattr(_models, "_CachedTypeAdapter", None)
+    if old_adapter is not None and hasattr(old_adapter, "cache_clear"):
+        old_adapter.cache_clear()
+
+    _models.TypeAdapter = adapters.wrap(pydantic.TypeAdapter)
+    _transform.get_type_hints = hints.wrap(getattr(_transform.get_type_hints, "__wrapped__", _transform.get_type_hints))
+    _transform._get_annotated_type = annotated.wrap(
+        getattr(_transform._get_annotated_type, "__wrapped__", _transform._get_annotated_type)
+    )
+
+    _caches.update(type_adapter=adapters, get_type_hints=hints, annotated_type=annotated)
+    return _caches
+
+
+def type_adapter(tp):
+    """Cached TypeAdapter for app code (response_format / text_format schemas)."""
+    if "type_adapter" not in _caches:
+        install()
+    from openai import _models
+
+    return _models.TypeAdapter(tp)
+
+
+def stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+# =============================================================================
+# WARM-UP
+# =============================================================================
+
+
+def _resolve(path):
+    module_name, _, attr = path.rpartition(".")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def warm_up(manifest=None, freeze=False):
+    """
+    Pre-build adapters (HOT_TYPES) and type hints (HOT_PARAM_TYPES), plus any
+    types listed in a manifest file: {"adapters": [...], "type_hints": [...]}.
+    With freeze=True, gc.freeze() afterwards so forked workers keep sharing the pages.
+    """
+    install()
+    from openai import _models
+    from openai._utils import _transform
+
+    adapter_paths = list(HOT_TYPES)
+    hint_paths = list(HOT_PARAM_TYPES)
+    if manifest is not None:
+        with open(manifest, encoding="utf-8") as f:
+            data = json.load(f)
+        adapter_paths += data.get("adapters", [])
+        hint_paths += data.get("type_hints", [])
+
+    built = 0
+    for path in adapter_paths:
+        try:
+            _models.TypeAdapter(_resolve(path))
+            built += 1
+        except (ImportError, AttributeError):
+            pass   # type not in this SDK version
+    for path in hint_paths:
+        try:
+            tp = _resolve(path)
+        except (ImportError, AttributeError):
+            continue
+        _transform.get_type_hints(tp, include_extras=True)
+        for hint in typing.get_type_hints(tp, include_extras=True).values():
+            _transform._get_annotated_type(hint)
+        built += 1
+
+    if freeze:
+        import gc
+
+        gc.collect()
+        gc.freeze()
+    return built
+
+
+# =============================================================================
+# SOAK BENCHMARK
+# =============================================================================
+
+
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _soak(n_schemas=100_000, report_every=10_000, bounded=True):
+    import functools
+
+    import pydantic
+
+    if bounded:
+        factory = BoundedCache("soak", maxsize=1024, max_bytes=32 * 2**20, sizeof=_adapter_size).wrap(pydantic.TypeAdapter)
+    else:
+        factory = functools.lru_cache(maxsize=None)(pydantic.TypeAdapter)   # what the SDK does
+
+    label = "bounded" if bounded else "unbounded"
+    start_rss = _rss_mb()
+    for i in range(1, n_schemas + 1):
+        # A distinct tenant-defined structured-output schema per request
+        model = pydantic.create_model(f"Tenant{i}Answer", answer=(str, ...), score=(float, ...), tags=(typing.List[str], []))
+        factory(model).validate_python({"answer": "x", "score": 1.0})
+        if i % report_every == 0:
+            print(f"{label:<9} {i:7d} schemas  RSS +{_rss_mb() - start_rss:7.1f} MB")
+    if bounded:
+        print(factory.cache_info())
+
+
+if __name__ == "__main__":
+    import multiprocessing
+
+    # Separate processes so the two runs don't share heap growth
+    for bounded in (False, True):
+        p = multiprocessing.Process(target=_soak, kwargs={"bounded": bounded,
+                                                          "n_schemas": int(sys.argv[1]) if len(sys.argv) > 1 else 100_000})
+        p.start()
+        p.join()
@@ -0,0 +1,280 @@
+"""
+Local stub of the OpenAI HTTP API
+=================================
+
+A tiny threaded HTTP server that answers like api.openai.com so the tools in
+this folder can be run and benchmarked on a laptop with no key and no network.
+
+    with StubServer() as server:
+        client = OpenAI(base_url=server.base_url, api_key="stub")
+        print(client.responses.create(model="gpt-4o-mini", input="hi").output_text)
+
+Routes are plain functions, so every tool can plug in its own behaviour:
+
+    server.route("POST", "/v1/moderations", lambda req: (200, {...}))
+
+A route gets a `StubRequest` and returns `(status, json_body)`,
+`(status, json_body, headers)` or, for streaming, `(status, iterator_of_bytes, headers)`.
+`latency` is a function returning seconds to sleep before answering,
+which lets us inject slow backends and long tails.
+"""
+
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_ids = itertools.count(1)
+
+
+# =============================================================================
+# FAKE PAYLOADS
+# =============================================================================
+
+def fake_response(text, model="gpt-4o-mini", input_tokens=10, output_tokens=None,
+                  cached_tokens=0, status="completed", response_id=None, **extra):
+    """JSON body of a `Response` object with a single text message."""
+    if output_tokens is None:
+        output_tokens = max(1, len(text) // 4)
+    body = {
+        "id": response_id or f"resp_{next(_ids)}",
+        "object": "response",
+        "created_at": time.time(),
+        "model": model,
+        "status": status,
+        "output": [{
+            "id": f"msg_{next(_ids)}",
+            "type": "message",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": cached_tokens},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+    body.update(extra)
+    return body
+
+
+def sse_event(data, event=None):
+    """One server-sent event frame."""
+    frame = ""
+    if event:
+        frame += f"event: {event}\n"
+    frame += f"data: {json.dumps(data)}\n\n"
+    return frame.encode("utf-8")
+
+
+def _input_text(body):
+    """Flatten the `input` param of responses.create into plain text."""
+    value = body.get("input", "")
+    if isinstance(value, str):
+        return value
+    parts = []
+    for item in value:
+        content = item.get("content", "")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(c.get("text", "") for c in content if isinstance(c, dict))
+    return "\n".join(parts)
+
+
+def default_responses_route(req):
+    """Echo-style answer for POST /v1/responses."""
+    body = req.json()
+    prompt = (body.get("instructions") or "") + _input_text(body)
+    text = f"stub answer to: {prompt[-40:]}"
+    return 200, fake_response(text, model=body.get("model", "gpt-4o-mini"),
+                              input_tokens=max(1, len(prompt) // 4))
+
+
+# =============================================================================
+# SERVER
+# =============================================================================
+
+class StubRequest:
+    def __init__(self, method, path, query, headers, rfile, length):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self._rfile = rfile
+        self._remaining = length
+        self._body = None
+
+    @property
+    def body(self):
+        if self._body is None:
+            self._body = b"".join(self.iter_body())
+        return self._body
+
+    def iter_body(self, chunk_size=1024 * 1024):
+        """Stream the request body without holding it in memory (for big uploads)."""
+        while self._remaining > 0:
+            chunk = self._rfile.read(min(chunk_size, self._remaining))
+            if not chunk:
+                break
+            self._remaining -= len(chunk)
+            yield chunk
+
+    def json(self):
+        return json.loads(self.body or b"{}")
+
+
+class _Server(ThreadingHTTPServer):
+    # thousands of clients may connect at once (one pool per tenant, fan-out benchmarks)
+    request_queue_size = 1024
+
+
+class StubServer:
+    def __init__(self, latency=None, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.routes = {("POST", "/v1/responses"): default_responses_route}
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def route(self, method, path, fn):
+        self.routes[(method, path)] = fn
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _find_route(self, method, path):
+        fn = self.routes.get((method, path))
+        if fn is not None:
+            return fn
+        # Prefix routes end with "/*", e.g. "/v1/responses/*" for retrieve by id
+        for (m, p), fn in self.routes.items():
+            if m == method and p.endswith("/*") and path.startswith(p[:-1]):
+                return fn
+        return None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True   # headers and body go out in separate writes
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("content-length") or 0)
+                req = StubRequest(method, url.path, parse_qs(url.query), self.headers, self.rfile, length)
+                with server._lock:
+                    server.request_count += 1
+
+                fn = server._find_route(method, url.path)
+                if fn is None:
+                    for _ in req.iter_body():
+                        pass
+                    return self._send(404, {"error": {"message": f"no stub for {method} {url.path}"}})
+
+                if server.latency is not None:
+                    time.sleep(server.latency())
+
+                result = fn(req)
+                for _ in req.iter_body():
+                    pass  # drain whatever the route didn't read, keep-alive needs it
+                status, payload = result[0], result[1]
+                headers = result[2] if len(result) > 2 else {}
+                self._send(status, payload, headers)
+
+            def _send(self, status, payload, headers=None):
+                headers = dict(headers or {})
+                try:
+                    if isinstance(payload, (dict, list)):
+                        data = json.dumps(payload).encode("utf-8")
+                        headers.setdefault("content-type", "application/json")
+                    elif isinstance(payload, (bytes, bytearray)):
+                        data = bytes(payload)
+                    else:
+                        return self._send_chunked(status, payload, headers)
+
+                    self.send_response(status)
+                    for key, value in headers.items():
+                        self.send_header(key, value)
+                    self.send_header("content-length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _send_chunked(self, status, chunks, headers):
+                headers.setdefault("content-type", "text/event-stream")
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("transfer-encoding", "chunked")
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                        self.wfile.flush()
+                except ConnectionError:
+                    # Raised by a route to simulate a dropped connection mid-body
+                    self.close_connection = True
+                    try:
+                        self.connection.shutdown(2)
+                    except OSError:
+                        pass
+                    return
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import urllib.request
+
+    with StubServer() as server:
+        print(f"stub listening on {server.base_url}")
+        req = urllib.request.Request(
+            server.base_url + "/responses",
+            data=json.dumps({"model": "gpt-4o-mini", "input": "give me a word start with letter P"}).encode(),
+            headers={"content-type": "application/json"},
+        )
+        with urllib.request.urlopen(req) as resp:
+            print(json.loads(resp.read())["output"][0]["content"][0]["text"])
@@ -0,0 +1,305 @@
+"""
+Local byte-level BPE tokenizer
+==============================
+
+Counts and encodes tokens on our side before a request is sent, so prompts
+can be budgeted, trimmed and billed without a round trip.
+
+It reads the standard rank file format used by OpenAI encodings
+(`cl100k_base.tiktoken`, `o200k_base.tiktoken`): one line per token,
+"<base64 bytes> <rank>". The lower the rank, the earlier the merge.
+
+How encoding works (see LLMs/notes.md, section 9 "What is Tokenization?"):
+1. Pre-tokenize the text into word pieces with a regex ("Hello", ",", " world")
+2. Each piece is turned into bytes and merged pair by pair using the ranks
+3. The merged byte strings are looked up to get token ids
+
+Pieces repeat a lot in real text (" the", " and", "\\n"), so step 2 is cached
+in an LRU cache - most of the work after warm-up is just dictionary lookups.
+
+Usage:
+    tok = BPETokenizer.from_file("cl100k_base.tiktoken")
+    ids = tok.encode("give me a word start with letter P")
+    n = tok.count_tokens(prompt)              # no list of ids is built
+    batches = tok.encode_batch(texts, workers=4)
+
+Run `python tokenizer.py [rank_file]` for a MB/s benchmark.
+"""
+
+import base64
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+try:
+    # `regex` understands \p{L} so we can use the exact cl100k pattern
+    import regex as _regex
+except ImportError:
+    _regex = None
+
+# =============================================================================
+# PRE-TOKENIZER PATTERNS
+# =============================================================================
+
+# Exact pattern used by cl100k_base (needs the third-party `regex` module)
+CL100K_PATTERN = (
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}|"""
+    r""" ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
+)
+
+# Close approximation with the standard library `re` module
+# ([^\W\d_] is "a letter" in re)
+FALLBACK_PATTERN = (
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\w]?[^\W\d_]+|\d{1,3}|"""
+    r""" ?[^\s\w]+[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
+)
+
+
+def _compile_pattern(pattern=None):
+    if pattern is not None:
+        return (_regex or re).compile(pattern)
+    if _regex is not None:
+        return _regex.compile(CL100K_PATTERN)
+    return re.compile(FALLBACK_PATTERN)
+
+
+# =============================================================================
+# RANK FILES
+# =============================================================================
+
+def load_ranks(path):
+    """Read a `<base64 token> <rank>` file into {token_bytes: rank}."""
+    ranks = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            token, rank = line.split()
+            ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+def save_ranks(ranks, path):
+    """Write ranks in the same format `load_ranks` reads."""
+    with open(path, "wb") as f:
+        for token, rank in sorted(ranks.items(), key=lambda item: item[1]):
+            f.write(base64.b64encode(token) + b" " + str(rank).encode() + b"\n")
+
+
+def train_ranks(text, vocab_size=1000, pattern=None):
+    """
+    Learn a small rank table from text.
+
+    Only meant for demos and tests when no real rank file is around -
+    production counts should use the provider's own rank file.
+    """
+    ranks = {bytes([i]): i for i in range(256)}
+    regex = _compile_pattern(pattern)
+
+    # Count each distinct piece once instead of walking the whole text
+    words = {}
+    for piece in regex.findall(text):
+        key = tuple(bytes([b]) for b in piece.encode("utf-8"))
+        words[key] = words.get(key, 0) + 1
+
+    while len(ranks) < vocab_size:
+        pairs = {}
+        for word, freq in words.items():
+            for pair in zip(word, word[1:]):
+                pairs[pair] = pairs.get(pair, 0) + freq
+        if not pairs:
+            break
+
+        best = max(pairs, key=pairs.get)
+        merged = best[0] + best[1]
+        ranks[merged] = len(ranks)
+
+        new_words = {}
+        for word, freq in words.items():
+            out = []
+            i = 0
+            while i < len(word):
+                if i < len(word) - 1 and (word[i], word[i + 1]) == best:
+                    out.append(merged)
+                    i += 2
+                else:
+                    out.append(word[i])
+                    i += 1
+            new_words[tuple(out)] = freq
+        words = new_words
+
+    return ranks
+
+
+# =============================================================================
+# TOKENIZER
+# =============================================================================
+
+class BPETokenizer:
+    def __init__(self, ranks, pattern=None, special_tokens=None, cache_size=65536):
+        self.ranks = ranks
+        self.decoder = {rank: token for token, rank in ranks.items()}
+        self.special_tokens = special_tokens or {}
+        for token, rank in self.special_tokens.items():
+            self.decoder[rank] = token.encode("utf-8")
+        self.pattern = pattern
+        self._regex = _compile_pattern(pattern)
+
+        # Per instance cache: piece (str) -> tuple of token ids
+        self._encode_piece = lru_cache(maxsize=cache_size)(self._bpe)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return cls(load_ranks(path), **kwargs)
+
+    # -------------------------------------------------------------------------
+    # core BPE merge
+    # -------------------------------------------------------------------------
+
+    def _bpe(self, piece):
+        data = piece.encode("utf-8")
+        rank = self.ranks.get(data)
+        if rank is not None:
+            return (rank,)
+
+        ranks = self.ranks
+        parts = [data[i:i + 1] for i in range(len(data))]
+        while len(parts) > 1:
+            # Find the adjacent pair with the lowest rank
+            best_rank = None
+            best_index = -1
+            for i in range(len(parts) - 1):
+                r = ranks.get(parts[i] + parts[i + 1])
+                if r is not None and (best_rank is None or r < best_rank):
+                    best_rank = r
+                    best_index = i
+            if best_rank is None:
+                break
+            parts[best_index:best_index + 2] = [parts[best_index] + parts[best_index + 1]]
+
+        return tuple(ranks[part] for part in parts)
+
+    # -------------------------------------------------------------------------
+    # public API
+    # -------------------------------------------------------------------------
+
+    def encode(self, text):
+        ids = []
+        encode_piece = self._encode_piece
+        for piece in self._regex.findall(text):
+            ids.extend(encode_piece(piece))
+        return ids
+
+    def count_tokens(self, text):
+        # Same walk as encode() but only adds up lengths of cached tuples
+        encode_piece = self._encode_piece
+        return sum(len(encode_piece(piece)) for piece in self._regex.findall(text))
+
+    def decode(self, ids):
+        return b"".join(self.decoder[i] for i in ids).decode("utf-8", errors="replace")
+
+    def encode_batch(self, texts, workers=None, chunksize=64):
+        """Encode many texts; spreads the work over a process pool when workers > 1."""
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(texts) < 2:
+            return [self.encode(text) for text in texts]
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.ranks, self.pattern, self.special_tokens),
+        ) as pool:
+            return list(pool.map(_worker_encode, texts, chunksize=chunksize))
+
+    def count_tokens_batch(self, texts, workers=None, chunksize=64):
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(texts) < 2:
+            return [self.count_tokens(text) for text in texts]
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.ranks, self.pattern, self.special_tokens),
+        ) as pool:
+            return list(pool.map(_worker_count, texts, chunksize=chunksize))
+
+    def cache_info(self):
+        return self._encode_piece.cache_info()
+
+
+# Each worker process builds its own tokenizer (and its own warm cache) once
+_worker_tokenizer = None
+
+
+def _init_worker(ranks, pattern, special_tokens):
+    global _worker_tokenizer
+    _worker_tokenizer = BPETokenizer(ranks, pattern=pattern, special_tokens=special_tokens)
+
+
+def _worker_encode(text):
+    return _worker_tokenizer.encode(text)
+
+
+def _worker_count(text):
+    return _worker_tokenizer.count_tokens(text)
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+def _build_corpus(seed_text, target_mb):
+    target = int(target_mb * 1024 * 1024)
+    repeat = max(1, target // max(1, len(seed_text)))
+    return (seed_text + "\n") * repeat
+
+
+def _mb_per_sec(nbytes, seconds):
+    return nbytes / (1024 * 1024) / seconds if seconds else float("inf")
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    notes_path = os.path.join(here, "..", "notes.md")
+    with open(notes_path, encoding="utf-8") as f:
+        seed = f.read()
+
+    if len(sys.argv) > 1:
+        print(f"Loading ranks from {sys.argv[1]}")
+        tok = BPETokenizer.from_file(sys.argv[1])
+    else:
+        print("No rank file given - training a 2000 token vocab on LLMs/notes.md")
+        tok = BPETokenizer(train_ranks(seed, vocab_size=2000))
+
+    sample = "give me a word start with letter P"
+    ids = tok.encode(sample)
+    assert tok.decode(ids) == sample
+    print(f"{sample!r} -> {len(ids)} tokens")
+
+    corpus = _build_corpus(seed, target_mb=float(os.environ.get("BENCH_MB", "8")))
+    nbytes = len(corpus.encode("utf-8"))
+    print(f"\nCorpus: {nbytes / (1024 * 1024):.1f} MB")
+    print("=" * 50)
+
+    start = time.perf_counter()
+    n_ids = len(tok.encode(corpus))
+    elapsed = time.perf_counter() - start
+    print(f"encode        : {_mb_per_sec(nbytes, elapsed):7.2f} MB/s  ({n_ids} tokens)")
+
+    start = time.perf_counter()
+    n_count = tok.count_tokens(corpus)
+    elapsed = time.perf_counter() - start
+    print(f"count_tokens  : {_mb_per_sec(nbytes, elapsed):7.2f} MB/s  ({n_count} tokens)")
+    assert n_ids == n_count
+
+    docs = corpus.split("\n\n")
+    workers = os.cpu_count() or 1
+    start = time.perf_counter()
+    counts = tok.count_tokens_batch(docs, workers=workers)
+    elapsed = time.perf_counter() - start
+    print(f"batch x{workers:<4}   : {_mb_per_sec(nbytes, elapsed):7.2f} MB/s  ({sum(counts)} tokens)")
+
+    print(f"\npiece cache: {tok.cache_info()}")
@@ -0,0 +1,485 @@
+"""
+Parallel tool-call runtime
+==========================
+
+The SDK turns tool definitions into schemas (`openai.pydantic_function_tool`,
+`lib._parsing`) and hands back `function_call` items, but running them and
+feeding the results into the next `responses.create` is left to us - and
+doing it one call at a time makes a four-tool turn cost the sum of the four.
+
+This runtime dispatches every call of a model turn at once:
+
+- async tools run on the event loop, sync tools in a thread pool and
+  `kind="process"` tools (CPU-bound, module-level functions) in a process pool
+- per-tool `timeout` and `concurrency` limits; a failing or timed-out tool
+  becomes an "error: ..." output the model can react to, not an exception
+- `cache=seconds` memoizes results keyed on tool name + canonical JSON
+  arguments, and identical calls already in flight share one execution
+- with `stream=True` each call is started on `response.output_item.done`,
+  while the model is still generating the rest of the turn
+
+A timed-out thread or process call can't be killed; it keeps its pool worker
+until it returns, so size the pools for the slow tail.
+
+Usage:
+    runtime = ToolRuntime()
+
+    @runtime.tool(timeout=5, cache=300)
+    async def get_weather(city: str):
+        "Current weather for a city."
+        ...
+
+    response = await runtime.respond(AsyncOpenAI(), model="gpt-4o-mini",
+                                     input="Weather in Oslo and Lima?", stream=True)
+    print(response.output_text, runtime.stats())
+
+Run `python tool_runtime.py` for the stub benchmark.
+"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", list: "array", dict: "object"}
+
+
+class ToolTimeout(Exception):
+    pass
+
+
+class ToolLoopError(RuntimeError):
+    pass
+
+
+# =============================================================================
+# TOOLS
+# =============================================================================
+
+
+def _signature_schema(fn):
+    """JSON schema of fn's keyword parameters, from its annotations."""
+    properties = {}
+    required = []
+    for name, param in inspect.signature(fn).parameters.items():
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        json_type = _JSON_TYPES.get(param.annotation)
+        properties[name] = {"type": json_type} if json_type else {}
+        if param.default is param.empty:
+            required.append(name)
+    return {"type": "object", "properties": properties, "required": required}
+
+
+class Tool:
+    def __init__(self, fn, name=None, description=None, parameters=None, kind=None,
+                 timeout=None, concurrency=None, cache=None):
+        self.fn = fn
+        self.name = name or fn.__name__
+        self.description = description if description is not None else (inspect.getdoc(fn) or "").split("\n")[0]
+        self.model = None
+        if parameters is not None and hasattr(parameters, "model_json_schema"):
+            # a pydantic model: the SDK's strict schema, and fn gets the parsed instance
+            from openai.lib._pydantic import to_strict_json_schema
+
+            self.model = parameters
+            parameters = to_strict_json_schema(parameters)
+        self.parameters = parameters if parameters is not None else _signature_schema(fn)
+        if kind is None:
+            kind = "async" if inspect.iscoroutinefunction(fn) else "thread"
+        if kind not in ("async", "thread", "process"):
+            raise ValueError(f"unknown tool kind {kind!r}")
+        self.kind = kind
+        self.timeout = timeout
+        self.cache = cache            # seconds to memoize results, None = never
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        self.counters = {"calls": 0, "cache_hits": 0, "coalesced": 0, "errors": 0, "timeouts": 0, "busy_s": 0.0}
+
+    def definition(self):
+        """Function tool param for responses.create(tools=[...])."""
+        return {"type": "function", "name": self.name, "description": self.description,
+                "parameters": self.parameters, "strict": self.model is not None}
+
+    def arguments(self, raw):
+        if self.model is not None:
+            return self.model.model_validate_json(raw or "{}")
+        args = json.loads(raw or "{}")
+        if not isinstance(args, dict):
+            raise ValueError("tool arguments must be a JSON object")
+        return args
+
+    def bind(self, args):
+        """A zero-argument callable running the tool (picklable for process tools)."""
+        if self.model is not None:
+            return functools.partial(self.fn, args)
+        return functools.partial(self.fn, **args)
+
+
+class ToolResult:
+    __slots__ = ("call_id", "name", "output", "error", "cached", "seconds")
+
+    def __init__(self, call_id, name, output, error=None, cached=False, seconds=0.0):
+        self.call_id = call_id
+        self.name = name
+        self.output = output
+        self.error = error
+        self.cached = cached
+        self.seconds = seconds
+
+    def item(self):
+        """Input item for the next responses.create."""
+        return {"type": "function_call_output", "call_id": self.call_id, "output": self.output}
+
+    def __repr__(self):
+        return f"ToolResult({self.name!r}, {self.output[:60]!r}, cached={self.cached}, {self.seconds * 1000:.0f} ms)"
+
+
+def _output_text(value):
+    return value if isinstance(value, str) else json.dumps(value, default=str)
+
+
+def function_calls(response):
+    return [item for item in response.output if item.type == "function_call"]
+
+
+# =============================================================================
+# RUNTIME
+# =============================================================================
+
+
+class _Inflight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class ToolRuntime:
+    def __init__(self, threads=16, processes=None, memoize=True, max_cached=10_000):
+        self.tools = {}
+        self.memoize = memoize
+        self.max_cached = max_cached
+        self._threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="tool")
+        self._processes = None
+        self._process_workers = processes
+        self._cache = OrderedDict()   # key -> (expires_at, output)
+        self._inflight = {}           # key -> _Inflight execution of a cacheable call
+        self.turns = 0
+
+    def tool(self, fn=None, **options):
+        """Register a tool; usable as @runtime.tool or @runtime.tool(timeout=..., ...)."""
+        if fn is None:
+            return lambda f: self.tool(f, **options)
+        tool = Tool(fn, **options)
+        self.tools[tool.name] = tool
+        return fn
+
+    def definitions(self):
+        return [tool.definition() for tool in self.tools.values()]
+
+    # -------------------------------------------------------------------------
+    # one call
+    # -------------------------------------------------------------------------
+
+    async def call(self, name, arguments, call_id=None):
+        """Run one tool call; never raises for tool failures, the error goes into the output."""
+        start = time.perf_counter()
+        tool = self.tools.get(name)
+        if tool is None:
+            return ToolResult(call_id, name, f"error: unknown tool {name!r}", error="unknown_tool")
+        tool.counters["calls"] += 1
+        try:
+            args = tool.arguments(arguments)
+        except ValueError as exc:
+            tool.counters["errors"] += 1
+            return ToolResult(call_id, name, f"error: invalid arguments: {exc}", error="invalid_arguments")
+
+        if not (self.memoize and tool.cache):
+            output, error = await self._execute(tool, args)
+            return ToolResult(call_id, name, output, error, seconds=time.perf_counter() - start)
+
+        key = self._key(tool, args)
+        hit = self._cache.get(key)
+        if hit is not None and hit[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            tool.counters["cache_hits"] += 1
+            return ToolResult(call_id, name, hit[1], cached=True, seconds=time.perf_counter() - start)
+
+        # The execution is a task of its own that every identical call waits on,
+        # so cancelling one caller (the first included) never cancels the others
+        inflight = self._inflight.get(key)
+        coalesced = inflight is not None
+        if coalesced:
+            tool.counters["coalesced"] += 1
+        else:
+            inflight = self._inflight[key] = _Inflight(asyncio.ensure_future(self._execute_shared(tool, args, key)))
+        inflight.waiters += 1
+        try:
+            output, error = await asyncio.shield(inflight.task)
+        except asyncio.CancelledError:
+            inflight.waiters -= 1
+            if not inflight.waiters and not inflight.task.done():
+                # Nobody is left to use the result
+                inflight.task.cancel()
+                if self._inflight.get(key) is inflight:
+                    del self._inflight[key]
+            raise
+        inflight.waiters -= 1
+        return ToolResult(call_id, name, output, error, cached=coalesced, seconds=time.perf_counter() - start)
+
+    async def _execute_shared(self, tool, args, key):
+        try:
+            output, error = await self._execute(tool, args)
+        finally:
+            inflight = self._inflight.get(key)
+            if inflight is not None and inflight.task is asyncio.current_task():
+                del self._inflight[key]
+        if error is None:
+            self._remember(key, output, tool.cache)
+        return output, error
+
+    def _key(self, tool, args):
+        if tool.model is not None:
+            args = args.model_dump(mode="json")
+        canonical = json.dumps(args, sort_keys=True, separators=(",", ":"), default=str)
+        return tool.name, hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).digest()
+
+    def _remember(self, key, output, ttl):
+        self._cache[key] = (time.monotonic() + ttl, output)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    async def _execute(self, tool, args):
+        """(output text, error code or None)"""
+        start = time.perf_counter()
+        try:
+            if tool.semaphore is not None:
+                async with tool.semaphore:
+                    value = await self._dispatch(tool, args)
+            else:
+                value = await self._dispatch(tool, args)
+            return _output_text(value), None
+        except (ToolTimeout, asyncio.TimeoutError):
+            tool.counters["timeouts"] += 1
+            return f"error: {tool.name} timed out after {tool.timeout}s", "timeout"
+        except Exception as exc:
+            tool.counters["errors"] += 1
+            return f"error: {type(exc).__name__}: {exc}", "exception"
+        finally:
+            tool.counters["busy_s"] += time.perf_counter() - start
+
+    def _dispatch(self, tool, args):
+        call = tool.bind(args)
+        if tool.kind == "async":
+            awaitable = call()
+        else:
+            loop = asyncio.get_running_loop()
+            awaitable = loop.run_in_executor(self._pool(tool.kind), call)
+        if tool.timeout is None:
+            return awaitable
+        return asyncio.wait_for(awaitable, tool.timeout)
+
+    def _pool(self, kind):
+        if kind == "thread":
+            return self._threads
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self._process_workers)
+        return self._processes
+
+    # -------------------------------------------------------------------------
+    # model turns
+    # -------------------------------------------------------------------------
+
+    async def run_calls(self, calls):
+        """Run all function_call items of one turn concurrently, results in call order."""
+        return await asyncio.gather(*(self.call(c.name, c.arguments, c.call_id) for c in calls))
+
+    async def run_stream(self, stream, on_event=None):
+        """
+        Consume a streamed turn, starting each tool call as soon as its item is
+        done. Returns (final response, results in call order).
+        """
+        tasks = []
+        response = None
+        try:
+            async for event in stream:
+                if on_event is not None:
+                    on_event(event)
+                if event.type == "response.output_item.done" and event.item.type == "function_call":
+                    item = event.item
+                    tasks.append(asyncio.ensure_future(self.call(item.name, item.arguments, item.call_id)))
+                elif event.type in ("response.completed", "response.incomplete", "response.failed"):
+                    response = event.response
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return response, list(await asyncio.gather(*tasks))
+
+    async def respond(self, client, max_turns=8, stream=False, on_event=None, **params):
+        """
+        responses.create with this runtime's tools, looping until the model
+        answers without tool calls.
+        """
+        params["tools"] = self.definitions() + list(params.get("tools") or [])
+        for _ in range(max_turns):
+            self.turns += 1
+            if stream:
+                response, results = await self.run_stream(
+                    await client.responses.create(stream=True, **params), on_event)
+                if response is None:
+                    raise ToolLoopError("stream ended without a final response")
+            else:
+                response = await client.responses.create(**params)
+                results = await self.run_calls(function_calls(response))
+            if not results:
+                return response
+            params = dict(params, input=[r.item() for r in results], previous_response_id=response.id)
+        raise ToolLoopError(f"model still calling tools after {max_turns} turns")
+
+    def stats(self):
+        return {name: dict(tool.counters) for name, tool in self.tools.items()}
+
+    def close(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+# Stub model: a first turn emits four tool calls at ~80 ms of generation each,
+# the follow-up turn answers in 100 ms. Tools: weather (async, 200 ms, cached),
+# orders (blocking, 150 ms, thread), risk score (CPU, process).
+
+_GENERATION_S = 0.08
+_CITIES = ["Oslo", "Lima", "Pune", "Kyiv", "Lagos", "Quito"]
+
+
+def score_text(text: str):
+    """CPU-bound risk score of a text (runs in the process pool)."""
+    digest = text.encode("utf-8")
+    for _ in range(60_000):
+        digest = hashlib.blake2b(digest, digest_size=16).digest()
+    return {"score": digest[0] / 255}
+
+
+def _planned_calls(session):
+    calls = [("get_weather", {"city": _CITIES[session % 3]}),
+             ("get_weather", {"city": _CITIES[3 + session % 3]}),
+             ("lookup_order", {"order_id": f"A-{session}"}),
+             ("score_text", {"text": f"refund request #{session}"})]
+    return [{"type": "function_call", "id": f"fc_{session}_{i}", "call_id": f"call_{session}_{i}",
+             "name": name, "arguments": json.dumps(args), "status": "completed"}
+            for i, (name, args) in enumerate(calls)]
+
+
+def _responses_route(req):
+    from stub_server import fake_response, sse_event
+
+    body = req.json()
+    items = body.get("input")
+    if isinstance(items, list) and any(i.get("type") == "function_call_output" for i in items):
+        time.sleep(0.1)
+        done = fake_response(f"used {len(items)} tool results")
+        calls = []
+    else:
+        session = int(str(items).rsplit("#", 1)[-1])
+        calls = _planned_calls(session)
+        done = fake_response("", output=calls)
+
+    if not body.get("stream"):
+        time.sleep(_GENERATION_S * len(calls))
+        return 200, done
+
+    def events():
+        seq = 0
+        pending = dict(done, status="in_progress", output=[])
+        yield sse_event({"type": "response.created", "response": pending, "sequence_number": seq})
+        for index, item in enumerate(calls):
+            seq += 1
+            yield sse_event({"type": "response.output_item.added", "output_index": index,
+                             "item": dict(item, arguments="", status="in_progress"), "sequence_number": seq})
+            time.sleep(_GENERATION_S)
+            seq += 1
+            yield sse_event({"type": "response.output_item.done", "output_index": index,
+                             "item": item, "sequence_number": seq})
+        yield sse_event({"type": "response.completed", "response": done, "sequence_number": seq + 1})
+
+    return 200, events(), {"content-type": "text/event-stream"}
+
+
+def _make_runtime(memoize):
+    runtime = ToolRuntime(processes=2, memoize=memoize)
+
+    @runtime.tool(timeout=2, concurrency=8, cache=60)
+    async def get_weather(city: str):
+        """Current weather for a city."""
+        await asyncio.sleep(0.2)
+        return {"city": city, "temp_c": len(city) * 3}
+
+    @runtime.tool(timeout=2)
+    def lookup_order(order_id: str):
+        """Status of an order."""
+        time.sleep(0.15)
+        return {"order_id": order_id, "status": "shipped"}
+
+    runtime.tool(score_text, kind="process", timeout=5)
+    return runtime
+
+
+async def _bench(sessions=12):
+    from openai import AsyncOpenAI
+
+    from prompt_eval import percentile
+    from stub_server import StubServer
+
+    async def sequential(runtime, client, session):
+        # what we did before: one call at a time, no cache, no streaming
+        params = dict(model="gpt-4o-mini", input=f"plan my trip #{session}", tools=runtime.definitions())
+        while True:
+            response = await client.responses.create(**params)
+            calls = function_calls(response)
+            if not calls:
+                return response
+            results = [await runtime.call(c.name, c.arguments, c.call_id) for c in calls]
+            params = dict(params, input=[r.item() for r in results], previous_response_id=response.id)
+
+    async def parallel(runtime, client, session):
+        return await runtime.respond(client, model="gpt-4o-mini", input=f"plan my trip #{session}")
+
+    async def streamed(runtime, client, session):
+        return await runtime.respond(client, model="gpt-4o-mini", input=f"plan my trip #{session}", stream=True)
+
+    print(f"{sessions} agent turns (4 tool calls + final answer), model {_GENERATION_S * 1000:.0f} ms per call")
+    with StubServer() as server:
+        server.route("POST", "/v1/responses", _responses_route)
+        client = AsyncOpenAI(base_url=server.base_url, api_key="stub", max_retries=0)
+        for label, memoize, turn in [("sequential", False, sequential),
+                                     ("parallel", False, parallel),
+                                     ("parallel + cache", True, parallel),
+                                     ("parallel + cache + stream", True, streamed)]:
+            runtime = _make_runtime(memoize)
+            await runtime.call("score_text", '{"text": "warm up the process pool"}')
+            latencies = []
+            for session in range(sessions):
+                start = time.perf_counter()
+                response = await turn(runtime, client, session)
+                latencies.append(time.perf_counter() - start)
+                assert response.output_text.startswith("used 4 tool results"), response.output_text
+            hits = runtime.stats()["get_weather"]["cache_hits"]
+            print(f"{label:<27} p50 {percentile(latencies, 50) * 1000:5.0f} ms  p99 {percentile(latencies, 99) * 1000:5.0f} ms"
+                  f"  weather cache hits {hits:2d}")
+            runtime.close()
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_bench())
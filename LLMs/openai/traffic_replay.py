@@ -0,0 +1,560 @@
+"""
+Traffic recorder and replayer
+=============================
+
+Tuning client-side performance against the real API mixes our changes up
+with network and server noise, and production load can't be reproduced on a
+laptop. These two httpx transports plug into `http_client=`:
+
+    recorder = RecordingTransport("traffic.rec")
+    client = OpenAI(http_client=httpx.Client(transport=recorder))
+    ...
+    recorder.close()
+
+    replay = ReplayTransport("traffic.rec", speed=None)      # None = as fast as possible
+    client = OpenAI(api_key="replay", http_client=httpx.Client(transport=replay))
+
+Recording:
+- request and response pairs, including when every response chunk arrived,
+  so SSE streams keep their token timing. Connection errors are kept too,
+  and so is a body that broke off mid-stream
+- `authorization`, `api-key`, cookies and the like are redacted before
+  anything is written; `redact_body` can scrub payloads
+- the file is append-only: blocks of records, each zlib-compressed and
+  length-prefixed. A crash loses at most the unflushed block; a torn last
+  block is skipped on read and cut off when a writer reopens the file
+
+Replaying (no network):
+- requests are matched on method + path + body hash, falling back to method +
+  path in recorded order, so retries and re-runs get the same answers
+- `speed=1.0` keeps the recorded header and chunk timing, `speed=10` plays it
+  ten times faster, `speed=None` drops all waiting: what's left is the
+  client's own CPU time, deterministic run to run
+- recorded 429/5xx responses and broken streams come back as they were, so
+  retry and resume paths run too
+- `schedule(path)` gives the recorded arrival times, to re-issue the load
+
+Run `python traffic_replay.py` to record against the stub and replay it.
+"""
+
+import asyncio
+import hashlib
+import json
+import struct
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+
+import httpx
+
+REDACT_HEADERS = {"authorization", "api-key", "x-api-key", "cookie", "set-cookie", "openai-project",
+                  "proxy-authorization"}
+REDACTED = "[redacted]"
+
+_MAGIC = b"OAITRAF1"
+_BLOCK = struct.Struct(">I")
+_RECORD = struct.Struct(">II")    # header length, body length
+
+
+class ReplayMiss(LookupError):
+    pass
+
+
+# =============================================================================
+# FILE FORMAT
+# =============================================================================
+
+
+class TrafficWriter:
+    """Append-only writer: records are buffered and written as compressed blocks."""
+
+    def __init__(self, path, block_records=256, block_bytes=1 << 20, flush_interval=1.0, level=6):
+        self.path = path
+        self.block_records = block_records
+        self.block_bytes = block_bytes
+        self.flush_interval = flush_interval
+        self.level = level
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._count = 0
+        self._flushed_at = time.monotonic()
+        self._file = open(path, "ab")
+        self._recover()
+        self.records = 0
+        self.raw_bytes = 0
+        self.written_bytes = 0
+
+    def _recover(self):
+        """Cut a torn last block off, so new blocks don't land behind bytes readers stop at."""
+        f = self._file
+        size = f.seek(0, 2)
+        if size and size < len(_MAGIC):
+            f.truncate(0)     # torn magic
+            size = 0
+        if size == 0:
+            f.write(_MAGIC)
+            return
+        end = _last_complete_block(self.path)
+        if end != size:
+            f.truncate(end)
+
+    def append(self, header, body=b""):
+        data = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            self._buffer += _RECORD.pack(len(data), len(body))
+            self._buffer += data
+            self._buffer += body
+            self._count += 1
+            self.records += 1
+            if (self._count >= self.block_records or len(self._buffer) >= self.block_bytes
+                    or time.monotonic() - self._flushed_at >= self.flush_interval):
+                self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            block = zlib.compress(bytes(self._buffer), self.level)
+            self._file.write(_BLOCK.pack(len(block)) + block)
+            self._file.flush()
+            self.raw_bytes += len(self._buffer)
+            self.written_bytes += len(block) + _BLOCK.size
+            self._buffer = bytearray()
+            self._count = 0
+        self._flushed_at = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._file.close()
+
+
+def _blocks(f, path):
+    """Decompressed blocks with the offset each ends at; stops quietly at a torn last block."""
+    if f.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError(f"{path} is not a traffic recording")
+    while True:
+        prefix = f.read(_BLOCK.size)
+        if len(prefix) < _BLOCK.size:
+            return
+        (size,) = _BLOCK.unpack(prefix)
+        block = f.read(size)
+        if len(block) < size:
+            return
+        try:
+            data = zlib.decompress(block)
+        except zlib.error:
+            return
+        yield data, f.tell()
+
+
+def _last_complete_block(path):
+    end = len(_MAGIC)
+    with open(path, "rb") as f:
+        for _, end in _blocks(f, path):
+            pass
+    return end
+
+
+def iter_records(path):
+    """(header, body) of every record; stops quietly at a torn last block."""
+    with open(path, "rb") as f:
+        for block, _ in _blocks(f, path):
+            data = memoryview(block)
+            pos = 0
+            while pos < len(data):
+                header_len, body_len = _RECORD.unpack_from(data, pos)
+                pos += _RECORD.size
+                header = json.loads(bytes(data[pos:pos + header_len]))
+                pos += header_len
+                yield header, bytes(data[pos:pos + body_len])
+                pos += body_len
+
+
+def schedule(path):
+    """(seconds since the recording started, method, url, request body) per recorded request."""
+    for header, body in iter_records(path):
+        yield header["at"], header["method"], header["url"], body[:header["request_len"]]
+
+
+def _redacted_headers(headers, names):
+    return [[k, REDACTED if k.lower() in names else v] for k, v in headers.multi_items()]
+
+
+def _body_key(method, path, body):
+    return method, path, hashlib.blake2b(body, digest_size=12).digest()
+
+
+# =============================================================================
+# RECORDING
+# =============================================================================
+
+
+class _Capture:
+    """One exchange being recorded; written when the response body is closed."""
+
+    def __init__(self, recorder, request, body):
+        self.recorder = recorder
+        self.started = time.monotonic()
+        self.header = {
+            "at": round(self.started - recorder.started, 6),
+            "method": request.method,
+            "url": str(request.url),
+            "request_headers": _redacted_headers(request.headers, recorder.redact_headers),
+            "request_len": len(body),
+        }
+        self.body = bytearray(body)
+        self.chunks = []     # [seconds since the request, length]
+        self.done = False
+
+    def response(self, response):
+        self.header["status"] = response.status_code
+        self.header["headers_after"] = round(time.monotonic() - self.started, 6)
+        self.header["response_headers"] = _redacted_headers(response.headers, self.recorder.redact_headers)
+
+    def chunk(self, data):
+        self.chunks.append([round(time.monotonic() - self.started, 6), len(data)])
+        self.body += data
+
+    def error(self, exc):
+        self.header["error"] = type(exc).__name__
+        self.header["error_after"] = round(time.monotonic() - self.started, 6)
+        self.finish()
+
+    def finish(self):
+        if not self.done:
+            self.done = True
+            self.header["chunks"] = self.chunks
+            self.recorder.writer.append(self.header, bytes(self.body))
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, stream, capture):
+        self._stream = stream
+        self._capture = capture
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                self._capture.chunk(chunk)
+                yield chunk
+        except Exception as exc:
+            self._capture.error(exc)
+            raise
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._capture.finish()
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, capture):
+        self._stream = stream
+        self._capture = capture
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                self._capture.chunk(chunk)
+                yield chunk
+        except Exception as exc:
+            self._capture.error(exc)
+            raise
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._capture.finish()
+
+
+class _RecorderBase:
+    def __init__(self, path, transport=None, redact_headers=REDACT_HEADERS, redact_body=None, **writer_options):
+        self.transport = transport
+        self.writer = TrafficWriter(path, **writer_options)
+        self.redact_headers = {name.lower() for name in redact_headers}
+        self.redact_body = redact_body    # fn(bytes) -> bytes, applied to request bodies
+        self.started = time.monotonic()
+
+    def _capture(self, request):
+        body = request.content
+        if self.redact_body is not None:
+            body = self.redact_body(body)
+        return _Capture(self, request, body)
+
+    def stats(self):
+        w = self.writer
+        return {"records": w.records, "raw_bytes": w.raw_bytes, "file_bytes": w.written_bytes,
+                "ratio": w.raw_bytes / w.written_bytes if w.written_bytes else 0.0}
+
+
+class RecordingTransport(_RecorderBase, httpx.BaseTransport):
+    def __init__(self, path, transport=None, **options):
+        super().__init__(path, transport or httpx.HTTPTransport(), **options)
+
+    def handle_request(self, request):
+        request.read()
+        capture = self._capture(request)
+        try:
+            response = self.transport.handle_request(request)
+        except Exception as exc:
+            capture.error(exc)
+            raise
+        capture.response(response)
+        response.stream = _RecordingStream(response.stream, capture)
+        return response
+
+    def close(self):
+        self.transport.close()
+        self.writer.close()
+
+
+class AsyncRecordingTransport(_RecorderBase, httpx.AsyncBaseTransport):
+    def __init__(self, path, transport=None, **options):
+        super().__init__(path, transport or httpx.AsyncHTTPTransport(), **options)
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        capture = self._capture(request)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception as exc:
+            capture.error(exc)
+            raise
+        capture.response(response)
+        response.stream = _AsyncRecordingStream(response.stream, capture)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+        self.writer.close()
+
+
+# =============================================================================
+# REPLAYING
+# =============================================================================
+
+
+class _Exchange:
+    __slots__ = ("status", "headers", "headers_after", "chunks", "error", "error_after")
+
+    def __init__(self, header, body):
+        self.status = header.get("status")
+        self.headers = [tuple(pair) for pair in header.get("response_headers", ())]
+        self.headers_after = header.get("headers_after", 0.0)
+        self.error = header.get("error")
+        self.error_after = header.get("error_after", 0.0)
+        self.chunks = []     # (seconds since the request, bytes)
+        pos = header["request_len"]
+        for at, size in header.get("chunks", ()):
+            self.chunks.append((at, body[pos:pos + size]))
+            pos += size
+
+
+class _ReplayBase:
+    def __init__(self, path, speed=1.0, loop=True):
+        self.speed = speed       # None or 0: no waiting at all
+        self.loop = loop         # serve recordings again once a key runs out
+        self._exact = defaultdict(deque)
+        self._by_path = defaultdict(deque)
+        self._lock = threading.Lock()
+        self.counters = {"served": 0, "exact": 0, "by_path": 0, "errors": 0}
+        for header, body in iter_records(path):
+            url = httpx.URL(header["url"])
+            exchange = _Exchange(header, body)
+            self._exact[_body_key(header["method"], url.path, body[:header["request_len"]])].append(exchange)
+            self._by_path[(header["method"], url.path)].append(exchange)
+
+    def _take(self, request):
+        with self._lock:
+            self.counters["served"] += 1
+            for kind, queues, key in (("exact", self._exact, _body_key(request.method, request.url.path, request.content)),
+                                      ("by_path", self._by_path, (request.method, request.url.path))):
+                queue = queues.get(key)
+                if queue:
+                    exchange = queue.popleft()
+                    if self.loop:
+                        queue.append(exchange)
+                    self.counters[kind] += 1
+                    return exchange
+        raise ReplayMiss(f"no recorded response for {request.method} {request.url.path}")
+
+    def _delay(self, seconds):
+        return seconds / self.speed if self.speed else 0.0
+
+    def _error(self, exchange, request):
+        self.counters["errors"] += 1
+        error = getattr(httpx, exchange.error, None)
+        if not (isinstance(error, type) and issubclass(error, httpx.TransportError)):
+            error = httpx.ConnectError
+        return error(f"replayed {exchange.error}", request=request)
+
+    def _body_error(self, exchange, request):
+        if exchange.error:
+            return exchange.error_after, self._error(exchange, request)
+        return None
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks, started, delay, error=None):
+        self._chunks = chunks
+        self._started = started
+        self._delay = delay
+        self._error = error      # (seconds since the request, exception) for a body that broke off
+
+    def __iter__(self):
+        for at, data in self._chunks:
+            wait = self._started + self._delay(at) - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            yield data
+        if self._error is not None:
+            at, exc = self._error
+            wait = self._started + self._delay(at) - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            raise exc
+
+
+class ReplayTransport(_ReplayBase, httpx.BaseTransport):
+    def handle_request(self, request):
+        started = time.monotonic()
+        request.read()
+        exchange = self._take(request)
+        if exchange.status is None:
+            time.sleep(self._delay(exchange.error_after))
+            raise self._error(exchange, request)
+        wait = started + self._delay(exchange.headers_after) - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        return httpx.Response(exchange.status, headers=exchange.headers,
+                              stream=_ReplayStream(exchange.chunks, started, self._delay,
+                                                   self._body_error(exchange, request)))
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks, started, delay, error=None):
+        self._chunks = chunks
+        self._started = started
+        self._delay = delay
+        self._error = error
+
+    async def __aiter__(self):
+        for at, data in self._chunks:
+            wait = self._started + self._delay(at) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield data
+        if self._error is not None:
+            at, exc = self._error
+            wait = self._started + self._delay(at) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            raise exc
+
+
+class AsyncReplayTransport(_ReplayBase, httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        started = time.monotonic()
+        await request.aread()
+        exchange = self._take(request)
+        if exchange.status is None:
+            await asyncio.sleep(self._delay(exchange.error_after))
+            raise self._error(exchange, request)
+        wait = started + self._delay(exchange.headers_after) - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return httpx.Response(exchange.status, headers=exchange.headers,
+                              stream=_AsyncReplayStream(exchange.chunks, started, self._delay,
+                                                        self._body_error(exchange, request)))
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+# Record 300 calls against the stub (plain responses, SSE streams with token
+# timing, a few 429s the SDK retries), then replay them at 1x, 10x and max speed.
+
+
+def _record(path, n_calls):
+    import random
+
+    from openai import OpenAI
+
+    from stub_server import StubServer, default_responses_route, sse_event
+
+    rng = random.Random(11)
+
+    def responses(req):
+        body = req.json()
+        if rng.random() < 0.05:
+            return 429, {"error": {"message": "slow down", "type": "rate_limit"}}, {"retry-after-ms": "20"}
+        if not body.get("stream"):
+            time.sleep(rng.uniform(0.01, 0.04))
+            return default_responses_route(req)
+
+        def frames():
+            for i in range(120):
+                time.sleep(0.0005)
+                yield sse_event({"type": "response.output_text.delta", "item_id": "msg_1", "output_index": 0,
+                                 "content_index": 0, "delta": f"tok{i} ", "sequence_number": i},
+                                event="response.output_text.delta")
+
+        return 200, frames(), {"content-type": "text/event-stream"}
+
+    with StubServer() as server:
+        server.route("POST", "/v1/responses", responses)
+        recorder = RecordingTransport(path)
+        client = OpenAI(base_url=server.base_url, api_key="sk-secret-never-written",
+                        http_client=httpx.Client(transport=recorder))
+        for i in range(n_calls):
+            _call(client, i)
+        client.close()
+    return recorder.stats()
+
+
+def _call(client, i):
+    if i % 3 == 0:
+        return sum(1 for _ in client.responses.create(model="gpt-4o-mini", input=f"stream {i}", stream=True))
+    return client.responses.create(model="gpt-4o-mini", input=f"question {i}").output_text
+
+
+def _replay(path, n_calls, speed):
+    from openai import OpenAI
+
+    replay = ReplayTransport(path, speed=speed)
+    client = OpenAI(base_url="http://replay.invalid/v1", api_key="replay", http_client=httpx.Client(transport=replay))
+    wall, cpu = time.perf_counter(), time.process_time()
+    for i in range(n_calls):
+        _call(client, i)
+    return time.perf_counter() - wall, time.process_time() - cpu, replay.counters
+
+
+def _bench(n_calls=300):
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "traffic.rec")
+        start = time.perf_counter()
+        stats = _record(path, n_calls)
+        recorded_s = time.perf_counter() - start
+        secret = b"sk-secret-never-written"
+        leaked = any(secret in body or secret.decode() in json.dumps(header) for header, body in iter_records(path))
+        print(f"recorded {stats['records']} exchanges in {recorded_s:.2f} s: {stats['raw_bytes'] / 1024:.0f} KB raw, "
+              f"{stats['file_bytes'] / 1024:.0f} KB on disk ({stats['ratio']:.1f}x), api key in file: {leaked}")
+        for speed in (1.0, 10.0, None):
+            runs = [_replay(path, n_calls, speed) for _ in range(3 if speed is None else 1)]
+            label = "max speed" if speed is None else f"{speed:g}x"
+            cpu = [c / n_calls * 1e6 for _, c, _ in runs]
+            print(f"replay {label:<9} wall {runs[0][0]:6.2f} s  client CPU {min(cpu):6.0f}-{max(cpu):.0f} us/call  "
+                  f"{runs[0][2]}")
+
+
+if __name__ == "__main__":
+    _bench()
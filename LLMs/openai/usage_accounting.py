@@ -0,0 +1,522 @@
+"""
+Usage and cost accounting
+=========================
+
+Every `Response` / `ChatCompletion` carries a `usage` block (input, cached and
+output tokens) that main.py throws away after printing `output_text`, so
+spend is only reconciled from invoices weeks later.
+
+`instrument(client, accountant)` wraps `create` and `parse` of `responses` and
+`chat.completions` on a client (sync or async, streaming and raw responses
+too) and records model, tokens, latency and a tag for every call:
+
+    accountant = Accountant("usage.col")
+    client = instrument(OpenAI(), accountant)
+    with usage_tag("eval-run-42"):
+        client.responses.create(model="gpt-4o-mini", input="...")
+    print(accountant.query(by="model"))
+
+Keeping the hot path cheap (a few microseconds per call):
+- the wrapper reads fields that the SDK has already parsed - no extra JSON work
+- each thread appends a tuple to its own ring buffer (a deque). No lock is
+  taken; deque.append / popleft are atomic. If a ring reaches `ring_size`
+  because the flusher fell behind, the writing thread flushes once itself
+- a background thread drains the rings every `flush_interval` seconds, sums
+  them per (time bucket, model, tag) and appends one columnar block to disk
+
+File format: a sequence of blocks, each
+    b"UACB" | header length (u32) | JSON header {rows, models, tags}
+    | bucket int64[] | model id int32[] | tag id int32[]
+    | calls, input, cached, output int64[] | latency_sum, cost float64[]
+
+Run `python usage_accounting.py` for the per-call overhead benchmark.
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import deque
+
+from pricing import cost_of
+
+_MAGIC = b"UACB"
+_U32 = struct.Struct("<I")
+_current_tag = contextvars.ContextVar("usage_tag", default="")
+
+
+class usage_tag:
+    """`with usage_tag("batch-7"):` tags every call made inside the block."""
+
+    def __init__(self, tag):
+        self.tag = tag
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_tag.set(self.tag)
+        return self
+
+    def __exit__(self, *exc):
+        _current_tag.reset(self._token)
+
+
+# =============================================================================
+# ACCOUNTANT
+# =============================================================================
+
+
+class Accountant:
+    def __init__(self, path, flush_interval=5.0, bucket_seconds=60, ring_size=65536):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.bucket_seconds = bucket_seconds
+        self.ring_size = ring_size
+        self.inline_flushes = 0
+
+        self._local = threading.local()
+        self._rings = []
+        self._rings_lock = threading.Lock()   # only taken once per new thread
+        self._drain_lock = threading.Lock()   # one drain at a time (flusher or an overflowing writer)
+        self._file_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="usage-flush")
+        self._flusher.start()
+
+    # -------------------------------------------------------------------------
+    # hot path
+    # -------------------------------------------------------------------------
+
+    def record(self, model, input_tokens, output_tokens, cached_tokens, latency, tag=None):
+        ring = getattr(self._local, "ring", None)
+        if ring is None:
+            ring = deque()
+            self._local.ring = ring
+            with self._rings_lock:
+                self._rings.append(ring)
+        if len(ring) >= self.ring_size:
+            # The flusher fell behind: flush from this thread instead of losing calls
+            self.inline_flushes += 1
+            self.flush()
+        ring.append((time.time(), model, input_tokens, output_tokens, cached_tokens, latency,
+                     _current_tag.get() if tag is None else tag))
+
+    def record_usage(self, model, usage, latency):
+        """Take a `usage` object from a Response or ChatCompletion."""
+        if usage is None:
+            return
+        if hasattr(usage, "input_tokens"):   # Responses API
+            details = usage.input_tokens_details
+            self.record(model, usage.input_tokens, usage.output_tokens,
+                        details.cached_tokens if details else 0, latency)
+        else:                                # Chat Completions
+            details = usage.prompt_tokens_details
+            self.record(model, usage.prompt_tokens, usage.completion_tokens,
+                        (details.cached_tokens or 0) if details else 0, latency)
+
+    # -------------------------------------------------------------------------
+    # flushing
+    # -------------------------------------------------------------------------
+
+    def _drain(self):
+        with self._rings_lock:
+            rings = list(self._rings)
+        totals = {}
+        bucket_seconds = self.bucket_seconds
+        for ring in rings:
+            popleft = ring.popleft
+            for _ in range(len(ring)):
+                ts, model, inp, out, cached, latency, tag = popleft()
+                key = (int(ts // bucket_seconds) * bucket_seconds, model, tag)
+                row = totals.get(key)
+                if row is None:
+                    row = totals[key] = [0, 0, 0, 0, 0.0, 0.0]
+                row[0] += 1
+                row[1] += inp
+                row[2] += cached
+                row[3] += out
+                row[4] += latency
+                row[5] += cost_of(model, inp, out, cached)
+        return totals
+
+    def flush(self):
+        with self._drain_lock:
+            totals = self._drain()
+            if totals:
+                block = _encode_block(totals)
+                with self._file_lock, open(self.path, "ab") as f:
+                    f.write(block)
+        return len(totals)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+
+    # -------------------------------------------------------------------------
+    # queries
+    # -------------------------------------------------------------------------
+
+    def rows(self, since=None, until=None):
+        """All flushed aggregate rows as dicts."""
+        if not os.path.exists(self.path):
+            return []
+        with self._file_lock, open(self.path, "rb") as f:
+            data = f.read()
+        out = []
+        for row in _decode_blocks(data):
+            if since is not None and row["bucket"] < since:
+                continue
+            if until is not None and row["bucket"] >= until:
+                continue
+            out.append(row)
+        return out
+
+    def query(self, by="model", since=None, until=None, model=None, tag=None, bucket_seconds=None):
+        """
+        Cost and tokens grouped by "model", "tag" or "bucket".
+        `bucket_seconds` re-buckets time (e.g. 3600 for hourly) when by="bucket".
+        """
+        self.flush()
+        groups = {}
+        for row in self.rows(since, until):
+            if model is not None and row["model"] != model:
+                continue
+            if tag is not None and row["tag"] != tag:
+                continue
+            key = row[by]
+            if by == "bucket" and bucket_seconds:
+                key = key // bucket_seconds * bucket_seconds
+            g = groups.setdefault(key, {"calls": 0, "input_tokens": 0, "cached_tokens": 0,
+                                        "output_tokens": 0, "latency_sum": 0.0, "cost": 0.0})
+            g["calls"] += row["calls"]
+            g["input_tokens"] += row["input_tokens"]
+            g["cached_tokens"] += row["cached_tokens"]
+            g["output_tokens"] += row["output_tokens"]
+            g["latency_sum"] += row["latency_sum"]
+            g["cost"] += row["cost"]
+        for g in groups.values():
+            g["avg_latency"] = g.pop("latency_sum") / g["calls"] if g["calls"] else 0.0
+        return dict(sorted(groups.items()))
+
+
+# =============================================================================
+# COLUMNAR BLOCKS
+# =============================================================================
+
+
+def _encode_block(totals):
+    models = sorted({key[1] for key in totals})
+    tags = sorted({key[2] for key in totals})
+    model_ids = {m: i for i, m in enumerate(models)}
+    tag_ids = {t: i for i, t in enumerate(tags)}
+
+    buckets, model_col, tag_col = array("q"), array("i"), array("i")
+    ints = [array("q") for _ in range(4)]
+    floats = [array("d") for _ in range(2)]
+    for (bucket, model, tag), row in totals.items():
+        buckets.append(bucket)
+        model_col.append(model_ids[model])
+        tag_col.append(tag_ids[tag])
+        for col, value in zip(ints, row[:4]):
+            col.append(value)
+        for col, value in zip(floats, row[4:]):
+            col.append(value)
+
+    header = json.dumps({"rows": len(totals), "models": models, "tags": tags}).encode()
+    columns = [buckets, model_col, tag_col, *ints, *floats]
+    return _MAGIC + _U32.pack(len(header)) + header + b"".join(col.tobytes() for col in columns)
+
+
+def _decode_blocks(data):
+    view = memoryview(data)
+    pos = 0
+    while pos + 8 <= len(data):
+        if data[pos:pos + 4] != _MAGIC:
+            break   # torn write at the end of the file
+        (header_len,) = _U32.unpack_from(data, pos + 4)
+        if pos + 8 + header_len > len(data):
+            break   # torn inside the header
+        try:
+            header = json.loads(bytes(view[pos + 8:pos + 8 + header_len]))
+        except ValueError:
+            break
+        pos += 8 + header_len
+        n = header["rows"]
+
+        columns = []
+        for typecode in ("q", "i", "i", "q", "q", "q", "q", "d", "d"):
+            col = array(typecode)
+            size = n * col.itemsize
+            if pos + size > len(data):
+                return
+            col.frombytes(view[pos:pos + size])
+            pos += size
+            columns.append(col)
+
+        bucket, model, tag, calls, inp, cached, out, latency, cost = columns
+        for i in range(n):
+            yield {
+                "bucket": bucket[i], "model": header["models"][model[i]], "tag": header["tags"][tag[i]],
+                "calls": calls[i], "input_tokens": inp[i], "cached_tokens": cached[i],
+                "output_tokens": out[i], "latency_sum": latency[i], "cost": cost[i],
+            }
+
+
+# =============================================================================
+# CLIENT HOOK
+# =============================================================================
+
+
+class _MeteredStream:
+    """
+    An SDK `Stream` that records usage from its final event. A stream closed
+    or dropped before usage arrived still counts as a call, with 0 tokens.
+    Everything else (`with`, `.close()`, `.response`) goes to the stream.
+    """
+
+    def __init__(self, stream, accountant, model, start):
+        self._stream = stream
+        self._accountant = accountant
+        self._model = model
+        self._start = start
+        self._recorded = False
+        self._iterator = self._meter()
+
+    def _meter(self):
+        try:
+            for event in self._stream:
+                if not self._recorded:
+                    self._recorded = _record_event(event, self._accountant, self._model, self._start)
+                yield event
+        finally:
+            self._finish()
+
+    def _finish(self):
+        if not self._recorded:
+            self._recorded = True
+            self._accountant.record(self._model, 0, 0, 0, time.perf_counter() - self._start)
+
+    def __iter__(self):
+        yield from self._iterator
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._finish()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _AsyncMeteredStream(_MeteredStream):
+    async def _meter(self):
+        try:
+            async for event in self._stream:
+                if not self._recorded:
+                    self._recorded = _record_event(event, self._accountant, self._model, self._start)
+                yield event
+        finally:
+            self._finish()
+
+    async def __aiter__(self):
+        async for event in self._iterator:
+            yield event
+
+    async def __anext__(self):
+        return await self._iterator.__anext__()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        try:
+            await self._stream.close()
+        finally:
+            self._finish()
+
+
+def _record_event(event, accountant, model, start):
+    """Record usage if this event carries it; True once recorded."""
+    response = getattr(event, "response", None)        # response.completed
+    if response is not None and getattr(response, "usage", None) is not None:
+        accountant.record_usage(response.model or model, response.usage, time.perf_counter() - start)
+        return True
+    if getattr(event, "usage", None) is not None:      # last chat chunk with include_usage
+        accountant.record_usage(event.model or model, event.usage, time.perf_counter() - start)
+        return True
+    return False
+
+
+_RAW_HEADER = "X-Stainless-Raw-Response"
+
+
+def _raw_mode(kwargs):
+    """"true" under with_raw_response, "stream" under with_streaming_response, else None."""
+    headers = kwargs.get("extra_headers")
+    return headers.get(_RAW_HEADER) if headers else None
+
+
+def _metered(result, accountant, model, start, stream, is_async):
+    if stream:
+        return (_AsyncMeteredStream if is_async else _MeteredStream)(result, accountant, model, start)
+    accountant.record_usage(result.model, result.usage, time.perf_counter() - start)
+    return result
+
+
+def _meter_raw(raw, accountant, model, start, stream, is_async):
+    """
+    Raw responses hold the parsed object back until `.parse()`: a
+    with_raw_response body is already read, so it is parsed (and cached by
+    the SDK) right away; otherwise `.parse()` is wrapped to record then.
+    """
+    parse = raw.parse
+    if not stream and _is_read(raw):
+        _metered(parse(), accountant, model, start, False, is_async)
+        return raw
+    if inspect.iscoroutinefunction(parse):
+        @functools.wraps(parse)
+        async def async_parse(*args, **kwargs):
+            return _metered(await parse(*args, **kwargs), accountant, model, start, stream, is_async)
+
+        raw.parse = async_parse
+    else:
+        @functools.wraps(parse)
+        def sync_parse(*args, **kwargs):
+            return _metered(parse(*args, **kwargs), accountant, model, start, stream, is_async)
+
+        raw.parse = sync_parse
+    return raw
+
+
+def _is_read(raw):
+    try:
+        raw.http_response.content
+    except Exception:   # httpx.ResponseNotRead
+        return False
+    return True
+
+
+def _wrap_create(create, accountant):
+    if inspect.iscoroutinefunction(create):
+        @functools.wraps(create)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = await create(*args, **kwargs)
+            if _raw_mode(kwargs):
+                return _meter_raw(result, accountant, kwargs.get("model"), start, kwargs.get("stream"), True)
+            return _metered(result, accountant, kwargs.get("model"), start, kwargs.get("stream"), True)
+
+        return async_wrapper
+
+    @functools.wraps(create)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = create(*args, **kwargs)
+        if _raw_mode(kwargs):
+            return _meter_raw(result, accountant, kwargs.get("model"), start, kwargs.get("stream"), False)
+        return _metered(result, accountant, kwargs.get("model"), start, kwargs.get("stream"), False)
+
+    return wrapper
+
+
+def instrument(client, accountant):
+    """
+    Record usage for `create` and `parse` on responses and chat.completions.
+    `.stream()` goes through `create`, and the with_raw_response /
+    with_streaming_response views are rebuilt so they call the wrapped methods.
+    """
+    for resource in (client.responses, client.chat.completions):
+        for name in ("create", "parse"):
+            if hasattr(resource, name):
+                setattr(resource, name, _wrap_create(getattr(resource, name), accountant))
+        for view in ("with_raw_response", "with_streaming_response"):
+            resource.__dict__.pop(view, None)   # cached_property built before instrument()
+    return client
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+
+def _bench(calls_per_thread=100_000, threads=4, paced_rps=10_000, paced_seconds=2):
+    import tempfile
+    from types import SimpleNamespace
+
+    usage = SimpleNamespace(input_tokens=1200, output_tokens=80,
+                            input_tokens_details=SimpleNamespace(cached_tokens=1024))
+    response = SimpleNamespace(model="gpt-4o-mini", usage=usage)
+
+    def create(**kwargs):
+        return response
+
+    with tempfile.TemporaryDirectory() as tmp:
+        accountant = Accountant(os.path.join(tmp, "usage.col"), flush_interval=0.5)
+        wrapped = _wrap_create(create, accountant)
+
+        def run(n, fn, tag):
+            with usage_tag(tag):
+                for _ in range(n):
+                    fn(model="gpt-4o-mini", input="x")
+
+        for label, fn in (("bare call", create), ("instrumented", wrapped)):
+            start = time.perf_counter()
+            run(calls_per_thread, fn, "single")
+            elapsed = time.perf_counter() - start
+            print(f"{label:<14} {elapsed / calls_per_thread * 1e6:6.2f} us/call (1 thread, flat out)")
+
+        # Realistic load: 10k RPS spread over threads, timing each instrumented call
+        overheads = []
+
+        def paced(n, interval):
+            with usage_tag("paced"):
+                next_at = time.perf_counter()
+                for _ in range(n):
+                    start = time.perf_counter()
+                    wrapped(model="gpt-4o-mini", input="x")
+                    overheads.append(time.perf_counter() - start)
+                    next_at += interval
+                    delay = next_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+        per_thread = paced_rps * paced_seconds // threads
+        workers = [threading.Thread(target=paced, args=(per_thread, threads / paced_rps)) for _ in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        overheads.sort()
+        print(f"{paced_rps:,} RPS x {threads} threads  p50 {overheads[len(overheads) // 2] * 1e6:.2f} us   "
+              f"p99 {overheads[int(len(overheads) * 0.99)] * 1e6:.2f} us per call")
+
+        accountant.close()
+        print(f"file size      {os.path.getsize(accountant.path)} bytes, inline flushes {accountant.inline_flushes}")
+        for key, row in accountant.query(by="tag").items():
+            print(f"tag {key!r:<10} calls {row['calls']:,}  cost ${row['cost']:.2f}")
+
+
+if __name__ == "__main__":
+    _bench()
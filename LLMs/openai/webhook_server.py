@@ -0,0 +1,497 @@
+"""
+High-throughput webhook receiver
+================================
+
+`client.webhooks.verify_signature()` base64-decodes the secret, rebuilds the
+HMAC key and JSON-parses the payload on every call, and `unwrap()` then builds
+full pydantic models. When thousands of `batch.completed` / `response.completed`
+webhooks arrive in a burst, a receiver built on it pegs a core.
+
+This receiver checks the same signature scheme (`webhook-id.timestamp.body`,
+HMAC-SHA256, `v1,<base64>`, 5 minute tolerance), but:
+
+- decodes the secret and keys the HMAC once; each call only copies that state
+- verifies and parses requests in micro-batches on a worker pool
+  (process pool by default), so one event loop can feed several cores
+- drops redeliveries using a bounded seen-set of webhook ids
+- appends accepted events to a local append-only queue file and fsyncs once
+  per batch (group commit, off the event loop) before answering 200, so
+  nothing acknowledged is lost; ids only count as seen once written, and a
+  batch that fails to verify or commit is answered 500 so OpenAI redelivers
+- GET /metrics returns events/sec, verification latency percentiles and counters
+
+Usage:
+    OPENAI_WEBHOOK_SECRET=whsec_... python webhook_server.py serve --port 8000 --queue events.jsonl
+    python webhook_server.py bench        # local load generator
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from openai import InvalidWebhookSignatureError
+except ImportError:  # worker processes only need the verifier
+    class InvalidWebhookSignatureError(ValueError):
+        pass
+
+
+# =============================================================================
+# VERIFICATION
+# =============================================================================
+
+
+class WebhookVerifier:
+    def __init__(self, secret, tolerance=300):
+        if secret.startswith("whsec_"):
+            key = base64.b64decode(secret[6:])
+        else:
+            key = secret.encode()
+        # Keyed once; hmac.copy() is much cheaper than hmac.new() per event
+        self._mac = hmac.new(key, digestmod=hashlib.sha256)
+        self.tolerance = tolerance
+
+    def verify(self, payload, headers, now=None):
+        """Same checks as Webhooks.verify_signature(); returns the parsed JSON event."""
+        try:
+            signature_header = headers["webhook-signature"]
+            timestamp = headers["webhook-timestamp"]
+            webhook_id = headers["webhook-id"]
+        except KeyError as e:
+            raise InvalidWebhookSignatureError(f"Could not find {e.args[0]} header") from None
+
+        try:
+            timestamp_seconds = int(timestamp)
+        except ValueError:
+            raise InvalidWebhookSignatureError("Invalid webhook timestamp format") from None
+
+        now = int(time.time()) if now is None else now
+        if now - timestamp_seconds > self.tolerance:
+            raise InvalidWebhookSignatureError("Webhook timestamp is too old")
+        if timestamp_seconds > now + self.tolerance:
+            raise InvalidWebhookSignatureError("Webhook timestamp is too new")
+
+        mac = self._mac.copy()
+        mac.update(f"{webhook_id}.{timestamp}.".encode())
+        mac.update(payload)
+        expected = base64.b64encode(mac.digest()).decode()
+
+        signatures = [part[3:] if part.startswith("v1,") else part for part in signature_header.split()]
+        if not any(hmac.compare_digest(expected, sig) for sig in signatures):
+            raise InvalidWebhookSignatureError("The given webhook signature does not match the expected signature")
+
+        return json.loads(payload)
+
+
+def sign(secret, webhook_id, timestamp, payload):
+    """Build the headers OpenAI would send - used by the load generator."""
+    key = base64.b64decode(secret[6:]) if secret.startswith("whsec_") else secret.encode()
+    mac = hmac.new(key, f"{webhook_id}.{timestamp}.".encode() + payload, hashlib.sha256)
+    return {
+        "webhook-id": webhook_id,
+        "webhook-timestamp": str(timestamp),
+        "webhook-signature": "v1," + base64.b64encode(mac.digest()).decode(),
+    }
+
+
+# Worker side: one verifier per process, built by the pool initializer
+_verifier = None
+
+
+def _init_worker(secret, tolerance):
+    global _verifier
+    _verifier = WebhookVerifier(secret, tolerance)
+
+
+def _verify_batch(items):
+    """[(payload, headers)] -> [(ok, event_or_error, seconds)]"""
+    now = int(time.time())
+    out = []
+    for payload, headers in items:
+        start = time.perf_counter()
+        try:
+            event = _verifier.verify(payload, headers, now=now)
+            out.append((True, event, time.perf_counter() - start))
+        except (InvalidWebhookSignatureError, ValueError) as e:
+            out.append((False, str(e), time.perf_counter() - start))
+    return out
+
+
+# =============================================================================
+# DEDUPE + DURABLE QUEUE
+# =============================================================================
+
+
+class SeenSet:
+    """Remembers the last `capacity` webhook ids (OpenAI redelivers on timeouts)."""
+
+    def __init__(self, capacity=100_000):
+        self.capacity = capacity
+        self._ids = OrderedDict()
+
+    def __contains__(self, webhook_id):
+        return webhook_id in self._ids
+
+    def add(self, webhook_id):
+        """True if new, False if already seen."""
+        if webhook_id in self._ids:
+            self._ids.move_to_end(webhook_id)
+            return False
+        self._ids[webhook_id] = None
+        if len(self._ids) > self.capacity:
+            self._ids.popitem(last=False)
+        return True
+
+
+class DurableQueue:
+    """Append-only JSONL file; one write + fsync per batch (group commit)."""
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def append_many(self, records):
+        if not records:
+            return
+        data = b"".join(json.dumps(r, separators=(",", ":")).encode() + b"\n" for r in records)
+        os.write(self._fd, data)
+        if self.fsync:
+            os.fsync(self._fd)
+
+    def read_from(self, offset=0):
+        """Yield (next_offset, record) so a consumer can remember where it stopped."""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                offset += len(line)
+                yield offset, json.loads(line)
+
+    def close(self):
+        os.close(self._fd)
+
+
+# =============================================================================
+# METRICS
+# =============================================================================
+
+
+class Metrics:
+    def __init__(self, window=10_000):
+        self.started = time.monotonic()
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.failed = 0
+        self.batches = 0
+        self.verify_latency = deque(maxlen=window)
+        self._recent = deque()   # accept timestamps for the last few seconds
+
+    def accept(self, n):
+        self.accepted += n
+        now = time.monotonic()
+        self._recent.append((now, n))
+        while self._recent and now - self._recent[0][0] > 5:
+            self._recent.popleft()
+
+    def snapshot(self):
+        now = time.monotonic()
+        recent = sum(n for t, n in self._recent if now - t <= 5)
+        ordered = sorted(self.verify_latency)
+
+        def pct(p):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1e6 if ordered else 0.0
+
+        return {
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "batches": self.batches,
+            "events_per_sec_5s": recent / 5,
+            "events_per_sec_total": self.accepted / max(1e-9, now - self.started),
+            "verify_us_p50": pct(50),
+            "verify_us_p99": pct(99),
+        }
+
+
+# =============================================================================
+# SERVER
+# =============================================================================
+
+
+class WebhookServer:
+    def __init__(self, secret, queue_path, workers=None, pool="process", batch_size=256,
+                 max_wait=0.002, tolerance=300, seen_capacity=100_000, fsync=True, on_event=None,
+                 max_body=1 << 20):
+        self.secret = secret
+        self.max_body = max_body
+        self.tolerance = tolerance
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = DurableQueue(queue_path, fsync=fsync)
+        self.seen = SeenSet(seen_capacity)
+        self.metrics = Metrics()
+        self.on_event = on_event
+
+        workers = workers or os.cpu_count() or 1
+        if pool == "process":
+            self.pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(secret, tolerance))
+        elif pool == "thread":
+            _init_worker(secret, tolerance)
+            self.pool = ThreadPoolExecutor(workers)
+        else:
+            _init_worker(secret, tolerance)
+            self.pool = None
+
+        self._inbox = None
+        self._batcher = None
+        self._server = None
+        self._connections = {}
+
+    async def start(self, host="127.0.0.1", port=8000):
+        self._inbox = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._batch_loop())
+        self._server = await asyncio.start_server(self._handle_connection, host, port, backlog=1024)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        # Closing the sockets makes idle keep-alive handlers see EOF and return
+        for writer in list(self._connections.values()):
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+        self._batcher.cancel()
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.queue.close()
+
+    # -------------------------------------------------------------------------
+    # batching: verify in the pool, dedupe + commit on the loop
+    # -------------------------------------------------------------------------
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        inflight = set()
+        while True:
+            batch = [await self._inbox.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._inbox.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Several batches can be in the pool at once; commit order doesn't matter
+            task = asyncio.create_task(self._process(batch))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+
+    async def _process(self, batch):
+        try:
+            replies, accepted = await self._commit(batch)
+        except Exception:
+            # Broken pool, full disk...: nothing was acknowledged, so let OpenAI redeliver
+            self.metrics.failed += len(batch)
+            replies, accepted = [(future, 500) for _, _, future in batch], []
+        for future, status in replies:
+            if not future.done():
+                future.set_result(status)
+        if self.on_event is not None:
+            for record in accepted:
+                self.on_event(record)
+
+    async def _commit(self, batch):
+        loop = asyncio.get_running_loop()
+        items = [(payload, headers) for payload, headers, _ in batch]
+        if self.pool is None:
+            results = _verify_batch(items)
+        else:
+            results = await loop.run_in_executor(self.pool, _verify_batch, items)
+
+        accepted = []
+        replies = []
+        batch_ids = set()
+        for (payload, headers, future), (ok, value, seconds) in zip(batch, results):
+            self.metrics.verify_latency.append(seconds)
+            webhook_id = headers.get("webhook-id")
+            if not ok:
+                self.metrics.rejected += 1
+                replies.append((future, 400))
+            elif webhook_id in self.seen or webhook_id in batch_ids:
+                self.metrics.duplicates += 1
+                replies.append((future, 200))
+            else:
+                batch_ids.add(webhook_id)
+                accepted.append({"webhook_id": webhook_id, "received_at": time.time(), "event": value})
+                replies.append((future, 200))
+
+        # fsync can take milliseconds: keep it off the loop. A redelivery that lands in
+        # another batch in flight may be written twice; consumers key on webhook_id
+        await loop.run_in_executor(None, self.queue.append_many, accepted)
+        for record in accepted:
+            self.seen.add(record["webhook_id"])
+        self.metrics.accept(len(accepted))
+        self.metrics.batches += 1
+        return replies, accepted
+
+    # -------------------------------------------------------------------------
+    # minimal HTTP/1.1 with keep-alive
+    # -------------------------------------------------------------------------
+
+    async def _handle_connection(self, reader, writer):
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if not 0 <= length <= self.max_body:
+                    await self._reply(writer, 413, b"")
+                    break   # the body is still on the wire: drop the connection
+                body = await reader.readexactly(length) if length else b""
+
+                if method == "GET" and path.startswith("/metrics"):
+                    await self._reply(writer, 200, json.dumps(self.metrics.snapshot()).encode())
+                elif method == "POST":
+                    future = asyncio.get_running_loop().create_future()
+                    await self._inbox.put((body, headers, future))
+                    status = await future
+                    await self._reply(writer, status, b"")
+                else:
+                    await self._reply(writer, 404, b"")
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.pop(asyncio.current_task(), None)
+            writer.close()
+
+    @staticmethod
+    async def _reply(writer, status, body):
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Content Too Large",
+                  500: "Internal Server Error"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\ncontent-type: application/json\r\n"
+            f"content-length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+
+# =============================================================================
+# LOAD GENERATOR
+# =============================================================================
+
+
+def _make_event(i):
+    kind = "batch.completed" if i % 2 else "response.completed"
+    payload = {
+        "id": f"evt_{i}",
+        "object": "event",
+        "type": kind,
+        "created_at": int(time.time()),
+        "data": {"id": f"{'batch' if i % 2 else 'resp'}_{i}"},
+    }
+    return json.dumps(payload).encode()
+
+
+async def _load(port, secret, n_events, connections, dup_rate=0.05, bad_rate=0.01):
+    import random
+
+    latencies = []
+    counter = iter(range(n_events))
+
+    async def worker():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for i in counter:
+            payload = _make_event(i)
+            webhook_id = f"wh_{i if random.random() > dup_rate else max(0, i - 1)}"
+            headers = sign(secret, webhook_id, int(time.time()), payload)
+            if random.random() < bad_rate:
+                headers["webhook-signature"] = "v1,AAAA"
+            head = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+            start = time.perf_counter()
+            writer.write(
+                f"POST /webhooks HTTP/1.1\r\nhost: localhost\r\ncontent-length: {len(payload)}\r\n{head}\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+            await reader.readuntil(b"\r\n\r\n")
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    return time.perf_counter() - start, latencies
+
+
+async def _bench(args):
+    import tempfile
+
+    secret = "whsec_" + base64.b64encode(os.urandom(32)).decode()
+    with tempfile.TemporaryDirectory() as tmp:
+        for pool in ("inline", "process"):
+            server = WebhookServer(secret, os.path.join(tmp, f"{pool}.jsonl"), pool=pool, workers=args.workers)
+            port = await server.start(port=0)
+            elapsed, latencies = await _load(port, secret, args.events, args.connections)
+            snapshot = server.metrics.snapshot()
+            await server.stop()
+
+            latencies.sort()
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000
+            print(
+                f"{pool:<8} {args.events / elapsed:8.0f} req/s   request p99 {p99:6.2f} ms   "
+                f"verify p50 {snapshot['verify_us_p50']:5.1f} us   accepted {snapshot['accepted']}   "
+                f"dupes {snapshot['duplicates']}   rejected {snapshot['rejected']}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched, deduplicating webhook receiver")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--queue", default="webhook_events.jsonl")
+    serve.add_argument("--workers", type=int, default=None)
+    serve.add_argument("--pool", choices=("process", "thread", "inline"), default="process")
+
+    bench = sub.add_parser("bench")
+    bench.add_argument("--events", type=int, default=50_000)
+    bench.add_argument("--connections", type=int, default=64)
+    bench.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == "bench":
+        asyncio.run(_bench(args))
+    else:
+        async def main():
+            server = WebhookServer(os.environ["OPENAI_WEBHOOK_SECRET"], args.queue,
+                                   workers=args.workers, pool=args.pool)
+            port = await server.start(args.host, args.port)
+            print(f"listening on http://{args.host}:{port}  (metrics at /metrics)")
+            await asyncio.Event().wait()
+
+        asyncio.run(main())
@@ -0,0 +1,662 @@
+"""
+Generator pipelines for streamed model output
+=============================================
+
+basic.py shows the two building blocks: `yield from` to chain generators
+(`full_menu`) and `send()` to push values into a running generator
+(`chai_stall`). This file builds a small pipeline library on them for the
+post-processing we do on streamed responses (filtering, redaction, JSON
+extraction, fan-out to sinks) without buffering whole responses.
+
+Stages:
+- map / filter / flat_map   stateless, one item at a time
+- coroutine                 stateful, `chai_stall` style: the stage receives
+                            items through send() and yields lists of outputs;
+                            the END sentinel flushes whatever is buffered
+- offload                   a stateless stage run in a thread or process pool
+- buffer                    a bounded queue; everything before it runs in its
+                            own thread (sync) or task (async), and a full queue
+                            slows the producer down (backpressure)
+
+Fusion: consecutive inline stages run in one loop, so an item passes through
+the whole chain without a generator frame, queue or executor hop per stage.
+
+Every stage keeps counters (items in/out, busy time, items/s). Each run works
+on fresh copies of the stages, so pipelines derived with `then()` and runs
+interleaved on one pipeline don't share coroutine state; `stats()` and
+`report()` show the most recent run.
+
+The same Pipeline runs over a sync iterable (`run`) or an async one (`arun`),
+e.g. a `client.responses.create(..., stream=True)` stream:
+
+    pipe = (Pipeline()
+            .then(text_deltas())
+            .then(split_lines())
+            .then(redact())
+            .then(tee(print)))
+    for line in pipe.run(stream):
+        ...
+    print(pipe.report())
+
+Run `python pipeline.py` for the 10k events/sec benchmark.
+"""
+
+import asyncio
+import copy
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+END = object()   # sent to coroutine stages when the input is exhausted
+
+
+# =============================================================================
+# STAGES
+# =============================================================================
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.busy = 0.0
+        self.first = None
+        self.last = None
+
+    def record(self, n_in, n_out, seconds, now):
+        self.items_in += n_in
+        self.items_out += n_out
+        self.busy += seconds
+        if self.first is None:
+            self.first = now - seconds
+        self.last = now
+
+    def snapshot(self):
+        wall = (self.last - self.first) if self.first is not None else 0.0
+        return {
+            "stage": self.name,
+            "in": self.items_in,
+            "out": self.items_out,
+            "busy_s": self.busy,
+            "us_per_item": self.busy / self.items_in * 1e6 if self.items_in else 0.0,
+            "items_per_s": self.items_in / wall if wall > 0 else 0.0,
+        }
+
+
+class Stage:
+    """One step of a pipeline; use the helper functions below to build them."""
+
+    def __init__(self, kind, fn, name=None, offload=None, workers=None, batch=64):
+        self.kind = kind   # "map" | "filter" | "flat" | "coroutine"
+        self.fn = fn
+        self.name = name or getattr(fn, "__name__", kind)
+        self.offload = offload   # None | "thread" | "process"
+        self.workers = workers
+        self.batch = batch
+        self.stats = StageStats(self.name)
+        self._coroutine = None
+
+    def fresh(self):
+        """A copy with its own counters and coroutine, for one run."""
+        stage = copy.copy(self)
+        stage.stats = StageStats(self.name)
+        stage._coroutine = None
+        return stage
+
+    def start(self):
+        if self.kind == "coroutine":
+            self._coroutine = self.fn()
+            next(self._coroutine)   # prime it, like next(stall) in basic.py
+        return self
+
+    def apply(self, items):
+        start = time.perf_counter()
+        if self.kind == "map":
+            fn = self.fn
+            out = [fn(x) for x in items]
+        elif self.kind == "filter":
+            fn = self.fn
+            out = [x for x in items if fn(x)]
+        elif self.kind == "flat":
+            fn = self.fn
+            out = [y for x in items for y in fn(x)]
+        else:
+            out = []
+            send = self._coroutine.send
+            for x in items:
+                emitted = send(x)
+                if emitted:
+                    out.extend(emitted)
+        now = time.perf_counter()
+        self.stats.record(len(items), len(out), now - start, now)
+        return out
+
+    def finish(self):
+        """Flush a coroutine stage: send END, collect what it returns."""
+        if self.kind != "coroutine" or self._coroutine is None:
+            return []
+        start = time.perf_counter()
+        try:
+            emitted = self._coroutine.send(END)
+        except StopIteration as stop:
+            emitted = stop.value
+        else:
+            self._coroutine.close()
+        self._coroutine = None
+        emitted = list(emitted or ())
+        now = time.perf_counter()
+        self.stats.record(0, len(emitted), now - start, now)
+        return emitted
+
+
+def map_stage(fn, name=None, **kwargs):
+    return Stage("map", fn, name, **kwargs)
+
+
+def filter_stage(fn, name=None, **kwargs):
+    return Stage("filter", fn, name, **kwargs)
+
+
+def flat_map(fn, name=None, **kwargs):
+    return Stage("flat", fn, name, **kwargs)
+
+
+def coroutine(fn, name=None):
+    """fn() -> generator that receives items via send() and yields lists of outputs."""
+    return Stage("coroutine", fn, name)
+
+
+class _Buffer:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+
+
+def _apply_batch(kind, fn, items):
+    # Module level so process pools can pickle it
+    if kind == "map":
+        return [fn(x) for x in items]
+    if kind == "filter":
+        return [x for x in items if fn(x)]
+    return [y for x in items for y in fn(x)]
+
+
+# =============================================================================
+# PIPELINE
+# =============================================================================
+
+
+class _Fused:
+    """Consecutive inline stages run in a single loop."""
+
+    def __init__(self, stages):
+        self.stages = stages
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def push(self, items, first=0):
+        for stage in self.stages[first:]:
+            items = stage.apply(items)
+            if not items:
+                break
+        return items
+
+    def finish(self):
+        out = []
+        for i, stage in enumerate(self.stages):
+            tail = stage.finish()
+            if tail:
+                out.extend(self.push(tail, i + 1))
+        return out
+
+
+class Pipeline:
+    def __init__(self, stages=None, fuse=True):
+        self.stages = list(stages or [])
+        self.fuse = fuse
+        self._last_run = None   # the stage copies of the most recent run, for stats()
+
+    def then(self, stage):
+        return Pipeline(self.stages + [stage], self.fuse)
+
+    def buffer(self, maxsize=1024):
+        """Bounded queue: the stages before it run concurrently with the ones after."""
+        return Pipeline(self.stages + [_Buffer(maxsize)], self.fuse)
+
+    __or__ = then
+
+    def _segments(self):
+        stages = [s.fresh() if isinstance(s, Stage) else s for s in self.stages]
+        self._last_run = stages
+        segments = []
+        inline = []
+        for stage in stages:
+            if isinstance(stage, Stage) and stage.offload is None:
+                inline.append(stage)
+                if not self.fuse:
+                    segments.append(_Fused(inline))
+                    inline = []
+                continue
+            if inline:
+                segments.append(_Fused(inline))
+                inline = []
+            segments.append(stage)
+        if inline:
+            segments.append(_Fused(inline))
+        return segments
+
+    # -------------------------------------------------------------------------
+    # sync
+    # -------------------------------------------------------------------------
+
+    def run(self, source):
+        """Generator over the pipeline's output for a sync iterable."""
+        it = iter(source)
+        for segment in self._segments():
+            if isinstance(segment, _Fused):
+                it = _run_fused(segment, it)
+            elif isinstance(segment, _Buffer):
+                it = _run_buffer(segment.maxsize, it)
+            else:
+                it = _run_offload(segment, it)
+        return it
+
+    # -------------------------------------------------------------------------
+    # async
+    # -------------------------------------------------------------------------
+
+    def arun(self, source):
+        """Async generator over the pipeline's output for an async (or sync) iterable."""
+        it = source if hasattr(source, "__aiter__") else _aiter(source)
+        for segment in self._segments():
+            if isinstance(segment, _Fused):
+                it = _arun_fused(segment, it)
+            elif isinstance(segment, _Buffer):
+                it = _arun_buffer(segment.maxsize, it)
+            else:
+                it = _arun_offload(segment, it)
+        return it
+
+    def stats(self):
+        stages = self._last_run if self._last_run is not None else self.stages
+        return [s.stats.snapshot() for s in stages if isinstance(s, Stage)]
+
+    def report(self):
+        lines = [f"{'stage':<16} {'in':>9} {'out':>9} {'us/item':>9} {'items/s':>11}"]
+        for s in self.stats():
+            lines.append(f"{s['stage']:<16} {s['in']:9d} {s['out']:9d} {s['us_per_item']:9.2f} {s['items_per_s']:11,.0f}")
+        return "\n".join(lines)
+
+
+def _run_fused(fused, it):
+    fused.start()
+    push = fused.push
+    for item in it:
+        yield from push([item])
+    yield from fused.finish()
+
+
+def _run_buffer(maxsize, it):
+    q = queue.Queue(maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Never block for good: the consumer may have stopped reading
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in it:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as exc:
+            put(_Failure(exc))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+
+
+class _Failure:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _executor(stage):
+    workers = stage.workers or os.cpu_count() or 1
+    if stage.offload == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def _batches(it, size):
+    batch = []
+    for item in it:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _run_offload(stage, it):
+    """Ordered, windowed fan-out of batches to a pool; at most workers * 2 batches in flight."""
+    with _executor(stage) as pool:
+        window = (stage.workers or os.cpu_count() or 1) * 2
+        pending = deque()
+        for batch in _batches(it, stage.batch):
+            pending.append((len(batch), time.perf_counter(), pool.submit(_apply_batch, stage.kind, stage.fn, batch)))
+            while len(pending) >= window or (pending and pending[0][2].done()):
+                yield from _collect(stage, pending.popleft())
+        while pending:
+            yield from _collect(stage, pending.popleft())
+
+
+def _collect(stage, entry):
+    n_in, submitted, future = entry
+    out = future.result()
+    # For offloaded stages "busy" is submit-to-result latency, queueing included
+    now = time.perf_counter()
+    stage.stats.record(n_in, len(out), now - submitted, now)
+    return out
+
+
+async def _aiter(iterable):
+    for item in iterable:
+        yield item
+
+
+async def _arun_fused(fused, it):
+    fused.start()
+    push = fused.push
+    async for item in it:
+        for out in push([item]):
+            yield out
+    for out in fused.finish():
+        yield out
+
+
+async def _arun_buffer(maxsize, it):
+    q = asyncio.Queue(maxsize)
+    done = object()
+
+    async def produce():
+        try:
+            async for item in it:
+                await q.put(item)
+            await q.put(done)
+        except Exception as exc:
+            await q.put(_Failure(exc))
+
+    task = asyncio.ensure_future(produce())
+    try:
+        while True:
+            item = await q.get()
+            if item is done:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item
+    finally:
+        task.cancel()
+
+
+async def _arun_offload(stage, it):
+    loop = asyncio.get_running_loop()
+    pool = _executor(stage)
+    try:
+        window = (stage.workers or os.cpu_count() or 1) * 2
+        pending = deque()
+        batch = []
+
+        async def drain(block):
+            while pending and (block or pending[0][2].done()):
+                n_in, submitted, future = pending.popleft()
+                out = await future
+                now = time.perf_counter()
+                stage.stats.record(n_in, len(out), now - submitted, now)
+                for item in out:
+                    yield item
+
+        def submit(items):
+            pending.append((len(items), time.perf_counter(),
+                            loop.run_in_executor(pool, _apply_batch, stage.kind, stage.fn, items)))
+
+        async for item in it:
+            batch.append(item)
+            if len(batch) >= stage.batch:
+                submit(batch)
+                batch = []
+                async for out in drain(len(pending) >= window):
+                    yield out
+        if batch:
+            submit(batch)
+        async for out in drain(True):
+            yield out
+    finally:
+        # shutdown(wait=True) would block the event loop on in-flight batches
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# =============================================================================
+# STAGES FOR STREAMED RESPONSES
+# =============================================================================
+
+
+def _field(event, name, default=None):
+    if isinstance(event, dict):
+        return event.get(name, default)
+    return getattr(event, name, default)
+
+
+def text_deltas(event_type="response.output_text.delta"):
+    """Stream events -> text deltas (works with SDK event objects and plain dicts)."""
+
+    def delta(event):
+        return [_field(event, "delta")] if _field(event, "type") == event_type else ()
+
+    return flat_map(delta, "text_deltas")
+
+
+def split_lines():
+    """Re-chunk arbitrary deltas into complete lines."""
+
+    def lines():
+        buffer = ""
+        emitted = None
+        while True:
+            chunk = yield emitted
+            if chunk is END:
+                return [buffer] if buffer else []
+            buffer += chunk
+            if "\n" in chunk:
+                *emitted, buffer = buffer.split("\n")
+            else:
+                emitted = None
+
+    return coroutine(lines, "split_lines")
+
+
+REDACT_PATTERNS = [
+    re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"),          # e-mail addresses
+    re.compile(r"\bsk-[A-Za-z0-9_-]{16,}\b"),          # API keys
+    re.compile(r"\b(?:\d[ -]?){13,16}\b"),             # card numbers
+]
+
+
+def redact(patterns=None, replacement="[redacted]"):
+    """Mask matches in whole lines (use after split_lines so matches aren't cut in half)."""
+    patterns = patterns or REDACT_PATTERNS
+
+    def mask(line):
+        for pattern in patterns:
+            line = pattern.sub(replacement, line)
+        return line
+
+    return map_stage(mask, "redact")
+
+
+def extract_json():
+    """Pull every top-level {...} object out of a text stream, across chunk boundaries."""
+
+    def objects():
+        buffer = []
+        depth = 0
+        in_string = escaped = False
+        emitted = None
+        while True:
+            chunk = yield emitted
+            if chunk is END:
+                return []
+            emitted = []
+            for ch in chunk:
+                if depth == 0:
+                    if ch == "{":
+                        depth = 1
+                        buffer = [ch]
+                    continue
+                buffer.append(ch)
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif ch == "\\":
+                        escaped = True
+                    elif ch == '"':
+                        in_string = False
+                elif ch == '"':
+                    in_string = True
+                elif ch == "{":
+                    depth += 1
+                elif ch == "}":
+                    depth -= 1
+                    if depth == 0:
+                        try:
+                            emitted.append(json.loads("".join(buffer)))
+                        except ValueError:
+                            pass
+
+    return coroutine(objects, "extract_json")
+
+
+def tee(*sinks):
+    """Fan each item out to sinks (callables or objects with write()) and pass it on."""
+    writers = [getattr(sink, "write", sink) for sink in sinks]
+
+    def fan_out(item):
+        for write in writers:
+            write(item)
+        return item
+
+    return map_stage(fan_out, "tee")
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+# A fake response stream: output_text.delta events of a few characters, with
+# e-mail addresses and JSON objects split across deltas, like real model output.
+
+
+def _fake_events(n_events, rate=None):
+    text = ('Contact jane.doe@example.com about order {"id": 42, "items": ["chai", "macha"]}.\n'
+            "The masala chai is ready, ginger chai is next in line.\n")
+    pieces = [text[i:i + 5] for i in range(0, len(text), 5)]
+    start = time.perf_counter()
+    for i in range(n_events):
+        if rate and i % 100 == 0:
+            lag = start + i / rate - time.perf_counter()
+            if lag > 0:
+                time.sleep(lag)
+        yield {"type": "response.output_text.delta", "delta": pieces[i % len(pieces)]}
+    yield {"type": "response.completed"}
+
+
+async def _afake_events(n_events, rate=None):
+    start = time.perf_counter()
+    for i, event in enumerate(_fake_events(n_events)):
+        if rate and i % 100 == 0:
+            lag = start + i / rate - time.perf_counter()
+            if lag > 0:
+                await asyncio.sleep(lag)
+        yield event
+
+
+def _word_count(line):
+    # Stands in for a CPU-heavy step (classification, embedding prep, ...)
+    return sum(len(w) for w in line.split()) + sum(1 for _ in re.finditer(r"chai", line))
+
+
+def _bench(n_events=200_000):
+    def build(fuse=True):
+        lines = []
+        return (Pipeline(fuse=fuse)
+                .then(text_deltas())
+                .then(split_lines())
+                .then(redact())
+                .then(tee(lines.append, lambda line: None))), lines
+
+    print(f"sync, unpaced, {n_events:,} events")
+    for fuse in (False, True):
+        pipe, lines = build(fuse)
+        start = time.perf_counter()
+        for _ in pipe.run(_fake_events(n_events)):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"  {'fused' if fuse else 'one generator per stage':<24} {n_events / elapsed:12,.0f} events/s")
+    assert "[redacted]" in lines[0] and "@" not in lines[0]
+
+    print("\nsync, paced at 10k events/s, with buffer + thread offload")
+    n = 20_000
+    pipe = (build()[0]
+            .buffer(4096)
+            .then(map_stage(_word_count, "word_count", offload="thread", workers=2, batch=32)))
+    start = time.perf_counter()
+    out = sum(1 for _ in pipe.run(_fake_events(n, rate=10_000)))
+    elapsed = time.perf_counter() - start
+    print(f"  {n / elapsed:,.0f} events/s sustained ({out} lines) in {elapsed:.2f}s")
+    print(pipe.report())
+
+    print("\nasync, paced at 10k events/s, JSON extraction")
+    pipe = Pipeline().then(text_deltas()).then(extract_json())
+
+    async def consume():
+        found = 0
+        async for obj in pipe.arun(_afake_events(n, rate=10_000)):
+            assert obj["id"] == 42
+            found += 1
+        return found
+
+    start = time.perf_counter()
+    found = asyncio.run(consume())
+    elapsed = time.perf_counter() - start
+    print(f"  {n / elapsed:,.0f} events/s sustained, {found} JSON objects in {elapsed:.2f}s")
+    print(pipe.report())
+
+
+if __name__ == "__main__":
+    _bench()
@@ -0,0 +1,595 @@
+"""
+Low-overhead decorator toolkit
+==============================
+
+`log_activity` in basic.py prints before and after every call. Copied onto hot
+client functions, that costs throughput all day, even when nobody reads the
+output. These decorators only cost something while they're in use:
+
+- @timed       per-function latency histogram (log-linear buckets, p50/p99).
+               With TIMED=0 in the environment the decorator returns the
+               function itself: zero overhead
+- @profiled    samples 1 in `every` calls into cProfile (mode="cpu") or
+               tracemalloc (mode="memory"). Switched on and off at runtime with
+               SIGUSR1 or the PROFILE=1 environment variable. When off, the
+               wrapper's code object is swapped for a plain pass-through, so
+               there is no flag to check on every call
+- @memoize     LRU with optional TTL for sync and async functions. Concurrent
+               callers for the same missing key wait for the first one instead
+               of all computing it (stampede protection)
+
+Usage:
+    @timed
+    def render(prompt): ...
+
+    @profiled(every=100, out_dir="profiles")
+    def parse(body): ...
+
+    @memoize(maxsize=4096, ttl=300)
+    async def embed(text): ...
+
+    enable_signal()            # kill -USR1 <pid> toggles profiling, dumps on stop
+    print(timed_report())
+
+Run `python toolkit.py` for the per-call overhead benchmark.
+"""
+
+import asyncio
+import cProfile
+import functools
+import inspect
+import os
+import signal
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+# =============================================================================
+# @timed
+# =============================================================================
+
+
+class Histogram:
+    """
+    Log-linear latency histogram in nanoseconds: 8 sub-buckets per power of
+    two, so any percentile is within ~12% of the true value. Calls under
+    FAST_NS only bump a bucket; exact total and max are kept for slower calls.
+    Increments from threads racing on the same bucket can very rarely be
+    lost, which is fine for a latency profile.
+    """
+
+    SUB = 8
+    FAST_NS = 2048
+    _FAST_BUCKETS = ((FAST_NS).bit_length() - 3) * SUB   # bucket index of FAST_NS
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * (64 * self.SUB)
+        self.total_ns = 0   # calls >= FAST_NS only
+        self.max_ns = 0
+
+    def record(self, ns):
+        if ns < self.SUB:
+            index = ns
+        else:
+            shift = ns.bit_length() - 4   # keep the top 4 bits: 8..15
+            index = (shift + 1) * self.SUB + (ns >> shift) - self.SUB
+        self.counts[index] += 1
+        if ns >= self.FAST_NS:
+            self.total_ns += ns
+            if ns > self.max_ns:
+                self.max_ns = ns
+
+    @classmethod
+    def _bucket_value(cls, index):
+        if index < cls.SUB:
+            return index
+        shift = index // cls.SUB - 1
+        return ((index % cls.SUB) + cls.SUB) << shift
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def percentile(self, pct):
+        total = self.count
+        if not total:
+            return 0
+        target = total * pct / 100
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= target:
+                return self._bucket_value(index)
+        return self.max_ns
+
+    def summary(self):
+        count = self.count
+        fast = self.counts[:self._FAST_BUCKETS]
+        total_ns = self.total_ns + sum(self._bucket_value(i) * n for i, n in enumerate(fast))
+        max_ns = self.max_ns or max((self._bucket_value(i) for i, n in enumerate(fast) if n), default=0)
+        return {
+            "name": self.name,
+            "count": count,
+            "mean_us": total_ns / count / 1000 if count else 0.0,
+            "p50_us": self.percentile(50) / 1000,
+            "p90_us": self.percentile(90) / 1000,
+            "p99_us": self.percentile(99) / 1000,
+            "max_us": max_ns / 1000,
+        }
+
+
+TIMINGS = {}   # qualified name -> Histogram
+
+
+def timed(func=None, *, name=None, enabled=None):
+    """Record every call's latency. Disabled (TIMED=0) it returns func unchanged."""
+    if func is None:
+        return functools.partial(timed, name=name, enabled=enabled)
+    if enabled is None:
+        enabled = os.environ.get("TIMED", "1") != "0"
+    if not enabled:
+        return func
+
+    histogram = TIMINGS.setdefault(name or func.__qualname__, Histogram(name or func.__qualname__))
+    record = histogram.record
+    counts = histogram.counts
+    sub = Histogram.SUB
+    fast_ns = Histogram.FAST_NS
+    clock = time.perf_counter_ns
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                record(clock() - start)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            ns = clock() - start
+            if ns < fast_ns:
+                # Histogram.record inlined, saving a method call on fast calls
+                shift = ns.bit_length() - 4
+                counts[ns if ns < sub else (shift + 1) * sub + (ns >> shift) - sub] += 1
+            else:
+                record(ns)
+
+    return wrapper
+
+
+def timed_report():
+    lines = [f"{'function':<28} {'calls':>9} {'mean':>9} {'p50':>9} {'p99':>9} {'max':>9}  (us)"]
+    for histogram in TIMINGS.values():
+        s = histogram.summary()
+        lines.append(f"{s['name']:<28} {s['count']:9d} {s['mean_us']:9.2f} {s['p50_us']:9.2f} "
+                     f"{s['p99_us']:9.2f} {s['max_us']:9.2f}")
+    return "\n".join(lines)
+
+
+# =============================================================================
+# @profiled
+# =============================================================================
+
+
+# Memory-mode sessions that are profiling; tracemalloc is stopped with the last
+# one, unless it was already tracing before any session started it
+_memory_sessions = set()
+_started_tracemalloc = False
+
+
+def _trace_memory(session):
+    global _started_tracemalloc
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+    _memory_sessions.add(session)
+
+
+def _untrace_memory(session):
+    global _started_tracemalloc
+    _memory_sessions.discard(session)
+    if not _memory_sessions and _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+
+class _ProfileSession:
+    """Sampling state of one @profiled function."""
+
+    def __init__(self, func, mode, every, out_dir):
+        self.func = func
+        self.name = func.__qualname__
+        self.mode = mode
+        self.every = every
+        self.out_dir = out_dir
+        self.calls = 0
+        self.sampled = 0
+        self.profile = None
+        self.peak_bytes = 0
+        self.wrappers = []   # (wrapper, off code, on code)
+
+    def call(self, func, args, kwargs):
+        self.calls += 1
+        if self.calls % self.every:
+            return func(*args, **kwargs)
+        self.sampled += 1
+        if self.mode == "memory":
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1] - before)
+        try:
+            self.profile.enable()
+        except ValueError:   # another profiler is already active on this thread
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.profile.disable()
+
+    async def acall(self, func, args, kwargs):
+        # Only the synchronous part up to each await is attributed by cProfile,
+        # so async functions are sampled for memory and wall time only
+        self.calls += 1
+        if self.calls % self.every:
+            return await func(*args, **kwargs)
+        self.sampled += 1
+        if self.mode == "memory":
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1] - before)
+        return await func(*args, **kwargs)
+
+    def start(self):
+        self.calls = self.sampled = self.peak_bytes = 0
+        if self.mode == "memory":
+            _trace_memory(self)
+        self.profile = cProfile.Profile()
+        for wrapper, _, on in self.wrappers:
+            wrapper.__code__ = on
+
+    def stop(self):
+        for wrapper, off, _ in self.wrappers:
+            wrapper.__code__ = off
+        path = self.dump()
+        self.profile = None
+        if self.mode == "memory":
+            _untrace_memory(self)   # after dump(), which takes a snapshot
+        return path
+
+    def dump(self):
+        if not self.sampled or self.out_dir is None:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        if self.mode == "memory":
+            path = os.path.join(self.out_dir, f"{self.name}-{stamp}.mem.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"{self.name}: {self.sampled} of {self.calls} calls sampled, "
+                        f"peak {self.peak_bytes} bytes per call\n")
+                if tracemalloc.is_tracing():
+                    for stat in tracemalloc.take_snapshot().statistics("lineno")[:25]:
+                        f.write(f"{stat}\n")
+        else:
+            path = os.path.join(self.out_dir, f"{self.name}-{stamp}.prof")
+            self.profile.dump_stats(path)   # open with `python -m pstats <file>` or snakeviz
+        return path
+
+
+_SESSIONS = []
+_active = False
+
+
+def profiled(func=None, *, mode="cpu", every=100, out_dir="profiles"):
+    """Sample 1 in `every` calls while profiling is on; a plain pass-through while it's off."""
+    if func is None:
+        return functools.partial(profiled, mode=mode, every=every, out_dir=out_dir)
+    session = _ProfileSession(func, mode, every, out_dir)
+
+    # The two variants of each wrapper close over the same names, so one
+    # function object can switch code objects in place; callers keep
+    # whatever reference they already hold
+    if inspect.iscoroutinefunction(func):
+        async def off(*args, **kwargs):
+            session  # noqa: B018  (same free variables as `on`)
+            return await func(*args, **kwargs)
+
+        async def on(*args, **kwargs):
+            return await session.acall(func, args, kwargs)
+    else:
+        def off(*args, **kwargs):
+            session  # noqa: B018  (same free variables as `on`)
+            return func(*args, **kwargs)
+
+        def on(*args, **kwargs):
+            return session.call(func, args, kwargs)
+
+    wrapper = functools.wraps(func)(off)
+    session.wrappers.append((wrapper, off.__code__, on.__code__))
+    wrapper.profile_session = session
+    _SESSIONS.append(session)
+    if _active:
+        session.start()
+    return wrapper
+
+
+def start_profiling():
+    global _active
+    _active = True
+    for session in _SESSIONS:
+        session.start()
+
+
+def stop_profiling():
+    """Switch every @profiled function back to pass-through; returns the dump files."""
+    global _active
+    _active = False
+    return [path for path in (session.stop() for session in _SESSIONS) if path]
+
+
+def toggle_profiling(*_):
+    if _active:
+        stop_profiling()
+    else:
+        start_profiling()
+
+
+def enable_signal(signum=getattr(signal, "SIGUSR1", None)):
+    """`kill -USR1 <pid>` starts profiling; the next one stops it and writes the dumps."""
+    if signum is not None:
+        signal.signal(signum, toggle_profiling)
+
+
+if os.environ.get("PROFILE") == "1":
+    _active = True
+
+
+# =============================================================================
+# @memoize
+# =============================================================================
+
+
+class _Pending:
+    """A computation other callers for the same key can wait on."""
+
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _AsyncPending:
+    """A computation running as its own task, and how many callers wait on it."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class MemoCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()   # key -> (expires_at or None, value)
+        self.pending = {}           # key -> _Pending / _AsyncPending
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.waits = 0
+
+    def lookup(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            del self.data[key]
+            return False, None
+        self.data.move_to_end(key)
+        return True, entry[1]
+
+    def store(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        self.data[key] = (expires, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "waits": self.waits,
+                "size": len(self.data), "maxsize": self.maxsize, "ttl": self.ttl}
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+def _make_key(args, kwargs):
+    return (args, tuple(sorted(kwargs.items()))) if kwargs else args
+
+
+def memoize(func=None, *, maxsize=1024, ttl=None):
+    """LRU (+ optional TTL) cache; one computation per key however many callers race for it."""
+    if func is None:
+        return functools.partial(memoize, maxsize=maxsize, ttl=ttl)
+    cache = MemoCache(maxsize, ttl)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            key = _make_key(args, kwargs)
+            found, value = cache.lookup(key)
+            if found:
+                cache.hits += 1
+                return value
+            # Every caller, the first included, waits on the computation's own
+            # task: cancelling one of them must not cancel it for the rest
+            pending = cache.pending.get(key)
+            if pending is not None:
+                cache.waits += 1
+            else:
+                cache.misses += 1
+                pending = cache.pending[key] = _AsyncPending(asyncio.ensure_future(compute(key, args, kwargs)))
+            pending.waiters += 1
+            try:
+                return await asyncio.shield(pending.task)
+            except asyncio.CancelledError:
+                if pending.waiters == 1 and not pending.task.done():
+                    # The last waiter left: nobody needs the value any more
+                    pending.task.cancel()
+                    if cache.pending.get(key) is pending:
+                        del cache.pending[key]
+                raise
+            finally:
+                pending.waiters -= 1
+
+        async def compute(key, args, kwargs):
+            try:
+                value = await func(*args, **kwargs)
+            finally:
+                pending = cache.pending.get(key)
+                if pending is not None and pending.task is asyncio.current_task():
+                    del cache.pending[key]
+            cache.store(key, value)
+            return value
+
+        wrapper = async_wrapper
+    else:
+        data = cache.data
+        move_to_end = data.move_to_end
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+            # Lock-free fast path for a fresh hit; LRU order is best effort here
+            entry = data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                try:
+                    move_to_end(key)
+                except KeyError:
+                    pass
+                cache.hits += 1
+                return entry[1]
+            with cache.lock:
+                found, value = cache.lookup(key)
+                if found:
+                    cache.hits += 1
+                    return value
+                pending = cache.pending.get(key)
+                owner = pending is None
+                if owner:
+                    cache.misses += 1
+                    pending = cache.pending[key] = _Pending()
+                else:
+                    cache.waits += 1
+            if not owner:
+                pending.event.wait()
+                if pending.error is not None:
+                    raise pending.error
+                return pending.value
+            try:
+                pending.value = func(*args, **kwargs)
+            except BaseException as exc:
+                pending.error = exc
+                raise
+            else:
+                with cache.lock:
+                    cache.store(key, pending.value)
+                return pending.value
+            finally:
+                with cache.lock:
+                    cache.pending.pop(key, None)
+                pending.event.set()
+
+    wrapper.cache_info = cache.info
+    wrapper.cache_clear = cache.clear
+    return wrapper
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+
+def _overhead_ns(fn, loops=1_000_000, repeat=5):
+    import timeit
+
+    return min(timeit.repeat(lambda: fn(1), number=loops, repeat=repeat)) / loops * 1e9
+
+
+def _bench():
+    import contextlib
+    import io
+
+    def work(x):
+        return x + 1
+
+    def log_activity(func):
+        # the pattern from basic.py
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            print(f"Calling : {func.__name__}")
+            result = func(*args, **kwargs)
+            print("Finshed")
+            return result
+        return wrapper
+
+    variants = [
+        ("bare function", work),
+        ("@timed, TIMED=0", timed(work, enabled=False)),
+        ("@timed", timed(work, name="bench.work")),
+        ("@profiled, off", profiled(work, every=1000, out_dir=None)),
+        ("@memoize, hit", memoize(work)),
+    ]
+    on = profiled(work, every=1000, out_dir=None)
+    on.profile_session.start()
+    variants.append(("@profiled, on (1/1000)", on))
+
+    base = _overhead_ns(work)
+    print(f"{'variant':<26} {'ns/call':>9} {'overhead':>9}")
+    for label, fn in variants:
+        ns = _overhead_ns(fn)
+        print(f"{label:<26} {ns:9.1f} {ns - base:+9.1f}")
+    on.profile_session.stop()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ns = _overhead_ns(log_activity(work), loops=100_000)
+    print(f"{'log_activity (basic.py)':<26} {ns:9.1f} {ns - base:+9.1f}   (stdout to StringIO)")
+
+    # Stampede: 32 threads ask for the same slow key at once, one computation
+    calls = []
+
+    @memoize(ttl=60)
+    def slow(key):
+        calls.append(key)
+        time.sleep(0.05)
+        return key * 2
+
+    threads = [threading.Thread(target=slow, args=(21,)) for _ in range(32)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"\nstampede: 32 concurrent callers -> {len(calls)} computation, {slow.cache_info()}")
+    print()
+    print(timed_report())
+
+
+if __name__ == "__main__":
+    _bench()
@@ -0,0 +1,589 @@
+"""
+Compact record store for LLM results
+====================================
+
+class.py shows a `Chai` instance growing attributes in its `__dict__`, and
+the memory demos in python/01_basics show what every Python object carries
+around. Keep a million prompt/response/usage records as dicts (or pydantic
+models) and that overhead is most of the memory.
+
+Here a record is a row number, not an object:
+
+    columns   array("I"/"f"/"d"/...) per numeric field   -> 2-8 bytes per value
+    category  model / tag / status interned once, rows store a small code
+    text      UTF-8 bytes in one shared arena, rows store (offset, length)
+    rows      `store[i]` returns a view with __slots__, made on demand
+
+- filters return a mask (one 0/1 byte per row) and aggregations take one;
+  both run over whole columns with C-level iteration (map / compress / sum,
+  big-int AND to combine masks), or numpy when it's installed
+- `save()` writes the columns and the arena into one file, aligned, and
+  `load()` maps the file and casts memoryviews over it: nothing is copied or
+  parsed, so loading a GB-sized store takes milliseconds and pages come in
+  as they are read. The first append to a loaded store copies it into arrays
+
+Usage:
+    store = RecordStore()
+    store.append(model="gpt-4o-mini", tag="eval", prompt=p, response=r,
+                 input_tokens=812, output_tokens=64, latency_ms=420.0, cost=0.0003)
+    mask = store.where(model="gpt-4o-mini", status="completed")
+    print(store.sum("output_tokens", mask), store.group_sum("model", "cost", mask))
+    store.save("results.rec")
+    store = RecordStore.load("results.rec")
+
+Run `python record_store.py --records 1000000` for the memory / scan benchmark.
+"""
+
+import json
+import mmap
+import operator
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, compress, repeat
+
+# field kinds: array typecode for numbers, "cat" for interned strings, "text" for the arena
+RESULT_SCHEMA = [
+    ("model", "cat"),
+    ("tag", "cat"),
+    ("status", "cat"),
+    ("prompt", "text"),
+    ("response", "text"),
+    ("input_tokens", "I"),
+    ("output_tokens", "I"),
+    ("cached_tokens", "I"),
+    ("latency_ms", "f"),
+    ("cost", "d"),
+    ("created_at", "d"),
+]
+
+_CAT_CODE = "H"     # up to 65535 distinct values per category field
+_TEXT_OFFSET = "Q"
+_TEXT_LENGTH = "I"
+_MAGIC = b"RECSTORE1"
+_DEFAULTS = {"cat": "", "text": ""}
+
+_OPS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+        ">": operator.gt, ">=": operator.ge}
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+# =============================================================================
+# ROW VIEWS
+# =============================================================================
+
+
+class RowView:
+    """Read-only view of one row; holds nothing but the store and the index."""
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name, _ in self._store.schema}
+
+    def __repr__(self):
+        return f"Row({self._index}, {self.to_dict()!r})"
+
+
+def _row_class(schema):
+    """A RowView subclass with one property per field (still no __dict__)."""
+    namespace = {"__slots__": ()}
+    for name, kind in schema:
+        if kind == "cat":
+            def get(self, name=name):
+                store = self._store
+                return store._values[name][store._columns[name][self._index]]
+        elif kind == "text":
+            def get(self, name=name):
+                return self._store._text(name, self._index)
+        else:
+            def get(self, name=name):
+                return self._store._columns[name][self._index]
+        namespace[name] = property(get)
+    return type("Row", (RowView,), namespace)
+
+
+# =============================================================================
+# STORE
+# =============================================================================
+
+
+class RecordStore:
+    def __init__(self, schema=None):
+        self.schema = list(schema or RESULT_SCHEMA)
+        self.kinds = dict(self.schema)
+        self._columns = {}
+        self._values = {}    # category field -> [value, ...]
+        self._codes = {}     # category field -> {value: code}
+        for name, kind in self.schema:
+            if kind == "cat":
+                self._columns[name] = array(_CAT_CODE)
+                self._values[name] = []
+                self._codes[name] = {}
+            elif kind == "text":
+                self._columns[name + ".offset"] = array(_TEXT_OFFSET)
+                self._columns[name + ".length"] = array(_TEXT_LENGTH)
+            else:
+                self._columns[name] = array(kind)
+        self._arena = bytearray()
+        self._rows = 0
+        self._mapped = None   # mmap backing a loaded store
+        self.Row = _row_class(self.schema)
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._rows
+        if not 0 <= index < self._rows:
+            raise IndexError(index)
+        return self.Row(self, index)
+
+    def __iter__(self):
+        Row = self.Row
+        return (Row(self, i) for i in range(self._rows))
+
+    # -------------------------------------------------------------------------
+    # writes
+    # -------------------------------------------------------------------------
+
+    def intern(self, field, value):
+        codes = self._codes[field]
+        code = codes.get(value)
+        if code is None:
+            code = len(self._values[field])
+            if code > 0xFFFF:
+                raise ValueError(f"too many distinct values for category field {field!r}")
+            codes[value] = code
+            self._values[field].append(value)
+        return code
+
+    def append(self, **fields):
+        self._writable()
+        columns = self._columns
+        arena_end = len(self._arena)
+        try:
+            for name, kind in self.schema:
+                value = fields.get(name, _DEFAULTS.get(kind, 0))
+                if kind == "cat":
+                    columns[name].append(self.intern(name, value))
+                elif kind == "text":
+                    data = value.encode("utf-8")
+                    columns[name + ".offset"].append(len(self._arena))
+                    columns[name + ".length"].append(len(data))
+                    self._arena += data
+                else:
+                    columns[name].append(value)
+        except BaseException:
+            self._rollback(arena_end)
+            raise
+        self._rows += 1
+        return self._rows - 1
+
+    def extend(self, records, batch_size=4096):
+        """Append many records; full batches are added column by column with C-level map()."""
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                self._extend_batch(batch)
+                batch = []
+        if batch:
+            self._extend_batch(batch)
+
+    def _extend_batch(self, batch):
+        if any(len(record) != len(self.schema) for record in batch):
+            for record in batch:   # missing fields: take the per-record path with defaults
+                self.append(**record)
+            return
+        self._writable()
+        columns = self._columns
+        arena_end = len(self._arena)
+        try:
+            for name, kind in self.schema:
+                values = map(operator.itemgetter(name), batch)
+                if kind == "cat":
+                    codes = self._codes[name]
+                    intern = self.intern
+                    columns[name].extend([codes[v] if v in codes else intern(name, v) for v in values])
+                elif kind == "text":
+                    encoded = [v.encode("utf-8") for v in values]
+                    lengths = array(_TEXT_LENGTH, map(len, encoded))
+                    start = len(self._arena)
+                    columns[name + ".offset"].extend(accumulate(lengths[:-1], initial=start))
+                    columns[name + ".length"].extend(lengths)
+                    self._arena += b"".join(encoded)
+                else:
+                    columns[name].extend(values)
+        except BaseException:
+            self._rollback(arena_end)
+            raise
+        self._rows += len(batch)
+
+    def _rollback(self, arena_end):
+        # A field that failed to convert leaves the earlier columns one row
+        # (or batch) ahead: cut every column back so the rows stay aligned
+        for column in self._columns.values():
+            del column[self._rows:]
+        del self._arena[arena_end:]
+
+    def _writable(self):
+        if self._mapped is None:
+            return
+        # Copy-on-append: pull the mapped columns into arrays once
+        for name, view in list(self._columns.items()):
+            self._columns[name] = array(view.format, view)
+        self._arena = bytearray(self._arena)
+        try:
+            self._mapped.close()
+        except BufferError:
+            pass   # a caller still holds a column() view; the GC closes the map with it
+        self._mapped = None
+
+    # -------------------------------------------------------------------------
+    # reads
+    # -------------------------------------------------------------------------
+
+    def _text(self, field, index):
+        offset = self._columns[field + ".offset"][index]
+        length = self._columns[field + ".length"][index]
+        return bytes(self._arena[offset:offset + length]).decode("utf-8")
+
+    def column(self, field):
+        """Raw column (array or memoryview); category fields give codes."""
+        return self._columns[field]
+
+    def codes_of(self, field, value):
+        return self._codes[field].get(value)
+
+    # Selections are masks: bytes with one 0/1 byte per row. They are built and
+    # combined in C (bytes(map(...)), big-int AND) and consumed with compress()
+
+    def where(self, mask=None, **equals):
+        """Mask of rows whose category/number fields equal the given values (ANDed)."""
+        for field, value in equals.items():
+            if self.kinds[field] == "cat":
+                value = self._codes[field].get(value)
+                if value is None:
+                    return bytes(self._rows)
+            mask = self._select(field, operator.eq, value, mask)
+        return mask if mask is not None else b"\1" * self._rows
+
+    def filter(self, field, op, value, mask=None):
+        """Mask of rows where `field op value`, e.g. filter("latency_ms", ">", 1000)."""
+        if self.kinds[field] in ("cat", "text"):
+            raise TypeError(f"filter() compares numbers; use where() or contains() for {field!r}")
+        return self._select(field, _OPS[op], value, mask)
+
+    def _select(self, field, compare, value, mask):
+        column = self._columns[field]
+        np = _numpy()
+        if np is not None:
+            selected = compare(np.frombuffer(column, dtype=_np_dtype(column)), value).tobytes()
+        else:
+            # operator.eq, not value.__eq__, which returns NotImplemented for int vs float
+            selected = bytes(map(compare, column, repeat(value)))
+        return selected if mask is None else mask_and(mask, selected)
+
+    def contains(self, field, needle, mask=None):
+        """Mask of rows whose text field contains `needle`, found by scanning the arena once."""
+        offsets = self._columns[field + ".offset"]
+        lengths = self._columns[field + ".length"]
+        pattern = needle.encode("utf-8")
+        if not pattern:
+            # Every row contains "", and find() would never move past it
+            return b"\1" * self._rows if mask is None else mask
+        arena = self._arena
+        found = bytearray(self._rows)
+        position = arena.find(pattern)
+        while position != -1:
+            row = bisect_right(offsets, position) - 1
+            if row >= 0 and position + len(pattern) <= offsets[row] + lengths[row]:
+                found[row] = 1
+                position = arena.find(pattern, offsets[row] + lengths[row])
+            else:
+                position = arena.find(pattern, position + 1)
+        return bytes(found) if mask is None else mask_and(mask, found)
+
+    def rows(self, mask):
+        """Row views of a mask."""
+        Row = self.Row
+        return [Row(self, i) for i in compress(range(self._rows), mask)]
+
+    def count(self, mask=None):
+        return self._rows if mask is None else mask.count(1)
+
+    def sum(self, field, mask=None):
+        column = self._columns[field]
+        return sum(column) if mask is None else sum(compress(column, mask))
+
+    def mean(self, field, mask=None):
+        n = self.count(mask)
+        return self.sum(field, mask) / n if n else 0.0
+
+    def group_sum(self, by, field, mask=None):
+        """{category value: sum of field} - e.g. group_sum("model", "cost")."""
+        codes = self._columns[by]
+        column = self._columns[field]
+        values = self._values[by]
+        np = _numpy()
+        if np is not None:
+            codes_np = np.frombuffer(codes, dtype=_np_dtype(codes))
+            weights = np.frombuffer(column, dtype=_np_dtype(column))
+            if mask is not None:
+                keep = np.frombuffer(mask, dtype=bool)
+                codes_np, weights = codes_np[keep], weights[keep]
+            totals = np.bincount(codes_np, weights=weights, minlength=len(values))
+            return {values[i]: float(total) for i, total in enumerate(totals) if total}
+        if mask is not None:
+            codes, column = compress(codes, mask), compress(column, mask)
+        totals = [0] * len(values)
+        for code, value in zip(codes, column):
+            totals[code] += value
+        return {values[i]: total for i, total in enumerate(totals) if total}
+
+    def count_by(self, by, mask=None):
+        codes = self._columns[by]
+        values = self._values[by]
+        counts = [0] * len(values)
+        for code in (codes if mask is None else compress(codes, mask)):
+            counts[code] += 1
+        return {values[i]: n for i, n in enumerate(counts) if n}
+
+    # -------------------------------------------------------------------------
+    # save / load
+    # -------------------------------------------------------------------------
+
+    def save(self, path):
+        """One file: magic, header length, JSON header, then 8-byte aligned blocks."""
+        blocks = []
+        layout = {}
+        for name, column in self._columns.items():
+            blocks.append(column)
+            layout[name] = (column.format if isinstance(column, memoryview) else column.typecode)
+        blocks.append(self._arena)
+
+        header = {"rows": self._rows, "schema": self.schema, "categories": self._values, "blocks": []}
+        # Offsets depend on the header size, so size the header first with placeholders
+        sizes = [memoryview(b).nbytes for b in blocks]
+        for _ in range(2):
+            start = _align(len(_MAGIC) + 8 + len(json.dumps(header).encode("utf-8")))
+            entries = []
+            position = start
+            for (name, typecode), size in zip(list(layout.items()) + [("arena", "B")], sizes):
+                entries.append([name, typecode, position, size])
+                position = _align(position + size)
+            header["blocks"] = entries
+        encoded = json.dumps(header).encode("utf-8")
+
+        with open(path, "wb") as f:
+            f.write(_MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+            for block, (_, _, position, size) in zip(blocks, header["blocks"]):
+                f.write(b"\0" * (position - f.tell()))
+                f.write(memoryview(block).cast("B"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(_MAGIC)] != _MAGIC:
+            mapped.close()
+            raise ValueError(f"{path} is not a record store file")
+        (header_len,) = struct.unpack_from("<Q", mapped, len(_MAGIC))
+        start = len(_MAGIC) + 8
+        header = json.loads(mapped[start:start + header_len])
+
+        store = cls([tuple(field) for field in header["schema"]])
+        view = memoryview(mapped)
+        for name, typecode, position, size in header["blocks"]:
+            block = view[position:position + size]
+            if name == "arena":
+                store._arena = block
+            else:
+                store._columns[name] = block.cast(typecode)
+        for field, values in header["categories"].items():
+            store._values[field] = values
+            store._codes[field] = {value: code for code, value in enumerate(values)}
+        store._rows = header["rows"]
+        store._mapped = mapped
+        return store
+
+    def close(self):
+        if self._mapped is not None:
+            self._columns = {name: None for name in self._columns}
+            self._arena = b""
+            try:
+                self._mapped.close()
+            except BufferError:
+                pass   # row views or selections still hold memoryviews; the GC closes it later
+            self._mapped = None
+
+    def nbytes(self):
+        """Bytes held by columns, arena and category tables (excluding Python object headers)."""
+        total = sum(memoryview(c).nbytes for c in self._columns.values()) + len(self._arena)
+        return total + sum(sys.getsizeof(v) for values in self._values.values() for v in values)
+
+
+def mask_and(a, b):
+    """Row-wise AND of two 0/1 masks, as one big-integer operation."""
+    return (int.from_bytes(a, "little") & int.from_bytes(b, "little")).to_bytes(len(a), "little")
+
+
+def mask_or(a, b):
+    return (int.from_bytes(a, "little") | int.from_bytes(b, "little")).to_bytes(len(a), "little")
+
+
+def _align(n, to=8):
+    return (n + to - 1) // to * to
+
+
+def _np_dtype(column):
+    return column.format if isinstance(column, memoryview) else column.typecode
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+
+def _fake_records(n):
+    models = ["gpt-4o-mini", "gpt-4o", "gpt-4.1-mini", "o4-mini"]
+    tags = ["eval", "chat", "rag", "batch", "support"]
+    base = time.time()
+    for i in range(n):
+        yield {
+            "model": models[i % 4],
+            "tag": tags[i % 5],
+            "status": "completed" if i % 50 else "failed",
+            "prompt": f"Question {i}: which chai goes best with rain? Answer in one line.",
+            "response": f"Answer {i}: masala chai - the ginger and cardamom cut through a grey afternoon"
+                        + (" refund" if i % 1000 == 0 else "."),
+            "input_tokens": 40 + i % 300,
+            "output_tokens": 20 + i % 90,
+            "cached_tokens": (i % 4) * 16,
+            "latency_ms": 200.0 + (i % 700),
+            "cost": (40 + i % 300) * 1.5e-7 + (20 + i % 90) * 6e-7,
+            "created_at": base + i,
+        }
+
+
+def _measure(build):
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    obj = build()
+    elapsed = time.perf_counter() - start
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, current, elapsed
+
+
+def _timeit(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def _bench(n):
+    import os
+    import tempfile
+
+    print(f"{n:,} records")
+    print(f"{'representation':<22} {'bytes/record':>12} {'build s':>8} {'scan ms':>9} {'group ms':>9}")
+
+    def report(label, size, build_s, scan_s, group_s):
+        print(f"{label:<22} {size / n:12.0f} {build_s:8.2f} {scan_s * 1000:9.1f} {group_s * 1000:9.1f}")
+
+    # lists of dicts: what result-handling code keeps today
+    dicts, size, build_s = _measure(lambda: list(_fake_records(n)))
+    total, scan_s = _timeit(lambda: sum(r["output_tokens"] for r in dicts if r["model"] == "gpt-4o-mini"))
+    _, group_s = _timeit(lambda: _dict_group_sum(dicts))
+    report("list of dicts", size, build_s, scan_s, group_s)
+    dicts = None   # free them before the next measurement
+
+    try:
+        import pydantic
+    except ImportError:
+        print(f"{'list of pydantic':<22} {'skipped: pydantic not installed':>40}")
+    else:
+        class Result(pydantic.BaseModel):
+            model: str
+            tag: str
+            status: str
+            prompt: str
+            response: str
+            input_tokens: int
+            output_tokens: int
+            cached_tokens: int
+            latency_ms: float
+            cost: float
+            created_at: float
+
+        models, size, build_s = _measure(lambda: [Result(**r) for r in _fake_records(n)])
+        _, scan_s = _timeit(lambda: sum(r.output_tokens for r in models if r.model == "gpt-4o-mini"))
+        _, group_s = _timeit(lambda: _dict_group_sum(r.__dict__ for r in models))
+        report("list of pydantic", size, build_s, scan_s, group_s)
+        models = None
+
+    def build_store():
+        store = RecordStore()
+        store.extend(_fake_records(n))
+        return store
+
+    store, size, build_s = _measure(build_store)
+    store_total, scan_s = _timeit(lambda: store.sum("output_tokens", store.where(model="gpt-4o-mini")))
+    _, group_s = _timeit(lambda: store.group_sum("model", "cost"))
+    assert store_total == total
+    report("RecordStore", size, build_s, scan_s, group_s)
+    print(f"  engine: {'numpy' if _numpy() else 'pure Python (map/compress)'}")
+
+    hits, search_s = _timeit(lambda: store.contains("response", "refund"))
+    print(f"  contains('refund') over the arena: {store.count(hits)} rows in {search_s * 1000:.1f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "results.rec")
+        start = time.perf_counter()
+        store.save(path)
+        save_s = time.perf_counter() - start
+        loaded, load_size, load_s = _measure(lambda: RecordStore.load(path))
+        assert loaded[123].to_dict() == store[123].to_dict()
+        _, scan_s = _timeit(lambda: loaded.sum("output_tokens", loaded.where(model="gpt-4o-mini")))
+        print(f"  save {os.path.getsize(path) / 2**20:.0f} MB in {save_s * 1000:.0f} ms, "
+              f"load in {load_s * 1000:.1f} ms ({load_size / 1024:.0f} KB of Python heap), "
+              f"scan after load {scan_s * 1000:.1f} ms")
+        loaded.close()
+
+
+def _dict_group_sum(records):
+    totals = {}
+    for r in records:
+        totals[r["model"]] = totals.get(r["model"], 0) + r["cost"]
+    return totals
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Record store memory / scan benchmark")
+    parser.add_argument("--records", type=int, default=200_000)
+    _bench(parser.parse_args().records)
@@ -1,4 +1,6 @@
-# acounts dictionary 
+from ledger import InsufficientFunds, Ledger, LedgerError, UnknownAccount
+
+# acounts dictionary (opening balances; the ledger holds the live ones)
 acounts = {
     "1011526982" : 5000,
     "1011726982" : 9000,
@@ -8,24 +10,37 @@ acounts = {
     
 }
 
+# In memory; pass a directory, e.g. Ledger("atm_ledger"), to keep balances across runs
+ledger = Ledger()
+ledger.execute([("o", number, balance) for number, balance in acounts.items()])
+
 
 def addBalance(account_number,amount):
-    acounts[account_number]+=amount
+    try:
+        ledger.deposit(account_number, amount)
+    except UnknownAccount:
+        print("Sorry ! No such account ")
+        return
+    except LedgerError:
+        print("Sorry ! Deposit amount must be positive ")
+        return
+
     print(f"${amount} is depositd on yout account xxxxxxx{account_number[-4]}")
     showBalance(account_number)
     
 
 def removeBalance(account_number,amount):
-    if amount>acounts[account_number] :
+    try:
+        ledger.withdraw(account_number, amount)
+    except InsufficientFunds:
         print("Sorry ! Unsufficient amount ")
         return
 
-    acounts[account_number]-=amount
     print(f"${amount} is withdrawn from yout account xxxxxxx{account_number[-2]}")
     showBalance(account_number)
 
 def showBalance(account_number):
-    print(f"Your current balance is : ${acounts[account_number]}")
+    print(f"Your current balance is : ${ledger.balance(account_number)}")
 
 def atm():
     account_number = input("Enter your 10 digit accout number plz : ")
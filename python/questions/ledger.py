@@ -0,0 +1,519 @@
+"""
+Ledger engine behind the ATM simulation
+=======================================
+
+ATM_Simulation.py keeps balances in a module-level dict and mutates them with
+no locking, no persistence and one transaction at a time. This is the same
+model grown into something that can take real load:
+
+- striped locks: an account maps to one of `stripes` locks, a transfer takes
+  its two stripes in index order (no deadlocks), and unrelated accounts never
+  wait for each other
+- batches: `execute()` applies a list of transactions under one acquisition
+  of the stripes they touch, logs them in one go and waits once
+- write-ahead log with group commit: records are appended to a pending list
+  while the stripe locks are held (so per-account order is the log order); a
+  committer thread writes everything pending and fsyncs once for the whole
+  group. A call returns only after its records are durable
+- snapshot + replay: `snapshot()` takes a consistent cut (all stripes held),
+  rotates the log at that point and writes the balances atomically; restart
+  loads the newest snapshot and replays only the log written after it. A torn
+  record at the end of the log (crash mid-write) is dropped
+
+Amounts are integers (e.g. cents).
+
+Usage:
+    ledger = Ledger("ledger_data")
+    ledger.open_account("1011526982", 5000)
+    ledger.transfer("1011526982", "1011726982", 250)
+    ledger.snapshot()
+    ledger.close()
+
+    python ledger.py --threads 8 --seconds 5             # load generator, threads
+    python ledger.py --processes 4 --batch 32            # worker processes over pipes
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+
+class LedgerError(Exception):
+    pass
+
+
+class UnknownAccount(LedgerError):
+    pass
+
+
+class InsufficientFunds(LedgerError):
+    pass
+
+
+# Transactions are tuples; the same tuples are the log records
+#   ("o", account, amount)            open account with an initial balance
+#   ("d", account, amount)            deposit
+#   ("w", account, amount)            withdraw
+#   ("t", source, target, amount)     transfer
+
+
+def _accounts(txn):
+    return txn[1:3] if txn[0] == "t" else txn[1:2]
+
+
+_ARITY = {"o": 3, "d": 3, "w": 3, "t": 4}
+
+
+def _malformed(txn):
+    """A LedgerError if txn isn't a well-formed transaction, else None."""
+    if not isinstance(txn, (tuple, list)) or not txn or _ARITY.get(txn[0]) != len(txn):
+        return LedgerError(f"malformed transaction {txn!r}")
+    if not all(isinstance(account, str) for account in _accounts(txn)):
+        return LedgerError(f"account numbers must be strings: {txn!r}")
+    amount = txn[-1]
+    if not isinstance(amount, int) or isinstance(amount, bool):
+        return LedgerError(f"amount must be an integer: {txn!r}")
+    return None
+
+
+class Ledger:
+    def __init__(self, directory=None, stripes=64, fsync=True):
+        self.directory = directory
+        self.fsync = fsync
+        self.balances = {}
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._log_lock = threading.Lock()
+        self._has_pending = threading.Condition(self._log_lock)
+        self._durable = threading.Condition()
+        self._pending = []        # (seq, txn) or (None, marker)
+        self._seq = 0
+        self._durable_seq = 0
+        self._closing = False
+        self._committer = None
+        self._segment = None
+        self.stats = {"transactions": 0, "rejected": 0, "commits": 0, "records_written": 0}
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.recovered = self._recover()
+            self._committer = threading.Thread(target=self._commit_loop, name="ledger-committer", daemon=True)
+            self._committer.start()
+
+    # -------------------------------------------------------------------------
+    # transactions
+    # -------------------------------------------------------------------------
+
+    def _stripe(self, account):
+        return hash(account) % len(self._stripes)
+
+    def _apply(self, txn):
+        balances = self.balances
+        kind = txn[0]
+        if kind == "t":
+            _, source, target, amount = txn
+            if source not in balances or target not in balances:
+                raise UnknownAccount(source if source not in balances else target)
+            if amount <= 0 or balances[source] < amount:
+                raise InsufficientFunds(source)
+            balances[source] -= amount
+            balances[target] += amount
+        elif kind == "d":
+            if txn[1] not in balances:
+                raise UnknownAccount(txn[1])
+            if txn[2] <= 0:
+                raise LedgerError("deposit must be positive")
+            balances[txn[1]] += txn[2]
+        elif kind == "w":
+            if txn[1] not in balances:
+                raise UnknownAccount(txn[1])
+            if txn[2] <= 0 or balances[txn[1]] < txn[2]:
+                raise InsufficientFunds(txn[1])
+            balances[txn[1]] -= txn[2]
+        elif kind == "o":
+            if txn[1] in balances:
+                raise LedgerError(f"account {txn[1]} already exists")
+            balances[txn[1]] = txn[2]
+        else:
+            raise LedgerError(f"unknown transaction {kind!r}")
+
+    def execute(self, txns):
+        """
+        Apply a batch. Returns one entry per transaction: None when applied, the
+        LedgerError when rejected. Returns once the applied ones are durable.
+        """
+        # Checked up front, so a bad tuple can't fail halfway through the batch
+        malformed = [_malformed(txn) for txn in txns]
+        stripes = sorted({self._stripe(a) for txn, bad in zip(txns, malformed) if bad is None
+                          for a in _accounts(txn)})
+        locks = self._stripes
+        for i in stripes:
+            locks[i].acquire()
+        results = []
+        applied = []
+        last = 0
+        try:
+            try:
+                for txn, bad in zip(txns, malformed):
+                    if bad is not None:
+                        results.append(bad)
+                        continue
+                    try:
+                        self._apply(txn)
+                    except LedgerError as exc:
+                        results.append(exc)
+                        continue
+                    results.append(None)
+                    applied.append(txn)
+            finally:
+                # Whatever reached the balances is logged, even if something unexpected raised
+                if applied and self.directory is not None:
+                    last = self._log(applied)
+        finally:
+            for i in reversed(stripes):
+                locks[i].release()
+        with self._log_lock:
+            self.stats["transactions"] += len(applied)
+            self.stats["rejected"] += len(txns) - len(applied)
+        if last:
+            self._wait_durable(last)
+        return results
+
+    def _one(self, txn):
+        error = self.execute([txn])[0]
+        if error is not None:
+            raise error
+
+    def open_account(self, account, initial=0):
+        self._one(("o", account, initial))
+
+    def deposit(self, account, amount):
+        self._one(("d", account, amount))
+
+    def withdraw(self, account, amount):
+        self._one(("w", account, amount))
+
+    def transfer(self, source, target, amount):
+        self._one(("t", source, target, amount))
+
+    def balance(self, account):
+        try:
+            return self.balances[account]
+        except KeyError:
+            raise UnknownAccount(account) from None
+
+    def total(self):
+        """Sum of all balances under a consistent cut."""
+        with self._all_stripes():
+            return sum(self.balances.values())
+
+    # -------------------------------------------------------------------------
+    # write-ahead log
+    # -------------------------------------------------------------------------
+
+    def _log(self, txns):
+        with self._log_lock:
+            for txn in txns:
+                self._seq += 1
+                self._pending.append((self._seq, txn))
+            self._has_pending.notify()
+            return self._seq
+
+    def _wait_durable(self, seq):
+        with self._durable:
+            while self._durable_seq < seq:
+                if self._committer is None or not self._committer.is_alive():
+                    raise LedgerError("log committer is not running")
+                self._durable.wait(0.5)
+
+    def _segment_path(self, first_seq):
+        return os.path.join(self.directory, f"wal-{first_seq:020d}.log")
+
+    def _commit_loop(self):
+        while True:
+            with self._log_lock:
+                while not self._pending and not self._closing:
+                    self._has_pending.wait()
+                if not self._pending:
+                    return
+                group, self._pending = self._pending, []
+
+            lines = []
+            last = 0
+            for seq, item in group:
+                if seq is None:   # rotate marker from snapshot()
+                    self._write(lines)
+                    lines = []
+                    self._open_segment(item[0])
+                    item[1].set()
+                    continue
+                lines.append(json.dumps([seq, *item], separators=(",", ":")))
+                last = seq
+            self._write(lines)
+            self.stats["commits"] += 1
+            self.stats["records_written"] += len(group)
+            if last:
+                with self._durable:
+                    self._durable_seq = last
+                    self._durable.notify_all()
+
+    def _write(self, lines):
+        if not lines:
+            return
+        self._segment.write("\n".join(lines) + "\n")
+        self._segment.flush()
+        if self.fsync:
+            os.fsync(self._segment.fileno())
+
+    def _open_segment(self, first_seq):
+        if self._segment is not None:
+            self._segment.close()
+        self._segment = open(self._segment_path(first_seq), "a", encoding="utf-8")
+
+    # -------------------------------------------------------------------------
+    # snapshot and recovery
+    # -------------------------------------------------------------------------
+
+    def _all_stripes(self):
+        ledger = self
+
+        class _Held:
+            def __enter__(self):
+                for lock in ledger._stripes:
+                    lock.acquire()
+
+            def __exit__(self, *exc):
+                for lock in reversed(ledger._stripes):
+                    lock.release()
+
+        return _Held()
+
+    def snapshot(self):
+        """Write a snapshot and drop the log before it. Returns the snapshot's seq."""
+        if self.directory is None:
+            raise LedgerError("in-memory ledger has nothing to snapshot to")
+        rotated = threading.Event()
+        with self._all_stripes():
+            with self._log_lock:
+                seq = self._seq
+                balances = dict(self.balances)
+                # Everything after `seq` goes to a new segment
+                self._pending.append((None, (seq + 1, rotated)))
+                self._has_pending.notify()
+
+        path = os.path.join(self.directory, f"snapshot-{seq:020d}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"seq": seq, "balances": balances}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+        rotated.wait()
+        keep_segment = os.path.basename(self._segment_path(seq + 1))
+        for name in os.listdir(self.directory):
+            if (name.startswith("wal-") and name < keep_segment) or \
+                    (name.startswith("snapshot-") and name.endswith(".json") and name != os.path.basename(path)):
+                os.remove(os.path.join(self.directory, name))
+        return seq
+
+    def _recover(self):
+        names = sorted(os.listdir(self.directory))
+        snapshots = [n for n in names if n.startswith("snapshot-") and n.endswith(".json")]
+        segments = [n for n in names if n.startswith("wal-") and n.endswith(".log")]
+        start = time.perf_counter()
+
+        seq = 0
+        if snapshots:
+            with open(os.path.join(self.directory, snapshots[-1]), encoding="utf-8") as f:
+                data = json.load(f)
+            seq = data["seq"]
+            self.balances = data["balances"]
+
+        replayed = 0
+        for name in segments:
+            path = os.path.join(self.directory, name)
+            with open(path, "rb") as f:
+                offset = 0
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break   # torn write: never acknowledged, and the next append would join it
+                    try:
+                        record = json.loads(raw)
+                    except ValueError:
+                        break   # torn write at the end of the log
+                    offset += len(raw)
+                    if record[0] > seq:
+                        self._apply(tuple(record[1:]))
+                        seq = record[0]
+                        replayed += 1
+            if offset != os.path.getsize(path):
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+
+        self._seq = self._durable_seq = seq
+        if segments:
+            self._segment = open(os.path.join(self.directory, segments[-1]), "a", encoding="utf-8")
+        else:
+            self._open_segment(seq + 1)
+        return {"seq": seq, "snapshot": snapshots[-1] if snapshots else None,
+                "replayed": replayed, "seconds": time.perf_counter() - start}
+
+    def close(self):
+        if self._committer is not None:
+            with self._log_lock:
+                self._closing = True
+                self._has_pending.notify()
+            self._committer.join()
+            self._committer = None
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+
+# =============================================================================
+# LOAD GENERATOR
+# =============================================================================
+
+
+def _random_txn(rng, accounts):
+    roll = rng.random()
+    account = rng.choice(accounts)
+    if roll < 0.8:
+        return ("t", account, rng.choice(accounts), rng.randint(1, 500))
+    if roll < 0.9:
+        return ("d", account, rng.randint(1, 500))
+    return ("w", account, rng.randint(1, 500))
+
+
+def _net_flow(txns, results):
+    """Money that entered (+) or left (-) the ledger through applied deposits/withdrawals."""
+    flow = 0
+    for txn, error in zip(txns, results):
+        if error is None and txn[0] == "d":
+            flow += txn[2]
+        elif error is None and txn[0] == "w":
+            flow -= txn[2]
+    return flow
+
+
+def _drive(execute, accounts, seconds, batch, seed):
+    rng = random.Random(seed)
+    latencies = []
+    flow = 0
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        txns = [_random_txn(rng, accounts) for _ in range(batch)]
+        start = time.perf_counter()
+        results = execute(txns)
+        latencies.append(time.perf_counter() - start)
+        flow += _net_flow(txns, results)
+        done += len(txns)
+    return done, flow, latencies
+
+
+def _process_worker(conn, accounts, seconds, batch, seed):
+    def execute(txns):
+        conn.send(txns)
+        return conn.recv()
+
+    conn.send(("done", *_drive(execute, accounts, seconds, batch, seed)))
+    conn.close()
+
+
+def _serve(ledger, conn, results):
+    while True:
+        message = conn.recv()
+        if message and message[0] == "done":
+            results.append(message[1:])
+            return
+        conn.send([None if r is None else type(r).__name__ for r in ledger.execute(message)])
+
+
+def _bench(args):
+    import multiprocessing
+    import shutil
+    import tempfile
+
+    directory = args.dir or tempfile.mkdtemp(prefix="ledger_")
+    ledger = Ledger(directory, stripes=args.stripes, fsync=not args.no_fsync)
+    accounts = [f"{1011000000 + i:010d}" for i in range(args.accounts)]
+    ledger.execute([("o", a, 10_000) for a in accounts if a not in ledger.balances])
+    initial_total = ledger.total()
+
+    start = time.perf_counter()
+    if args.processes:
+        context = multiprocessing.get_context("spawn")
+        results = []
+        servers = []
+        for p in range(args.processes):
+            parent, child = context.Pipe()
+            context.Process(target=_process_worker,
+                            args=(child, accounts, args.seconds, args.batch, p), daemon=True).start()
+            server = threading.Thread(target=_serve, args=(ledger, parent, results))
+            server.start()
+            servers.append(server)
+        for server in servers:
+            server.join()
+        mode = f"{args.processes} processes"
+    else:
+        results = []
+
+        def run_thread(seed):
+            results.append(_drive(ledger.execute, accounts, args.seconds, args.batch, seed))
+
+        threads = [threading.Thread(target=run_thread, args=(i,)) for i in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        mode = f"{args.threads} threads"
+    elapsed = time.perf_counter() - start
+
+    done = sum(r[0] for r in results)
+    flow = sum(r[1] for r in results)
+    latencies = sorted(lat for r in results for lat in r[2])
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{mode}, batch {args.batch}, {args.accounts} accounts, fsync {'off' if args.no_fsync else 'on'}")
+    print(f"  {done / elapsed:,.0f} transactions/s   batch latency p50 {p50:.2f} ms  p99 {p99:.2f} ms")
+    print(f"  {ledger.stats['commits']:,} group commits for {ledger.stats['records_written']:,} records "
+          f"({ledger.stats['rejected']:,} rejected)")
+
+    # Invariants: money is conserved, no account is negative
+    final_total = ledger.total()
+    assert final_total == initial_total + flow, (final_total, initial_total, flow)
+    assert min(ledger.balances.values()) >= 0
+    print(f"  invariants hold: total {final_total:,} = initial {initial_total:,} + net deposits {flow:,}")
+
+    before = dict(ledger.balances)
+    ledger.close()
+    replay = Ledger(directory, stripes=args.stripes)
+    assert replay.balances == before
+    print(f"  restart from log only: replayed {replay.recovered['replayed']:,} records "
+          f"in {replay.recovered['seconds'] * 1000:.0f} ms")
+    replay.snapshot()
+    replay.close()
+    restored = Ledger(directory, stripes=args.stripes)
+    assert restored.balances == before
+    print(f"  restart from snapshot: replayed {restored.recovered['replayed']:,} records "
+          f"in {restored.recovered['seconds'] * 1000:.0f} ms")
+    restored.close()
+    if not args.dir:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ledger load generator")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=0, help="use worker processes over pipes instead of threads")
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--batch", type=int, default=1, help="transactions per execute() call")
+    parser.add_argument("--stripes", type=int, default=64)
+    parser.add_argument("--no-fsync", action="store_true")
+    parser.add_argument("--dir", default=None, help="keep the ledger here instead of a temp dir")
+    _bench(parser.parse_args())